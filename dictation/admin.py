@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Dictation, DictationAttempt
+from .models import Dictation, DictationAttempt, DictationError
 
 @admin.register(Dictation)
 class DictationAdmin(admin.ModelAdmin):
@@ -12,3 +12,10 @@ class DictationAttemptAdmin(admin.ModelAdmin):
     list_display = ('dictation', 'score', 'created_at')
     list_filter = ('created_at',)
     search_fields = ('user_text', 'feedback')
+
+@admin.register(DictationError)
+class DictationErrorAdmin(admin.ModelAdmin):
+    list_display = ('dictation', 'word', 'correction', 'category', 'created_at')
+    list_filter = ('category', 'created_at')
+    search_fields = ('word', 'correction')
+    raw_id_fields = ('attempt', 'dictation', 'user')
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class DictationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'dictation'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,151 @@
+"""
+Vues asynchrones des points d'entrée qui attendent Gemini.
+
+Servies sous ASGI, elles libèrent le worker pendant l'appel réseau : l'attente
+se fait sur le client httpx asynchrone et seul l'accès à l'ORM passe par
+sync_to_async. Les réponses reprennent celles des vues synchrones.
+"""
+import json
+import logging
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse
+from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from .batch import correct_dictation_batch
+from .governor import RateLimitExceeded
+from .images import ImageUploadError, install_image_upload_handler, load_request_image
+from .models import Dictation
+from .pool import claim_pooled_dictation
+from .services import (
+    acorrect_dictation,
+    aextract_handwriting,
+    astream_correct_dictation,
+    astream_generate_dictation,
+)
+from .streaming import event_stream_response, iterate_in_thread, ndjson_response, wants_event_stream
+from .tasks import enqueue_generation
+from .views import validate_batch_correction
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+def rate_limited_response(error):
+    """Réponse 429 renvoyée quand le régulateur refuse un appel au LLM."""
+    return JsonResponse({'error': str(error)}, status=429, headers={'Retry-After': error.retry_after_header})
+
+def _parse_json_body(request):
+    try:
+        return json.loads(request.body or b'{}')
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+@csrf_exempt
+@require_POST
+async def correct_dictation_async_view(request):
+    """
+    Corrige une dictée soumise de façon pédagogique (alignement intelligent, feedback détaillé).
+    """
+    data = _parse_json_body(request)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Corps de requête JSON invalide'}, status=400)
+
+    dictation_id = data.get('dictation_id')
+    user_text = (data.get('user_text') or '').strip()
+
+    if not dictation_id:
+        return JsonResponse({'error': 'ID de dictée manquant'}, status=400)
+    if not user_text:
+        return JsonResponse({'error': 'Le texte de la dictée est vide'}, status=400)
+
+    try:
+        dictation_id = int(dictation_id)
+    except (ValueError, TypeError):
+        return JsonResponse({'error': f'ID de dictée invalide: {dictation_id}'}, status=400)
+
+    user = await request.auser()
+
+    # Mode streaming : la réponse de Gemini est relayée en Server-Sent Events
+    if wants_event_stream(request):
+        return event_stream_response(astream_correct_dictation(user_text, dictation_id, user.id))
+
+    try:
+        result = await acorrect_dictation(user_text, dictation_id, user.id)
+        return JsonResponse(result)
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
+    except Exception as e:
+        return JsonResponse({'error': f'Erreur lors de la correction: {str(e)}'}, status=500)
+
+@csrf_exempt
+@require_POST
+async def correct_dictation_batch_async_view(request):
+    """
+    Corrige en une requête les copies d'une classe pour une même dictée (NDJSON).
+    """
+    data = _parse_json_body(request)
+    if not isinstance(data, dict):
+        return JsonResponse({'error': 'Corps de requête JSON invalide'}, status=400)
+    dictation_id, user_texts, error = validate_batch_correction(data)
+    if error:
+        return JsonResponse({'error': error}, status=400)
+    if not await Dictation.objects.filter(id=dictation_id).aexists():
+        return JsonResponse({'error': 'Dictée introuvable'}, status=404)
+    return ndjson_response(iterate_in_thread(correct_dictation_batch(dictation_id, user_texts)))
+
+@csrf_exempt
+@require_POST
+async def generate_dictation_async_view(request):
+    """
+    Met en file la génération d'une dictée et retourne immédiatement l'identifiant du job.
+    Le résultat est ensuite consulté via generate_dictation_status_view.
+    """
+    try:
+        data = json.loads(request.body)
+        # Une dictée pré-générée correspondant aux paramètres est servie immédiatement
+        if settings.DICTATION_POOL_ENABLED:
+            pooled = await sync_to_async(claim_pooled_dictation)(data)
+            if pooled is not None:
+                if wants_event_stream(request):
+                    return event_stream_response([('result', pooled)])
+                return JsonResponse({'status': 'done', 'progress': 100, 'result': pooled})
+        # Mode streaming : génération en direct, relayée en Server-Sent Events
+        if wants_event_stream(request):
+            return event_stream_response(astream_generate_dictation(data))
+        job_id = await sync_to_async(enqueue_generation)(data)
+        return JsonResponse({
+            'job_id': job_id,
+            'status': 'pending',
+            'status_url': reverse('generate-dictation-status', args=[job_id])
+        }, status=202)
+    except Exception as e:
+        return JsonResponse({'error': str(e)}, status=500)
+
+@csrf_exempt
+@require_POST
+async def process_image_gemini_async_view(request):
+    """Extrait le texte manuscrit d'une image (multipart ou base64) via Gemini."""
+    handler = install_image_upload_handler(request)
+    data = None if request.content_type == 'multipart/form-data' else _parse_json_body(request)
+    try:
+        # Analyse du multipart et détection du format hors de la boucle d'événements
+        image = await sync_to_async(load_request_image)(request, handler, data if isinstance(data, dict) else None)
+    except ImageUploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status_code)
+    if image is None:
+        return JsonResponse({'error': 'Aucune image fournie'}, status=400)
+
+    with image:
+        image_bytes = image.read_bytes()
+    try:
+        return JsonResponse({'texte_extrait': await aextract_handwriting(image_bytes)})
+    except RateLimitExceeded as e:
+        return rate_limited_response(e)
+    except Exception as e:
+        logger.error(f"Erreur lors de l'analyse de l'image avec Gemini : {str(e)}")
+        return JsonResponse({
+            'error': "Erreur lors de l'analyse de l'image. Veuillez réessayer."
+        }, status=500)
@@ -0,0 +1,200 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from django.conf import settings
+from django.db import transaction
+from . import providers
+from .cache import correction_cache_key, store_correction
+from .models import Dictation, DictationAttempt
+from .prompts import (
+    BATCH_CORRECTION_PROMPT,
+    build_batch_correction_payload,
+    build_correction_payload,
+    estimate_tokens,
+)
+from .services import (
+    build_attempt_fields,
+    clean_text_for_comparison,
+    correct_without_llm,
+    parse_correction_response,
+)
+from .structured import validate_response
+from .stats import record_attempts
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+def pack_copies(cleaned_texts: list, cleaned_dictation_text: str) -> list:
+    """
+    Regroupe les copies à corriger en lots tenant dans un même prompt, sans dépasser
+    BATCH_CORRECTION_PACK_SIZE copies ni BATCH_CORRECTION_PACK_MAX_TOKENS tokens estimés.
+    """
+    overhead = BATCH_CORRECTION_PROMPT.system_tokens + estimate_tokens(cleaned_dictation_text)
+    budget = settings.BATCH_CORRECTION_PACK_MAX_TOKENS - overhead
+    packs, current, used = [], [], 0
+    for text in cleaned_texts:
+        cost = estimate_tokens(text)
+        if current and (len(current) >= settings.BATCH_CORRECTION_PACK_SIZE or used + cost > budget):
+            packs.append(current)
+            current, used = [], 0
+        current.append(text)
+        used += cost
+    if current:
+        packs.append(current)
+    return packs
+
+def parse_batch_correction_response(response_text: str, count: int) -> list:
+    """
+    Extrait les corrections d'une réponse groupée, dans l'ordre des copies.
+
+    Raises:
+        ValueError: Si la réponse ne contient pas exactement une correction valide par
+        copie, numérotées de 1 à count : sans numéros fiables, une correction pourrait
+        être attribuée à la copie d'un autre élève
+    """
+    from .serializers import BatchCorrectionResultSerializer
+    corrections = validate_response(response_text, BatchCorrectionResultSerializer)['corrections']
+    if len(corrections) != count:
+        raise ValueError(f"Réponse groupée inattendue : {count} corrections attendues")
+    by_number = {correction.get('copie'): correction for correction in corrections}
+    if set(by_number) != set(range(1, count + 1)):
+        raise ValueError(f"Réponse groupée inattendue : copies numérotées {sorted(by_number, key=str)}")
+    return [
+        {key: value for key, value in by_number[number].items() if key != 'copie'}
+        for number in range(1, count + 1)
+    ]
+
+def _correct_copy(cleaned_dictation_text: str, cleaned_user_text: str) -> dict:
+    payload = build_correction_payload(cleaned_dictation_text, cleaned_user_text)
+    return providers.generate(payload, parse_correction_response, 'correction')
+
+def _correct_pack(cleaned_dictation_text: str, pack: list):
+    """
+    Corrige un lot de copies en un appel au LLM, avec double, repli et
+    coupe-circuits de la couche fournisseurs ; si la réponse groupée reste
+    inexploitable après réparation, chaque copie du lot est corrigée séparément.
+    Une indisponibilité des fournisseurs (ProviderUnavailable) est propagée :
+    la multiplier par le nombre de copies n'y changerait rien.
+
+    Returns:
+        tuple: (corrections ou exceptions dans l'ordre du lot, nombre d'appels au LLM)
+    """
+    if len(pack) == 1:
+        return [_correct_copy(cleaned_dictation_text, pack[0])], 1
+    try:
+        corrections = providers.generate(
+            build_batch_correction_payload(cleaned_dictation_text, pack),
+            lambda response_text: parse_batch_correction_response(response_text, len(pack)),
+            'batch_correction'
+        )
+    except ValueError as e:
+        logger.warning(f"Réponse groupée inexploitable ({e}), correction copie par copie")
+    else:
+        return corrections, 1
+    outcomes = []
+    for text in pack:
+        try:
+            outcomes.append(_correct_copy(cleaned_dictation_text, text))
+        except Exception as e:
+            outcomes.append(e)
+    return outcomes, 1 + len(pack)
+
+def _save_attempts(dictation, user_texts: list, corrected: list, attempt_ids: list):
+    """
+    Enregistre en un seul INSERT les tentatives des copies corrigées
+    (liste de (index, résultat)) et note leurs identifiants dans attempt_ids.
+    """
+    if not corrected:
+        return
+    attempts = [
+        DictationAttempt(
+            dictation=dictation,
+            user_text=user_texts[index],
+            **build_attempt_fields(dictation, result)
+        )
+        for index, result in corrected
+    ]
+    with transaction.atomic():
+        attempts = DictationAttempt.objects.bulk_create(attempts)
+        record_attempts(attempts)
+    for (index, _), attempt in zip(corrected, attempts):
+        attempt_ids[index] = attempt.id
+
+def correct_dictation_batch(dictation_id: int, user_texts: list):
+    """
+    Corrige les copies d'une classe pour une même dictée.
+
+    Les copies identiques une fois nettoyées ne sont corrigées qu'une fois, les
+    corrections possibles sans LLM (local, cache) sont servies d'abord, le reste
+    est envoyé à Gemini par lots, avec au plus BATCH_CORRECTION_MAX_WORKERS appels
+    simultanés. Les tentatives de chaque lot sont enregistrées en un seul INSERT
+    avant d'être envoyées : une déconnexion du client ne perd pas les corrections
+    déjà faites.
+
+    Yields:
+        dict: {'index', 'result'} ou {'index', 'error'} pour chaque copie, dès que
+        sa correction est prête, puis {'done': True, 'attempt_ids', 'stats'}
+    """
+    dictation = Dictation.objects.get(id=dictation_id)
+    cleaned_dictation_text = clean_text_for_comparison(dictation.text)
+
+    # Copies identiques après nettoyage : une seule correction
+    groups = {}
+    for index, user_text in enumerate(user_texts):
+        groups.setdefault(clean_text_for_comparison(user_text), []).append(index)
+
+    attempt_ids = [None] * len(user_texts)
+    stats = {'items': len(user_texts), 'unique': len(groups), 'without_llm': 0, 'llm_calls': 0, 'failed': 0}
+
+    pending, corrected = [], []
+    for cleaned_user_text, indices in groups.items():
+        result = correct_without_llm(dictation, cleaned_dictation_text, cleaned_user_text)
+        if result is None:
+            pending.append(cleaned_user_text)
+            continue
+        stats['without_llm'] += 1
+        corrected.extend((index, result) for index in indices)
+    _save_attempts(dictation, user_texts, corrected, attempt_ids)
+    for index, result in corrected:
+        yield {'index': index, 'result': result}
+
+    packs = pack_copies(pending, cleaned_dictation_text)
+    if packs:
+        executor = ThreadPoolExecutor(max_workers=max(1, min(settings.BATCH_CORRECTION_MAX_WORKERS, len(packs))))
+        try:
+            futures = {
+                executor.submit(_correct_pack, cleaned_dictation_text, pack): pack
+                for pack in packs
+            }
+            for future in as_completed(futures):
+                pack = futures[future]
+                try:
+                    outcomes, calls = future.result()
+                    stats['llm_calls'] += calls
+                except Exception as e:
+                    logger.error(f"Erreur lors de la correction d'un lot de {len(pack)} copie(s) : {str(e)}")
+                    outcomes = [e] * len(pack)
+                    stats['llm_calls'] += 1
+                events, corrected = [], []
+                for cleaned_user_text, outcome in zip(pack, outcomes):
+                    if isinstance(outcome, Exception):
+                        stats['failed'] += len(groups[cleaned_user_text])
+                        events.extend({'index': index, 'error': str(outcome)} for index in groups[cleaned_user_text])
+                        continue
+                    store_correction(correction_cache_key(cleaned_dictation_text, cleaned_user_text), outcome)
+                    corrected.extend((index, outcome) for index in groups[cleaned_user_text])
+                _save_attempts(dictation, user_texts, corrected, attempt_ids)
+                events.extend({'index': index, 'result': result} for index, result in corrected)
+                yield from events
+        finally:
+            # Client déconnecté : les lots non commencés sont abandonnés
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    logger.info(
+        f"Correction groupée de la dictée {dictation_id} : {stats['items']} copies, "
+        f"{stats['unique']} distinctes, {stats['without_llm']} sans LLM, {stats['llm_calls']} appel(s) au LLM"
+    )
+    yield {
+        'done': True,
+        'attempt_ids': attempt_ids,
+        'stats': stats,
+    }
@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import weakref
+import redis
+import redis.asyncio
+from django.conf import settings
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+CORRECTION_KEY_PREFIX = 'dictation:correction:'
+# Ensemble trié (clé -> date du dernier accès) utilisé pour l'éviction LRU
+CORRECTION_INDEX_KEY = 'dictation:correction:index'
+AUDIO_SEGMENT_KEY_PREFIX = 'dictation:tts:'
+AUDIO_SEGMENT_INDEX_KEY = 'dictation:tts:index'
+VISION_KEY_PREFIX = 'dictation:vision:'
+
+_client = None
+_client_lock = threading.Lock()
+# Un client asynchrone par boucle d'événements, comme pour le client httpx de Gemini
+_async_clients = weakref.WeakKeyDictionary()
+
+def get_redis():
+    """
+    Retourne le client Redis partagé (même instance que le broker Celery).
+    Le pool de connexions est créé au premier appel.
+    """
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = redis.Redis.from_url(
+                    settings.REDIS_URL,
+                    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+                    socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT
+                )
+    return _client
+
+def get_async_redis():
+    """Retourne le client Redis asynchrone de la boucle d'événements courante."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = redis.asyncio.Redis.from_url(
+            settings.REDIS_URL,
+            socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=settings.REDIS_SOCKET_TIMEOUT
+        )
+        _async_clients[loop] = client
+    return client
+
+def correction_cache_key(cleaned_dictation_text: str, cleaned_user_text: str) -> str:
+    """
+    Calcule la clé de cache d'une correction à partir des textes déjà passés
+    par clean_text_for_comparison.
+    """
+    digest = hashlib.sha256()
+    digest.update(cleaned_dictation_text.encode('utf-8'))
+    digest.update(b'\x00')
+    digest.update(cleaned_user_text.encode('utf-8'))
+    return digest.hexdigest()
+
+def get_cached_correction(key: str):
+    """
+    Retourne la correction mise en cache pour cette clé, ou None.
+    Une indisponibilité de Redis est traitée comme un défaut de cache.
+    """
+    try:
+        client = get_redis()
+        raw = client.get(CORRECTION_KEY_PREFIX + key)
+        if raw is None:
+            return None
+        client.zadd(CORRECTION_INDEX_KEY, {key: time.time()})
+        return json.loads(raw)
+    except (redis.RedisError, ValueError) as e:
+        logger.warning(f"Lecture du cache de correction impossible : {str(e)}")
+        return None
+
+def _store_with_lru(prefix: str, index_key: str, key: str, value, ttl: int, max_entries: int):
+    """
+    Écrit une entrée avec une durée de vie et l'inscrit dans l'index LRU (ensemble
+    trié par date du dernier accès), puis évince les entrées les moins récemment
+    utilisées au-delà de max_entries.
+
+    Raises:
+        redis.RedisError: Si Redis est indisponible
+    """
+    now = time.time()
+    client = get_redis()
+    pipe = client.pipeline()
+    pipe.set(prefix + key, value, ex=ttl)
+    pipe.zadd(index_key, {key: now})
+    # Les entrées expirées par TTL n'ont plus rien à faire dans l'index
+    pipe.zremrangebyscore(index_key, 0, now - ttl)
+    pipe.zcard(index_key)
+    size = pipe.execute()[-1]
+    if size > max_entries:
+        evicted = client.zpopmin(index_key, size - max_entries)
+        if evicted:
+            client.delete(*[prefix + member.decode() for member, _ in evicted])
+
+def store_correction(key: str, correction_data: dict):
+    """
+    Met une correction en cache avec une durée de vie, puis évince les entrées
+    les moins récemment utilisées au-delà de CORRECTION_CACHE_MAX_ENTRIES.
+    """
+    try:
+        _store_with_lru(
+            CORRECTION_KEY_PREFIX, CORRECTION_INDEX_KEY, key, json.dumps(correction_data),
+            settings.CORRECTION_CACHE_TTL, settings.CORRECTION_CACHE_MAX_ENTRIES
+        )
+    except redis.RedisError as e:
+        logger.warning(f"Écriture du cache de correction impossible : {str(e)}")
+
+def audio_segment_cache_key(text: str, lang: str, slow: bool) -> str:
+    """Calcule la clé de cache d'un segment audio synthétisé par gTTS."""
+    digest = hashlib.sha256(f"{lang}|{int(slow)}|{text}".encode('utf-8'))
+    return digest.hexdigest()
+
+def get_cached_audio_segment(key: str):
+    """Retourne les octets MP3 mis en cache pour ce segment, ou None."""
+    try:
+        client = get_redis()
+        audio = client.get(AUDIO_SEGMENT_KEY_PREFIX + key)
+        if audio is not None:
+            client.zadd(AUDIO_SEGMENT_INDEX_KEY, {key: time.time()})
+        return audio
+    except redis.RedisError as e:
+        logger.warning(f"Lecture du cache audio impossible : {str(e)}")
+        return None
+
+def store_audio_segment(key: str, audio: bytes):
+    """
+    Met en cache les octets MP3 d'un segment pour TTS_SEGMENT_CACHE_TTL secondes.
+    Redis sert aussi de broker Celery : au-delà de TTS_SEGMENT_CACHE_MAX_ENTRIES
+    segments, les moins récemment utilisés sont évincés.
+    """
+    try:
+        _store_with_lru(
+            AUDIO_SEGMENT_KEY_PREFIX, AUDIO_SEGMENT_INDEX_KEY, key, audio,
+            settings.TTS_SEGMENT_CACHE_TTL, settings.TTS_SEGMENT_CACHE_MAX_ENTRIES
+        )
+    except redis.RedisError as e:
+        logger.warning(f"Écriture du cache audio impossible : {str(e)}")
+
+def vision_cache_key(image_hash: str, image_bytes: bytes, model: str) -> str:
+    """
+    Clé de cache du texte extrait d'une image normalisée. Deux photos différentes
+    peuvent avoir le même dHash : l'empreinte SHA-256 des octets fait partie de la
+    clé, le dHash n'en est que le préfixe lisible.
+    """
+    return f"{model}:{image_hash}:{hashlib.sha256(image_bytes).hexdigest()}"
+
+def get_cached_extraction(key: str):
+    """Retourne le texte déjà extrait de cette image, ou None."""
+    try:
+        raw = get_redis().get(VISION_KEY_PREFIX + key)
+        return raw.decode('utf-8') if raw is not None else None
+    except redis.RedisError as e:
+        logger.warning(f"Lecture du cache d'extraction impossible : {str(e)}")
+        return None
+
+def store_extraction(key: str, text: str):
+    """Met en cache le texte extrait d'une image pour VISION_CACHE_TTL secondes."""
+    try:
+        get_redis().set(VISION_KEY_PREFIX + key, text.encode('utf-8'), ex=settings.VISION_CACHE_TTL)
+    except redis.RedisError as e:
+        logger.warning(f"Écriture du cache d'extraction impossible : {str(e)}")
@@ -0,0 +1,85 @@
+"""
+Structuration des erreurs relevées par la correction.
+
+Les erreurs renvoyées par le LLM ou par la correction locale ({word, correction,
+description}) sont classées par catégorie et situées dans le texte de la
+dictée, pour être stockées dans DictationAttempt.mistakes et dans la table
+DictationError, où elles s'agrègent en SQL.
+"""
+import re
+
+# Mots-clés (début de mot) qui désignent chaque catégorie dans l'intitulé d'une description
+ERROR_CATEGORY_KEYWORDS = [
+    ('ponctuation', ('ponctuation', 'virgule')),
+    ('mot manquant', ('manquant', 'oubli', 'omis', 'omission')),
+    ('accord', ('accord',)),
+    ('conjugaison', ('conjugaison', 'conjugu', 'temps du verbe', 'participe')),
+    ('grammaire', ('grammaire', 'grammatical', 'construction', 'syntaxe', 'sémantique')),
+    ('orthographe', ('orthographe', 'accent', 'homophone', 'majuscule')),
+]
+ERROR_CATEGORIES = [category for category, _ in ERROR_CATEGORY_KEYWORDS] + ['autre']
+
+WORD_PATTERN = re.compile(r"\w+(?:['’]\w+)*")
+
+# Intitulé d'une description : sa première proposition (« Erreur d'accord : ... »),
+# avant la règle et le conseil, dont le vocabulaire ne dit rien de la catégorie
+LABEL_PATTERN = re.compile(r"^[^:.;,!?(]*")
+LABEL_MAX_WORDS = 8
+_CATEGORY_BY_KEYWORD = {
+    keyword: category for category, keywords in ERROR_CATEGORY_KEYWORDS for keyword in keywords
+}
+KEYWORD_PATTERN = re.compile(
+    r"\b(" + '|'.join(re.escape(keyword) for keyword in sorted(_CATEGORY_BY_KEYWORD, key=len, reverse=True)) + ")"
+)
+
+def classify_error(error: dict) -> str:
+    """
+    Retourne la catégorie d'une erreur : celle fournie par le correcteur si elle
+    est connue, sinon celle que désigne l'intitulé de la description
+    (« Erreur d'orthographe : ... »). Seul l'intitulé est lu : le premier mot-clé
+    qui y figure l'emporte.
+    """
+    category = (error.get('category') or '').strip().lower()
+    if category in ERROR_CATEGORIES:
+        return category
+    description = (error.get('description') or '').strip().lower()
+    label = ' '.join(LABEL_PATTERN.match(description).group().split()[:LABEL_MAX_WORDS])
+    match = KEYWORD_PATTERN.search(label)
+    return _CATEGORY_BY_KEYWORD[match.group(1)] if match else 'autre'
+
+def structure_errors(errors: list, dictation_text: str) -> list:
+    """
+    Classe les erreurs et les situe dans la dictée.
+
+    La position est l'indice (à partir de 0) du premier mot de la correction dans
+    le texte de la dictée, cherché après l'erreur précédente : les erreurs sont
+    relevées dans l'ordre du texte. Elle vaut None si le mot n'est pas retrouvé.
+
+    Returns:
+        list: Erreurs {word, correction, category, position, description}
+    """
+    words = WORD_PATTERN.findall(dictation_text.lower())
+    cursor = 0
+    structured = []
+    for error in errors or []:
+        correction = (error.get('correction') or '').strip()
+        position = None
+        correction_words = WORD_PATTERN.findall(correction.lower())
+        if correction_words:
+            target = correction_words[0]
+            for start in (cursor, 0):
+                try:
+                    position = words.index(target, start)
+                    break
+                except ValueError:
+                    continue
+            if position is not None:
+                cursor = position + 1
+        structured.append({
+            'word': (error.get('word') or '').strip(),
+            'correction': correction,
+            'category': classify_error(error),
+            'position': position,
+            'description': error.get('description') or '',
+        })
+    return structured
@@ -0,0 +1,323 @@
+import asyncio
+import json
+import logging
+import random
+import threading
+import time
+import weakref
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+from . import governor
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+# Statuts HTTP pour lesquels un nouvel essai a du sens (quota dépassé, erreurs serveur)
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+# Un client httpx par boucle d'événements : un AsyncClient ne peut pas changer de boucle
+_async_clients = weakref.WeakKeyDictionary()
+
+class GeminiAPIError(Exception):
+    """Erreur renvoyée par l'API REST Gemini (statut HTTP inattendu ou upstream injoignable)."""
+
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+def get_session():
+    """
+    Retourne la session HTTP partagée par tous les appels Gemini du processus.
+    Les connexions TLS sont conservées (keep-alive) et réutilisées entre les requêtes.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.GEMINI_POOL_MAXSIZE
+                )
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({'Content-Type': 'application/json'})
+                _session = session
+    return _session
+
+def build_url(model=None, method='generateContent'):
+    """Construit l'URL d'une méthode de l'API REST Gemini pour le modèle donné."""
+    return f"{settings.GEMINI_API_BASE_URL}/models/{model or settings.GEMINI_MODEL}:{method}"
+
+def backoff_delay(attempt, retry_after=None):
+    """
+    Calcule l'attente avant le prochain essai : backoff exponentiel avec jitter complet,
+    ou la valeur de l'en-tête Retry-After si l'API en fournit une.
+    """
+    if retry_after:
+        try:
+            return min(float(retry_after), settings.GEMINI_RETRY_MAX_BACKOFF)
+        except ValueError:
+            pass
+    ceiling = min(settings.GEMINI_RETRY_MAX_BACKOFF, settings.GEMINI_RETRY_BACKOFF * (2 ** attempt))
+    return random.uniform(0, ceiling)
+
+def _post_with_retries(url, payload, params=None, stream=False, permit=None):
+    """
+    Envoie la requête POST avec timeouts et nouveaux essais (backoff exponentiel avec jitter)
+    sur les erreurs réseau et les statuts 429/5xx. Chaque nouvel essai reprend un jeton
+    auprès du régulateur (permit) pour ne pas dépasser le quota commun.
+
+    Returns:
+        requests.Response: La réponse 200 de l'API
+
+    Raises:
+        GeminiAPIError: Si l'API reste en erreur après tous les essais
+    """
+    api_key = settings.GEMINI_API_KEY
+    if not api_key:
+        raise ValueError("La clé API Gemini n'est pas configurée")
+
+    timeout = (settings.GEMINI_CONNECT_TIMEOUT, settings.GEMINI_READ_TIMEOUT)
+    max_retries = settings.GEMINI_MAX_RETRIES
+    session = get_session()
+
+    for attempt in range(max_retries + 1):
+        if attempt:
+            governor.throttle(permit)
+        try:
+            response = session.post(
+                url,
+                params={'key': api_key, **(params or {})},
+                json=payload,
+                timeout=timeout,
+                stream=stream
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            if attempt >= max_retries:
+                logger.error(f"Gemini injoignable après {attempt + 1} essai(s) : {str(e)}")
+                raise GeminiAPIError(f"Erreur API: {str(e)}") from e
+            delay = backoff_delay(attempt)
+            logger.warning(f"Erreur réseau Gemini ({str(e)}), nouvel essai dans {delay:.2f}s")
+            time.sleep(delay)
+            continue
+
+        if response.status_code == 200:
+            return response
+
+        if response.status_code in RETRYABLE_STATUS_CODES and attempt < max_retries:
+            delay = backoff_delay(attempt, response.headers.get('Retry-After'))
+            logger.warning(f"Gemini a répondu {response.status_code}, nouvel essai dans {delay:.2f}s")
+            response.close()
+            time.sleep(delay)
+            continue
+
+        logger.error(f"Erreur Gemini API: {response.text}")
+        raise GeminiAPIError(f"Erreur API: {response.status_code}", status_code=response.status_code)
+
+def generate_content(payload, model=None):
+    """
+    Appelle la méthode generateContent de Gemini avec timeouts et nouveaux essais.
+
+    Args:
+        payload (dict): Corps de la requête (contents, generationConfig, ...)
+        model (str, optional): Modèle à utiliser, settings.GEMINI_MODEL par défaut
+
+    Returns:
+        dict: La réponse JSON de l'API
+
+    Raises:
+        GeminiAPIError: Si l'API reste en erreur après tous les essais
+    """
+    with governor.governed('gemini', model or settings.GEMINI_MODEL, settings.GEMINI_API_KEY) as permit:
+        started = time.perf_counter()
+        result = _post_with_retries(build_url(model), payload, permit=permit).json()
+    log_usage(model, result, started)
+    return result
+
+def stream_generate_content(payload, model=None):
+    """
+    Appelle streamGenerateContent en mode SSE et produit chaque morceau de texte dès
+    sa réception. Les nouveaux essais ne s'appliquent qu'avant le premier octet reçu.
+
+    Yields:
+        str: Les fragments de texte successifs de la réponse
+    """
+    # La place auprès du régulateur est conservée jusqu'à la fin du flux
+    with governor.governed('gemini', model or settings.GEMINI_MODEL, settings.GEMINI_API_KEY) as permit:
+        started = time.perf_counter()
+        response = _post_with_retries(
+            build_url(model, 'streamGenerateContent'),
+            payload,
+            params={'alt': 'sse'},
+            stream=True,
+            permit=permit
+        )
+        response.encoding = 'utf-8'
+        chunk = {}
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith('data:'):
+                    continue
+                chunk = json.loads(line[len('data:'):])
+                for candidate in chunk.get('candidates', [])[:1]:
+                    for part in candidate.get('content', {}).get('parts', []):
+                        if part.get('text'):
+                            yield part['text']
+        # Le dernier morceau porte usageMetadata et finishReason
+        log_usage(model, chunk, started)
+
+def text_payload(prompt):
+    """
+    Corps de requête d'un prompt : texte seul, ou requête complète construite par
+    le registre de prompts (systemInstruction, generationConfig).
+    """
+    if isinstance(prompt, dict):
+        return prompt
+    return {"contents": [{"parts": [{"text": prompt}]}]}
+
+def log_usage(model, result, started):
+    """
+    Journalise la consommation de tokens (usageMetadata) et la latence d'un appel,
+    et signale les réponses tronquées par maxOutputTokens.
+    """
+    usage = result.get('usageMetadata') or {}
+    elapsed_ms = round((time.perf_counter() - started) * 1000)
+    logger.info(
+        f"Gemini {model or settings.GEMINI_MODEL} : {usage.get('promptTokenCount', '?')} tokens en entrée "
+        f"(dont {usage.get('cachedContentTokenCount', 0)} en cache), "
+        f"{usage.get('candidatesTokenCount', '?')} en sortie, {elapsed_ms} ms"
+    )
+    for candidate in result.get('candidates', [])[:1]:
+        if candidate.get('finishReason') == 'MAX_TOKENS':
+            logger.warning(f"Réponse Gemini tronquée par maxOutputTokens ({usage.get('candidatesTokenCount', '?')} tokens)")
+
+def extract_text(result):
+    """Extrait le texte de la première réponse candidate renvoyée par Gemini."""
+    return result['candidates'][0]['content']['parts'][0]['text']
+
+def generate_text(prompt, model=None):
+    """
+    Envoie un prompt à Gemini et retourne le texte de la réponse.
+
+    Args:
+        prompt (str | dict): Texte du prompt ou requête construite par prompts.py
+    """
+    payload = text_payload(prompt)
+    return extract_text(generate_content(payload, model=model))
+
+def stream_text(prompt, model=None):
+    """Envoie un prompt à Gemini (voir generate_text) et produit la réponse fragment par fragment."""
+    payload = text_payload(prompt)
+    return stream_generate_content(payload, model=model)
+
+def get_async_client():
+    """
+    Retourne le client httpx asynchrone de la boucle d'événements courante.
+    Sous ASGI (uvicorn), un seul client et son pool de connexions servent
+    toutes les requêtes du processus.
+    """
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(settings.GEMINI_READ_TIMEOUT, connect=settings.GEMINI_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=settings.GEMINI_ASYNC_MAX_CONNECTIONS,
+                max_keepalive_connections=settings.GEMINI_POOL_MAXSIZE
+            ),
+            headers={'Content-Type': 'application/json'}
+        )
+        _async_clients[loop] = client
+    return client
+
+async def _asend_with_retries(url, payload, params=None, stream=False, permit=None):
+    """
+    Équivalent asynchrone de _post_with_retries.
+
+    Returns:
+        httpx.Response: La réponse 200 de l'API (à fermer par l'appelant si stream=True)
+    """
+    api_key = settings.GEMINI_API_KEY
+    if not api_key:
+        raise ValueError("La clé API Gemini n'est pas configurée")
+
+    max_retries = settings.GEMINI_MAX_RETRIES
+    client = get_async_client()
+
+    for attempt in range(max_retries + 1):
+        if attempt:
+            await governor.athrottle(permit)
+        request = client.build_request('POST', url, params={'key': api_key, **(params or {})}, json=payload)
+        try:
+            response = await client.send(request, stream=stream)
+        except httpx.TransportError as e:
+            if attempt >= max_retries:
+                logger.error(f"Gemini injoignable après {attempt + 1} essai(s) : {str(e)}")
+                raise GeminiAPIError(f"Erreur API: {str(e)}") from e
+            delay = backoff_delay(attempt)
+            logger.warning(f"Erreur réseau Gemini ({str(e)}), nouvel essai dans {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        if response.status_code == 200:
+            return response
+
+        await response.aread()
+        await response.aclose()
+        if response.status_code in RETRYABLE_STATUS_CODES and attempt < max_retries:
+            delay = backoff_delay(attempt, response.headers.get('Retry-After'))
+            logger.warning(f"Gemini a répondu {response.status_code}, nouvel essai dans {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
+
+        logger.error(f"Erreur Gemini API: {response.text}")
+        raise GeminiAPIError(f"Erreur API: {response.status_code}", status_code=response.status_code)
+
+async def async_generate_content(payload, model=None):
+    """Équivalent asynchrone de generate_content."""
+    async with governor.agoverned('gemini', model or settings.GEMINI_MODEL, settings.GEMINI_API_KEY) as permit:
+        started = time.perf_counter()
+        response = await _asend_with_retries(build_url(model), payload, permit=permit)
+    result = response.json()
+    log_usage(model, result, started)
+    return result
+
+async def async_stream_generate_content(payload, model=None):
+    """Équivalent asynchrone de stream_generate_content."""
+    async with governor.agoverned('gemini', model or settings.GEMINI_MODEL, settings.GEMINI_API_KEY) as permit:
+        started = time.perf_counter()
+        response = await _asend_with_retries(
+            build_url(model, 'streamGenerateContent'),
+            payload,
+            params={'alt': 'sse'},
+            stream=True,
+            permit=permit
+        )
+        chunk = {}
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith('data:'):
+                    continue
+                chunk = json.loads(line[len('data:'):])
+                for candidate in chunk.get('candidates', [])[:1]:
+                    for part in candidate.get('content', {}).get('parts', []):
+                        if part.get('text'):
+                            yield part['text']
+        finally:
+            await response.aclose()
+        log_usage(model, chunk, started)
+
+async def async_generate_text(prompt, model=None):
+    """Équivalent asynchrone de generate_text."""
+    payload = text_payload(prompt)
+    return extract_text(await async_generate_content(payload, model=model))
+
+def async_stream_text(prompt, model=None):
+    """Équivalent asynchrone de stream_text."""
+    payload = text_payload(prompt)
+    return async_stream_generate_content(payload, model=model)
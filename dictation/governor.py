@@ -0,0 +1,298 @@
+"""
+Régulation des appels aux LLM pour l'ensemble des workers.
+
+Chaque couple (fournisseur, modèle, clé API) dispose dans Redis d'un seau à jetons
+(débit moyen et rafale autorisés) et d'un sémaphore limitant les appels en cours.
+Un appel attend son tour jusqu'à une échéance (mode 'wait') ou est refusé
+immédiatement (mode 'fail_fast'). Si Redis est indisponible, les appels passent
+sans régulation plutôt que d'échouer.
+"""
+import asyncio
+import hashlib
+import logging
+import random
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+import redis
+from django.conf import settings
+from .cache import get_async_redis, get_redis
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+GOVERNOR_KEY_PREFIX = 'dictation:governor:'
+METRICS_KEY = 'dictation:governor:metrics'
+
+# Intervalle d'attente quand tous les appels autorisés sont en cours (secondes)
+POLL_INTERVAL = 0.1
+
+# Prend un jeton dans le seau et, si une limite est donnée, une place dans le sémaphore.
+# Les durées sont renvoyées en chaîne : Redis tronque les nombres Lua en entiers.
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local burst = tonumber(ARGV[3])
+local limit = tonumber(ARGV[4])
+local lease = tonumber(ARGV[5])
+local holder = ARGV[6]
+
+if limit > 0 then
+    redis.call('ZREMRANGEBYSCORE', KEYS[2], '-inf', now)
+    if redis.call('ZCARD', KEYS[2]) >= limit then
+        return {0, 'in_flight', '0'}
+    end
+end
+
+if rate > 0 then
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+    if tokens < 1 then
+        return {0, 'rate', tostring((1 - tokens) / rate)}
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 60)
+end
+
+if limit > 0 then
+    redis.call('ZADD', KEYS[2], now + lease, holder)
+    redis.call('EXPIRE', KEYS[2], math.ceil(lease) + 60)
+end
+return {1, 'ok', '0'}
+"""
+
+class RateLimitExceeded(Exception):
+    """Appel refusé par le régulateur : quota ou nombre d'appels simultanés atteint."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self):
+        """Valeur de l'en-tête HTTP Retry-After (secondes entières)."""
+        return str(max(1, int(round(self.retry_after or 1))))
+
+def get_limits(provider, model):
+    """
+    Limites applicables à un modèle : LLM_GOVERNOR_LIMITS['<fournisseur>:<modèle>'],
+    puis LLM_GOVERNOR_LIMITS['<fournisseur>'], complétées par les valeurs par défaut.
+    """
+    limits = {
+        'rate': settings.LLM_GOVERNOR_RATE,
+        'burst': settings.LLM_GOVERNOR_BURST,
+        'max_in_flight': settings.LLM_GOVERNOR_MAX_IN_FLIGHT,
+    }
+    limits.update(settings.LLM_GOVERNOR_LIMITS.get(provider, {}))
+    limits.update(settings.LLM_GOVERNOR_LIMITS.get(f"{provider}:{model}", {}))
+    return limits
+
+def governor_scope(provider, model, api_key=''):
+    """Identifiant de la ressource régulée ; la clé API n'apparaît que sous forme d'empreinte."""
+    key_hash = hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:12]
+    return f"{provider}:{model}:{key_hash}"
+
+class Permit:
+    """Autorisation d'appel délivrée par le régulateur."""
+
+    def __init__(self, scope, limits, holder):
+        self.scope = scope
+        self.limits = limits
+        self.holder = holder
+
+def _in_flight_key(scope):
+    return f"{GOVERNOR_KEY_PREFIX}{scope}:in-flight"
+
+def _script_call(permit, hold_slot):
+    """Clés et arguments du script d'acquisition (hold_slot=False : jeton seul)."""
+    keys = [f"{GOVERNOR_KEY_PREFIX}{permit.scope}:bucket", _in_flight_key(permit.scope)]
+    args = [
+        time.time(),
+        permit.limits['rate'],
+        permit.limits['burst'],
+        permit.limits['max_in_flight'] if hold_slot else 0,
+        settings.LLM_GOVERNOR_LEASE,
+        permit.holder,
+    ]
+    return keys, args
+
+def _wait_delay(reason, wait):
+    # Jitter pour que les workers en attente ne repartent pas tous au même instant
+    base = float(wait) if reason == 'rate' else POLL_INTERVAL
+    return max(base, 0.01) * random.uniform(1.0, 1.5)
+
+def _resolve_max_wait(mode, max_wait):
+    """Échéance d'attente effective : nulle en mode 'fail_fast'."""
+    if (mode or settings.LLM_GOVERNOR_MODE) == 'fail_fast':
+        return 0
+    return settings.LLM_GOVERNOR_MAX_WAIT if max_wait is None else max_wait
+
+def _metrics_pipeline(client, scope, outcome, waited):
+    pipe = client.pipeline(transaction=False)
+    pipe.hincrby(METRICS_KEY, f"{scope}:{outcome}", 1)
+    if waited > 0:
+        pipe.hincrby(METRICS_KEY, f"{scope}:waited", 1)
+        pipe.hincrbyfloat(METRICS_KEY, f"{scope}:wait_seconds", waited)
+    return pipe
+
+def _record(scope, outcome, waited):
+    try:
+        _metrics_pipeline(get_redis(), scope, outcome, waited).execute()
+    except redis.RedisError as e:
+        logger.warning(f"Enregistrement des métriques du régulateur impossible : {str(e)}")
+
+async def _arecord(scope, outcome, waited):
+    try:
+        await _metrics_pipeline(get_async_redis(), scope, outcome, waited).execute()
+    except redis.RedisError as e:
+        logger.warning(f"Enregistrement des métriques du régulateur impossible : {str(e)}")
+
+def _reject(scope, reason, retry_after):
+    logger.warning(f"Appel LLM refusé par le régulateur ({scope}, {reason})")
+    what = "Quota d'appels au LLM atteint" if reason == 'rate' else "Trop d'appels au LLM en cours"
+    return RateLimitExceeded(f"{what}, veuillez réessayer plus tard.", retry_after=retry_after)
+
+def _take(permit, hold_slot, max_wait):
+    """Boucle d'acquisition synchrone ; retourne le temps d'attente en secondes."""
+    script = get_redis().register_script(ACQUIRE_SCRIPT)
+    started = time.monotonic()
+    slept = False
+    while True:
+        keys, args = _script_call(permit, hold_slot)
+        allowed, reason, wait = script(keys=keys, args=args)
+        # Seuls les appels qui ont réellement attendu comptent dans les métriques d'attente
+        waited = time.monotonic() - started if slept else 0.0
+        if allowed:
+            return waited
+        reason = reason.decode() if isinstance(reason, bytes) else reason
+        delay = _wait_delay(reason, wait)
+        if waited + delay > max_wait:
+            _record(permit.scope, 'rejected', waited)
+            raise _reject(permit.scope, reason, delay)
+        time.sleep(delay)
+        slept = True
+
+async def _atake(permit, hold_slot, max_wait):
+    """Équivalent asynchrone de _take."""
+    script = get_async_redis().register_script(ACQUIRE_SCRIPT)
+    started = time.monotonic()
+    slept = False
+    while True:
+        keys, args = _script_call(permit, hold_slot)
+        allowed, reason, wait = await script(keys=keys, args=args)
+        # Seuls les appels qui ont réellement attendu comptent dans les métriques d'attente
+        waited = time.monotonic() - started if slept else 0.0
+        if allowed:
+            return waited
+        reason = reason.decode() if isinstance(reason, bytes) else reason
+        delay = _wait_delay(reason, wait)
+        if waited + delay > max_wait:
+            await _arecord(permit.scope, 'rejected', waited)
+            raise _reject(permit.scope, reason, delay)
+        await asyncio.sleep(delay)
+        slept = True
+
+@contextmanager
+def governed(provider, model, api_key='', mode=None, max_wait=None):
+    """
+    Réserve un appel au LLM : un jeton du seau et une place parmi les appels en cours,
+    libérée à la sortie du bloc.
+
+    Args:
+        mode (str, optional): 'wait' (attendre jusqu'à max_wait secondes) ou 'fail_fast'
+        max_wait (float, optional): Échéance d'attente, LLM_GOVERNOR_MAX_WAIT par défaut
+
+    Raises:
+        RateLimitExceeded: Si l'appel ne peut pas être autorisé avant l'échéance
+
+    Yields:
+        Permit: L'autorisation, à passer à throttle() avant un nouvel essai
+    """
+    if not settings.LLM_GOVERNOR_ENABLED:
+        yield None
+        return
+    max_wait = _resolve_max_wait(mode, max_wait)
+    permit = Permit(governor_scope(provider, model, api_key), get_limits(provider, model), uuid.uuid4().hex)
+    try:
+        waited = _take(permit, True, max_wait)
+        _record(permit.scope, 'acquired', waited)
+    except redis.RedisError as e:
+        logger.warning(f"Régulateur indisponible, appel LLM non régulé : {str(e)}")
+        permit = None
+    try:
+        yield permit
+    finally:
+        if permit is not None:
+            try:
+                get_redis().zrem(_in_flight_key(permit.scope), permit.holder)
+            except redis.RedisError as e:
+                logger.warning(f"Libération de la place du régulateur impossible : {str(e)}")
+
+@asynccontextmanager
+async def agoverned(provider, model, api_key='', mode=None, max_wait=None):
+    """Équivalent asynchrone de governed."""
+    if not settings.LLM_GOVERNOR_ENABLED:
+        yield None
+        return
+    max_wait = _resolve_max_wait(mode, max_wait)
+    permit = Permit(governor_scope(provider, model, api_key), get_limits(provider, model), uuid.uuid4().hex)
+    try:
+        waited = await _atake(permit, True, max_wait)
+        await _arecord(permit.scope, 'acquired', waited)
+    except redis.RedisError as e:
+        logger.warning(f"Régulateur indisponible, appel LLM non régulé : {str(e)}")
+        permit = None
+    try:
+        yield permit
+    finally:
+        if permit is not None:
+            try:
+                await get_async_redis().zrem(_in_flight_key(permit.scope), permit.holder)
+            except redis.RedisError as e:
+                logger.warning(f"Libération de la place du régulateur impossible : {str(e)}")
+
+def throttle(permit, mode=None, max_wait=None):
+    """
+    Prend un jeton supplémentaire avant un nouvel essai, sans reprendre de place
+    dans le sémaphore : les essais répétés restent soumis au quota commun.
+    """
+    if permit is None:
+        return
+    try:
+        _take(permit, False, _resolve_max_wait(mode, max_wait))
+    except redis.RedisError as e:
+        logger.warning(f"Régulateur indisponible, nouvel essai non régulé : {str(e)}")
+
+async def athrottle(permit, mode=None, max_wait=None):
+    """Équivalent asynchrone de throttle."""
+    if permit is None:
+        return
+    try:
+        await _atake(permit, False, _resolve_max_wait(mode, max_wait))
+    except redis.RedisError as e:
+        logger.warning(f"Régulateur indisponible, nouvel essai non régulé : {str(e)}")
+
+def governor_metrics():
+    """
+    Retourne, par ressource régulée, les appels autorisés et refusés, le temps
+    d'attente cumulé et moyen, et le nombre d'appels en cours.
+    """
+    try:
+        client = get_redis()
+        raw = client.hgetall(METRICS_KEY)
+        metrics = {}
+        for field, value in raw.items():
+            scope, name = field.decode().rsplit(':', 1)
+            entry = metrics.setdefault(scope, {'acquired': 0, 'rejected': 0, 'waited': 0, 'wait_seconds': 0.0})
+            entry[name] = float(value) if name == 'wait_seconds' else int(value)
+        now = time.time()
+        for scope, entry in metrics.items():
+            calls = entry['acquired'] + entry['rejected']
+            entry['average_wait_ms'] = round(entry['wait_seconds'] * 1000 / calls, 1) if calls else 0.0
+            entry['in_flight'] = client.zcount(_in_flight_key(scope), now, '+inf')
+        return metrics
+    except redis.RedisError as e:
+        logger.warning(f"Lecture des métriques du régulateur impossible : {str(e)}")
+        return {}
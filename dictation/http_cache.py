@@ -0,0 +1,135 @@
+import hashlib
+import json
+import logging
+import redis
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+from rest_framework.renderers import JSONRenderer
+from .cache import get_redis
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+RESPONSE_KEY_PREFIX = 'dictation:response:'
+# Incrémenté à chaque modification d'une dictée : invalide toutes les pages de liste d'un coup
+LIST_VERSION_KEY = 'dictation:response:list-version'
+
+def object_cache_key(pk):
+    """
+    Hash Redis des réponses d'une dictée, une entrée par hôte (champ) : les URL
+    absolues du corps (audio_file) dépendent de l'hôte de la requête. Un seul DEL
+    invalide la dictée pour tous les hôtes.
+    """
+    return f"{RESPONSE_KEY_PREFIX}object-by-host:{pk}"
+
+def list_cache_key(request):
+    try:
+        version = int(get_redis().get(LIST_VERSION_KEY) or 0)
+    except redis.RedisError:
+        return None
+    digest = hashlib.sha256(f"{request.get_host()}{request.get_full_path()}".encode('utf-8')).hexdigest()
+    return f"{RESPONSE_KEY_PREFIX}list:{version}:{digest}"
+
+def build_entry(data, last_modified):
+    """
+    Rend la réponse JSON une seule fois et calcule son ETag fort.
+
+    Returns:
+        dict: {'body', 'etag', 'last_modified'} prêt à être mis en cache
+    """
+    body = JSONRenderer().render(data)
+    return {
+        'body': body.decode('utf-8'),
+        'etag': f'"{hashlib.sha256(body).hexdigest()}"',
+        'last_modified': last_modified.timestamp() if last_modified else None,
+    }
+
+def get_cached_entry(key, field=None):
+    if key is None:
+        return None
+    try:
+        raw = get_redis().hget(key, field) if field else get_redis().get(key)
+        return json.loads(raw) if raw is not None else None
+    except (redis.RedisError, ValueError) as e:
+        logger.warning(f"Lecture du cache de réponses impossible : {str(e)}")
+        return None
+
+def store_entry(key, entry, field=None):
+    if key is None:
+        return
+    try:
+        if field:
+            pipe = get_redis().pipeline()
+            pipe.hset(key, field, json.dumps(entry))
+            pipe.expire(key, settings.RESPONSE_CACHE_TTL)
+            pipe.execute()
+        else:
+            get_redis().set(key, json.dumps(entry), ex=settings.RESPONSE_CACHE_TTL)
+    except redis.RedisError as e:
+        logger.warning(f"Écriture du cache de réponses impossible : {str(e)}")
+
+def invalidate_dictation(pk):
+    """Supprime la réponse en cache de la dictée et invalide toutes les pages de liste."""
+    try:
+        pipe = get_redis().pipeline()
+        pipe.delete(object_cache_key(pk))
+        pipe.incr(LIST_VERSION_KEY)
+        pipe.execute()
+    except redis.RedisError as e:
+        logger.warning(f"Invalidation du cache de réponses impossible : {str(e)}")
+
+def is_not_modified(request, entry):
+    """Applique If-None-Match (prioritaire) puis If-Modified-Since à une entrée en cache."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match:
+        etags = parse_etags(if_none_match)
+        return '*' in etags or entry['etag'] in etags
+    if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+    if if_modified_since is not None and entry['last_modified'] is not None:
+        return int(entry['last_modified']) <= if_modified_since
+    return False
+
+def conditional_response(request, entry):
+    """Retourne 304 si le client a déjà cette version, sinon le corps JSON en cache."""
+    if is_not_modified(request, entry):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(entry['body'], content_type='application/json')
+    response['ETag'] = entry['etag']
+    if entry['last_modified'] is not None:
+        response['Last-Modified'] = http_date(entry['last_modified'])
+    # Le client peut garder la réponse mais doit la revalider à chaque fois
+    patch_cache_control(response, public=True, no_cache=True)
+    return response
+
+class ConditionalCacheMixin:
+    """
+    Sert retrieve et list depuis Redis avec ETag fort (et Last-Modified pour retrieve).
+    Une requête conditionnelle qui correspond à la version en cache reçoit un 304
+    sans aucun accès à la base de données.
+    """
+
+    def retrieve(self, request, *args, **kwargs):
+        key = object_cache_key(kwargs[self.lookup_url_kwarg or self.lookup_field])
+        host = request.get_host()
+        entry = get_cached_entry(key, host)
+        if entry is None:
+            instance = self.get_object()
+            entry = build_entry(self.get_serializer(instance).data, instance.updated_at)
+            store_entry(key, entry, host)
+        return conditional_response(request, entry)
+
+    def list(self, request, *args, **kwargs):
+        key = list_cache_key(request)
+        entry = get_cached_entry(key)
+        if entry is None:
+            queryset = self.filter_queryset(self.get_queryset())
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(page, many=True)
+            # Pas de Last-Modified : le max des updated_at de la page ne change pas quand
+            # une dictée est supprimée ou rendue privée, seul l'ETag (empreinte du corps) le voit
+            entry = build_entry(self.get_paginated_response(serializer.data).data, None)
+            store_entry(key, entry)
+        return conditional_response(request, entry)
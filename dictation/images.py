@@ -0,0 +1,227 @@
+"""
+Réception des images envoyées par le front (photos de dictées manuscrites).
+
+Les images arrivent de préférence en multipart : le fichier est écrit par
+morceaux dans un fichier temporaire « spooled » (en mémoire sous un seuil, sur
+disque au-delà), avec une taille maximale contrôlée pendant la réception.
+L'ancien format (base64 dans un corps JSON) reste accepté.
+"""
+import base64
+import binascii
+import io
+import logging
+import tempfile
+from django.conf import settings
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+# Formats acceptés (détectés par Pillow) et type MIME transmis à Gemini
+ALLOWED_IMAGE_FORMATS = {
+    'JPEG': 'image/jpeg',
+    'PNG': 'image/png',
+    'WEBP': 'image/webp',
+}
+
+class ImageUploadError(Exception):
+    """Image refusée : trop volumineuse, illisible ou dans un format non pris en charge."""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+class SpooledImageUploadHandler(FileUploadHandler):
+    """
+    Écrit chaque fichier reçu dans un SpooledTemporaryFile et interrompt la
+    réception dès que IMAGE_UPLOAD_MAX_BYTES est dépassé.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.exceeded = False
+        self.file = None
+        self.received = 0
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.file = tempfile.SpooledTemporaryFile(max_size=settings.IMAGE_UPLOAD_SPOOL_SIZE)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > settings.IMAGE_UPLOAD_MAX_BYTES:
+            self.exceeded = True
+            self.file.close()
+            # Le reste du corps est lu puis ignoré, la connexion peut être réutilisée
+            raise StopUpload(connection_reset=False)
+        self.file.write(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        return UploadedFile(
+            file=self.file,
+            name=self.file_name,
+            content_type=self.content_type,
+            size=file_size,
+            charset=self.charset,
+            content_type_extra=self.content_type_extra
+        )
+
+def install_image_upload_handler(request):
+    """
+    Remplace les gestionnaires d'upload de la requête (Django ou DRF) ; à appeler
+    avant tout accès à request.FILES ou request.data.
+
+    Returns:
+        SpooledImageUploadHandler | None: None si le corps a déjà été analysé
+    """
+    django_request = getattr(request, '_request', request)
+    handler = SpooledImageUploadHandler(django_request)
+    try:
+        django_request.upload_handlers = [handler]
+    except AttributeError:
+        # Corps déjà analysé (contrôle CSRF d'une session) : la taille est vérifiée après coup
+        return None
+    return handler
+
+def detect_image_mime_type(fileobj):
+    """
+    Détecte le format réel de l'image avec Pillow (lecture de l'en-tête seulement).
+
+    Raises:
+        ImageUploadError: Si le fichier n'est pas une image dans un format accepté
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    position = fileobj.tell()
+    try:
+        with Image.open(fileobj) as image:
+            image_format = image.format
+    except (UnidentifiedImageError, OSError):
+        raise ImageUploadError("Le fichier envoyé n'est pas une image lisible", status_code=415)
+    finally:
+        fileobj.seek(position)
+    if image_format not in ALLOWED_IMAGE_FORMATS:
+        raise ImageUploadError(f"Format d'image non pris en charge : {image_format}", status_code=415)
+    return ALLOWED_IMAGE_FORMATS[image_format]
+
+class RequestImage:
+    """Image reçue (fichier temporaire ou tampon) et son type MIME réel."""
+
+    def __init__(self, file, mime_type):
+        self.file = file
+        self.mime_type = mime_type
+
+    def read_bytes(self):
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _too_large():
+    max_mb = settings.IMAGE_UPLOAD_MAX_BYTES / (1024 * 1024)
+    return ImageUploadError(f"Image trop volumineuse (maximum {round(max_mb, 1):g} Mo)", status_code=413)
+
+def load_request_image(request, handler, data=None, field='image'):
+    """
+    Récupère l'image d'une requête : fichier multipart, ou à défaut chaîne base64
+    (avec ou sans préfixe data URL) dans les données JSON.
+
+    Args:
+        handler (SpooledImageUploadHandler | None): Gestionnaire installé sur la requête
+        data (dict, optional): Données JSON déjà analysées (format base64)
+
+    Returns:
+        RequestImage | None: None si la requête ne contient aucune image
+
+    Raises:
+        ImageUploadError: Image trop volumineuse, invalide ou de format non pris en charge
+    """
+    upload = request.FILES.get(field)
+    if handler is not None and handler.exceeded:
+        raise _too_large()
+    if upload is not None:
+        if upload.size > settings.IMAGE_UPLOAD_MAX_BYTES:
+            raise _too_large()
+        return RequestImage(upload, detect_image_mime_type(upload))
+
+    image_data = (data or {}).get(field)
+    if not image_data or not isinstance(image_data, str):
+        return None
+    if 'base64,' in image_data:
+        image_data = image_data.split('base64,', 1)[1]
+    # Taille décodée estimée sans décoder : 3 octets pour 4 caractères
+    if len(image_data) * 3 // 4 > settings.IMAGE_UPLOAD_MAX_BYTES:
+        raise _too_large()
+    try:
+        image_bytes = base64.b64decode(image_data)
+    except (binascii.Error, ValueError):
+        raise ImageUploadError("Image base64 invalide")
+    file = io.BytesIO(image_bytes)
+    return RequestImage(file, detect_image_mime_type(file))
+
+# Format d'encodage envoyé à Gemini -> (format Pillow, type MIME)
+VISION_FORMATS = {
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp',
+}
+
+def difference_hash(image, hash_size=16):
+    """
+    Empreinte perceptuelle (dHash) : compare la luminosité de pixels voisins sur une
+    miniature en niveaux de gris. Deux encodages d'une même photo donnent la même
+    empreinte, contrairement à un hachage des octets.
+
+    Returns:
+        str: Empreinte hexadécimale de hash_size * hash_size bits
+    """
+    from PIL import Image
+
+    thumbnail = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.BOX)
+    pixels = thumbnail.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for column in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+def normalize_image_for_vision(image_bytes, max_edge=None, image_format=None, quality=None):
+    """
+    Prépare une photo pour l'API vision : orientation EXIF appliquée, plus grand côté
+    ramené à max_edge, réencodage JPEG ou WebP. Les métadonnées (EXIF, GPS) ne sont
+    pas conservées.
+
+    Returns:
+        tuple: (octets réencodés, type MIME, empreinte dHash)
+    """
+    from PIL import Image, ImageOps
+
+    max_edge = max_edge or settings.VISION_IMAGE_MAX_EDGE
+    image_format = (image_format or settings.VISION_IMAGE_FORMAT).upper()
+    quality = quality or settings.VISION_IMAGE_QUALITY
+    if image_format not in VISION_FORMATS:
+        raise ValueError(f"Format d'encodage non pris en charge : {image_format}")
+
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        # Décodage JPEG directement à une échelle réduite proche de la cible
+        width, height = image.size
+        scale = min(1.0, max_edge / max(width, height))
+        image.draft('RGB', (int(width * scale), int(height * scale)))
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        if max(image.size) > max_edge:
+            image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        image.save(output, image_format, quality=quality, optimize=True)
+        return output.getvalue(), VISION_FORMATS[image_format], difference_hash(image, settings.VISION_HASH_SIZE)
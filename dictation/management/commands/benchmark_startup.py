@@ -0,0 +1,91 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    help = (
+        "Mesure le temps de démarrage à froid de l'application (ASGI par défaut) "
+        "en lançant des interpréteurs neufs avec python -X importtime."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=5, help="Nombre de démarrages mesurés")
+        parser.add_argument('--top', type=int, default=15, help="Nombre de modules les plus coûteux à afficher")
+        parser.add_argument('--module', default='dictation_backend.asgi', help="Module importé au démarrage")
+        parser.add_argument(
+            '--no-urls',
+            action='store_true',
+            help="Ne pas charger la configuration des URLs (chargée sinon, comme à la première requête)"
+        )
+        parser.add_argument(
+            '--max-ms',
+            type=float,
+            help="Échoue si le temps médian de démarrage dépasse cette valeur (en millisecondes)"
+        )
+
+    def handle(self, *args, **options):
+        code = f"import {options['module']}"
+        if not options['no_urls']:
+            code += "; from django.urls import get_resolver; get_resolver().url_patterns"
+
+        wall_times = []
+        import_times = []
+        cumulative_by_module = {}
+        for run in range(options['runs']):
+            started = time.perf_counter()
+            process = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', code],
+                capture_output=True,
+                text=True,
+                cwd=settings.BASE_DIR,
+                env={**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', 'dictation_backend.settings')}
+            )
+            wall_times.append((time.perf_counter() - started) * 1000)
+            if process.returncode != 0:
+                raise CommandError(f"Le démarrage a échoué :\n{process.stderr[-2000:]}")
+
+            total_us = 0
+            for module, cumulative_us, depth in self.parse_importtime(process.stderr):
+                if depth == 0:
+                    total_us += cumulative_us
+                cumulative_by_module.setdefault(module, []).append(cumulative_us)
+            import_times.append(total_us / 1000)
+
+        wall_median = statistics.median(wall_times)
+        self.stdout.write(f"Démarrages mesurés : {options['runs']} ({code})")
+        self.stdout.write(f"Temps total médian : {wall_median:.1f} ms (min {min(wall_times):.1f} ms, max {max(wall_times):.1f} ms)")
+        self.stdout.write(f"Temps d'import médian : {statistics.median(import_times):.1f} ms")
+        self.stdout.write("Modules les plus coûteux (cumulé, médiane) :")
+        ranking = sorted(
+            ((statistics.median(values) / 1000, module) for module, values in cumulative_by_module.items()),
+            reverse=True
+        )
+        for milliseconds, module in ranking[:options['top']]:
+            self.stdout.write(f"  {milliseconds:8.1f} ms  {module}")
+
+        if options['max_ms'] is not None and wall_median > options['max_ms']:
+            raise CommandError(f"Démarrage trop lent : {wall_median:.1f} ms > {options['max_ms']:.1f} ms")
+
+    @staticmethod
+    def parse_importtime(output):
+        """
+        Analyse la sortie de -X importtime.
+
+        Returns:
+            list: Tuples (module, temps cumulé en µs, profondeur d'import)
+        """
+        entries = []
+        for line in output.splitlines():
+            if not line.startswith('import time:'):
+                continue
+            parts = line[len('import time:'):].split('|')
+            if len(parts) != 3 or not parts[1].strip().isdigit():
+                continue
+            name = parts[2].rstrip()
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            entries.append((name.strip(), int(parts[1]), depth))
+        return entries
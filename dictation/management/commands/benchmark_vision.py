@@ -0,0 +1,115 @@
+import base64
+import difflib
+import statistics
+import time
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+
+IMAGE_SUFFIXES = {'.jpg', '.jpeg', '.png', '.webp'}
+
+class Command(BaseCommand):
+    help = (
+        "Compare, sur un jeu de photos de référence, la taille des images envoyées à "
+        "Gemini et la qualité du texte extrait selon les réglages de normalisation. "
+        "Chaque image <nom>.jpg doit être accompagnée du texte attendu dans <nom>.txt."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixtures', help="Dossier contenant les images et les textes attendus")
+        parser.add_argument('--max-edges', default='1024,1600,2048', help="Plus grands côtés testés (pixels)")
+        parser.add_argument('--formats', default='JPEG,WEBP', help="Formats d'encodage testés")
+        parser.add_argument('--qualities', default='70,80,90', help="Qualités d'encodage testées")
+        parser.add_argument(
+            '--no-original',
+            action='store_true',
+            help="Ne pas mesurer l'envoi de l'image d'origine, sans normalisation"
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help="Mesurer uniquement les tailles et la durée de normalisation, sans appeler Gemini"
+        )
+
+    def handle(self, *args, **options):
+        from dictation.images import detect_image_mime_type, normalize_image_for_vision
+
+        fixtures = self.load_fixtures(Path(options['fixtures']))
+        configs = [] if options['no_original'] else [None]
+        configs += [
+            (int(edge), image_format.strip().upper(), int(quality))
+            for edge in options['max_edges'].split(',')
+            for image_format in options['formats'].split(',')
+            for quality in options['qualities'].split(',')
+        ]
+
+        self.stdout.write(f"{len(fixtures)} image(s), {len(configs)} réglage(s)")
+        self.stdout.write(
+            f"{'réglage':<20} {'taille moy.':>12} {'gain':>7} {'normalisation':>14} "
+            f"{'latence':>9} {'caractères':>11} {'mots':>7}"
+        )
+        original_size = statistics.mean(len(image_bytes) for _, image_bytes, _ in fixtures)
+        for config in configs:
+            sizes, prepare_ms, latencies, char_scores, word_scores = [], [], [], [], []
+            for path, image_bytes, expected in fixtures:
+                started = time.perf_counter()
+                if config is None:
+                    with open(path, 'rb') as fileobj:
+                        mime_type = detect_image_mime_type(fileobj)
+                    payload_bytes = image_bytes
+                else:
+                    payload_bytes, mime_type, _ = normalize_image_for_vision(image_bytes, *config)
+                prepare_ms.append((time.perf_counter() - started) * 1000)
+                sizes.append(len(payload_bytes))
+                if options['dry_run']:
+                    continue
+                started = time.perf_counter()
+                extracted = self.extract(payload_bytes, mime_type)
+                latencies.append((time.perf_counter() - started) * 1000)
+                char_score, word_score = self.similarity(expected, extracted)
+                char_scores.append(char_score)
+                word_scores.append(word_score)
+
+            label = 'original' if config is None else f"{config[1]} {config[0]}px q{config[2]}"
+            size = statistics.mean(sizes)
+            line = (
+                f"{label:<20} {size / 1024:>9.1f} Ko {(1 - size / original_size) * 100:>6.1f}% "
+                f"{statistics.mean(prepare_ms):>11.1f} ms"
+            )
+            if latencies:
+                line += (
+                    f" {statistics.median(latencies):>6.0f} ms {statistics.mean(char_scores) * 100:>10.1f}%"
+                    f" {statistics.mean(word_scores) * 100:>6.1f}%"
+                )
+            self.stdout.write(line)
+
+    def load_fixtures(self, directory):
+        if not directory.is_dir():
+            raise CommandError(f"Dossier introuvable : {directory}")
+        fixtures = []
+        for path in sorted(directory.iterdir()):
+            if path.suffix.lower() not in IMAGE_SUFFIXES:
+                continue
+            expected_path = path.with_suffix('.txt')
+            if not expected_path.exists():
+                self.stderr.write(f"Texte attendu manquant pour {path.name}, image ignorée")
+                continue
+            fixtures.append((path, path.read_bytes(), expected_path.read_text(encoding='utf-8')))
+        if not fixtures:
+            raise CommandError(f"Aucune image accompagnée de son texte attendu dans {directory}")
+        return fixtures
+
+    def extract(self, image_bytes, mime_type):
+        # Appel direct, sans passer par le cache d'extraction
+        from dictation import gemini
+        from dictation.prompts import build_handwriting_payload
+        payload = build_handwriting_payload(base64.b64encode(image_bytes).decode('ascii'), mime_type)
+        return gemini.extract_text(gemini.generate_content(payload)).strip()
+
+    def similarity(self, expected, extracted):
+        """Similarité (0 à 1) au niveau des caractères et des mots, casse et espaces ignorés."""
+        from dictation.services import clean_text_for_comparison
+        expected = clean_text_for_comparison(expected)
+        extracted = clean_text_for_comparison(extracted)
+        char_score = difflib.SequenceMatcher(None, expected, extracted, autojunk=False).ratio()
+        word_score = difflib.SequenceMatcher(None, expected.split(), extracted.split(), autojunk=False).ratio()
+        return char_score, word_score
@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictation', '0003_dictationcorrection'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dictation',
+            name='metadata',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:39
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def backfill_dictation_aggregates(apps, schema_editor):
+    Dictation = apps.get_model('dictation', 'Dictation')
+    DictationAttempt = apps.get_model('dictation', 'DictationAttempt')
+    totals = (
+        DictationAttempt.objects.order_by()
+        .values('dictation_id')
+        .annotate(
+            attempts=Count('id'),
+            scored=Count('score'),
+            score_sum=Sum('score'),
+            score_max=Max('score'),
+        )
+    )
+    for row in totals:
+        Dictation.objects.filter(pk=row['dictation_id']).update(
+            attempts_count=row['attempts'],
+            scored_attempts_count=row['scored'],
+            total_score=row['score_sum'] or 0,
+            best_score=row['score_max'] or 0,
+        )
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictation', '0004_dictation_metadata'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='dictation',
+            options={'ordering': ['-created_at']},
+        ),
+        migrations.AddField(
+            model_name='dictation',
+            name='attempts_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dictation',
+            name='best_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dictation',
+            name='scored_attempts_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dictation',
+            name='total_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='dictation',
+            index=models.Index(fields=['is_public', '-created_at', '-id'], name='dictation_public_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dictationattempt',
+            index=models.Index(fields=['dictation', '-created_at'], name='attempt_dictation_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dictationattempt',
+            index=models.Index(fields=['user', '-created_at'], name='attempt_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dictationcorrection',
+            index=models.Index(fields=['dictation', '-created_at'], name='correction_dict_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dictationcorrection',
+            index=models.Index(fields=['user', '-created_at'], name='correction_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprogress',
+            index=models.Index(fields=['user', '-last_attempt'], name='progress_user_recent_idx'),
+        ),
+        migrations.RunPython(backfill_dictation_aggregates, migrations.RunPython.noop),
+    ]
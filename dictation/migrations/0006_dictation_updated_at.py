@@ -0,0 +1,18 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictation', '0005_indexes_and_dictation_aggregates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dictation',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictation', '0006_dictation_updated_at'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dictation',
+            name='pool_bucket',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='dictation',
+            index=models.Index(condition=models.Q(('pool_bucket__isnull', False)), fields=['pool_bucket', 'created_at'], name='dictation_pool_idx'),
+        ),
+    ]
@@ -0,0 +1,140 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:56
+
+import json
+import re
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Copie figée de dictation.errors au moment de la migration : la reprise ne doit
+# pas changer si la classification évolue ou si le module est déplacé.
+ERROR_CATEGORY_KEYWORDS = [
+    ('ponctuation', ('ponctuation', 'virgule')),
+    ('mot manquant', ('manquant', 'oubli', 'omis', 'omission')),
+    ('accord', ('accord',)),
+    ('conjugaison', ('conjugaison', 'conjugu', 'temps du verbe', 'participe')),
+    ('grammaire', ('grammaire', 'grammatical', 'construction', 'syntaxe', 'sémantique')),
+    ('orthographe', ('orthographe', 'accent', 'homophone', 'majuscule')),
+]
+ERROR_CATEGORIES = [category for category, _ in ERROR_CATEGORY_KEYWORDS] + ['autre']
+
+WORD_PATTERN = re.compile(r"\w+(?:['’]\w+)*")
+
+LABEL_PATTERN = re.compile(r"^[^:.;,!?(]*")
+LABEL_MAX_WORDS = 8
+CATEGORY_BY_KEYWORD = {
+    keyword: category for category, keywords in ERROR_CATEGORY_KEYWORDS for keyword in keywords
+}
+KEYWORD_PATTERN = re.compile(
+    r"\b(" + '|'.join(re.escape(keyword) for keyword in sorted(CATEGORY_BY_KEYWORD, key=len, reverse=True)) + ")"
+)
+
+
+def classify_error(error):
+    """Catégorie fournie si elle est connue, sinon celle que désigne l'intitulé de la description."""
+    category = (error.get('category') or '').strip().lower()
+    if category in ERROR_CATEGORIES:
+        return category
+    description = (error.get('description') or '').strip().lower()
+    label = ' '.join(LABEL_PATTERN.match(description).group().split()[:LABEL_MAX_WORDS])
+    match = KEYWORD_PATTERN.search(label)
+    return CATEGORY_BY_KEYWORD[match.group(1)] if match else 'autre'
+
+
+def structure_errors(errors, dictation_text):
+    """Classe les erreurs et les situe dans la dictée (indice du premier mot de la correction)."""
+    words = WORD_PATTERN.findall(dictation_text.lower())
+    cursor = 0
+    structured = []
+    for error in errors or []:
+        if not isinstance(error, dict):
+            continue
+        correction = (error.get('correction') or '').strip()
+        position = None
+        correction_words = WORD_PATTERN.findall(correction.lower())
+        if correction_words:
+            target = correction_words[0]
+            for start in (cursor, 0):
+                try:
+                    position = words.index(target, start)
+                    break
+                except ValueError:
+                    continue
+            if position is not None:
+                cursor = position + 1
+        structured.append({
+            'word': (error.get('word') or '').strip(),
+            'correction': correction,
+            'category': classify_error(error),
+            'position': position,
+            'description': error.get('description') or '',
+        })
+    return structured
+
+
+def backfill_dictation_errors(apps, schema_editor):
+    """
+    Reprend les corrections stockées en JSON dans DictationAttempt.feedback :
+    erreurs structurées dans mistakes et DictationError, conseil dans feedback.
+    """
+    DictationAttempt = apps.get_model('dictation', 'DictationAttempt')
+    DictationError = apps.get_model('dictation', 'DictationError')
+    attempts = (
+        DictationAttempt.objects.filter(feedback__startswith='{')
+        .select_related('dictation')
+        .iterator(chunk_size=500)
+    )
+    for attempt in attempts:
+        try:
+            result = json.loads(attempt.feedback)
+        except ValueError:
+            continue
+        if not isinstance(result, dict) or not isinstance(result.get('errors'), list):
+            continue
+        mistakes = structure_errors(result['errors'], attempt.dictation.text)
+        advice = result.get('pedagogical_advice')
+        attempt.mistakes = mistakes
+        attempt.feedback = advice.get('summary', '') if isinstance(advice, dict) else ''
+        attempt.save(update_fields=['mistakes', 'feedback'])
+        DictationError.objects.bulk_create([
+            DictationError(
+                attempt=attempt,
+                dictation_id=attempt.dictation_id,
+                user_id=attempt.user_id,
+                word=mistake['word'][:255],
+                correction=mistake['correction'][:255],
+                category=mistake['category'],
+                position=mistake['position'],
+            )
+            for mistake in mistakes
+        ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictation', '0007_dictation_pool_bucket'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DictationError',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('word', models.CharField(blank=True, max_length=255)),
+                ('correction', models.CharField(blank=True, max_length=255)),
+                ('category', models.CharField(choices=[('ponctuation', 'Ponctuation'), ('mot manquant', 'Mot manquant'), ('accord', 'Accord'), ('conjugaison', 'Conjugaison'), ('grammaire', 'Grammaire'), ('orthographe', 'Orthographe'), ('autre', 'Autre')], default='autre', max_length=20)),
+                ('position', models.PositiveIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('attempt', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='errors', to='dictation.dictationattempt')),
+                ('dictation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='errors', to='dictation.dictation')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='dictation_errors', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['dictation', 'correction'], name='error_dictation_word_idx'), models.Index(fields=['dictation', 'category'], name='error_dictation_category_idx'), models.Index(fields=['user', 'category'], name='error_user_category_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_dictation_errors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,99 @@
+# Generated by Django 5.0.2 on 2026-10-18 01:58
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Sum
+
+
+def backfill_user_rollups(apps, schema_editor):
+    """Calcule une fois les agrégats par utilisateur à partir des tentatives existantes."""
+    DictationAttempt = apps.get_model('dictation', 'DictationAttempt')
+    DictationError = apps.get_model('dictation', 'DictationError')
+    UserProfile = apps.get_model('dictation', 'UserProfile')
+    UserProgress = apps.get_model('dictation', 'UserProgress')
+    UserErrorStat = apps.get_model('dictation', 'UserErrorStat')
+    attempts = DictationAttempt.objects.filter(user__isnull=False).order_by()
+
+    mastered = {}
+    rows = attempts.values('user', 'dictation').annotate(
+        count=Count('id'), best=Max('score'), last=Max('created_at')
+    )
+    for row in rows:
+        is_mastered = (row['best'] or 0) >= settings.DICTATION_MASTERY_SCORE
+        UserProgress.objects.update_or_create(
+            user_id=row['user'],
+            dictation_id=row['dictation'],
+            defaults={
+                'attempts_count': row['count'],
+                'best_score': row['best'] or 0,
+                'last_attempt': row['last'],
+                'is_mastered': is_mastered,
+            }
+        )
+        mastered[row['user']] = mastered.get(row['user'], 0) + is_mastered
+
+    rows = attempts.values('user').annotate(
+        count=Count('id'), scored=Count('score'), total=Sum('score'), best=Max('score')
+    )
+    for row in rows:
+        UserProfile.objects.update_or_create(
+            user_id=row['user'],
+            defaults={
+                'total_attempts': row['count'],
+                'scored_attempts_count': row['scored'],
+                'total_score': row['total'] or 0,
+                'best_score': row['best'] or 0,
+                'mastered_count': mastered.get(row['user'], 0),
+            }
+        )
+
+    rows = DictationError.objects.filter(user__isnull=False).order_by().values('user', 'category').annotate(count=Count('id'))
+    for row in rows:
+        UserErrorStat.objects.update_or_create(
+            user_id=row['user'], category=row['category'], defaults={'count': row['count']}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dictation', '0008_dictation_errors'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='best_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='mastered_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='scored_attempts_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='total_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.CreateModel(
+            name='UserErrorStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('ponctuation', 'Ponctuation'), ('mot manquant', 'Mot manquant'), ('accord', 'Accord'), ('conjugaison', 'Conjugaison'), ('grammaire', 'Grammaire'), ('orthographe', 'Orthographe'), ('autre', 'Autre')], max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='error_stats', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'category')},
+            },
+        ),
+        migrations.RunPython(backfill_user_rollups, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,7 @@
+from django.conf import settings
 from django.db import models
 from django.utils.translation import gettext_lazy as _
+from .errors import ERROR_CATEGORIES
 
 class Dictation(models.Model):
     DIFFICULTY_CHOICES = [
@@ -12,19 +14,44 @@ class Dictation(models.Model):
     text = models.TextField()
     difficulty = models.CharField(max_length=10, choices=DIFFICULTY_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     audio_file = models.FileField(upload_to='dictations/', null=True, blank=True)
     is_public = models.BooleanField(default=True)
     category = models.CharField(max_length=50, blank=True)
     tags = models.CharField(max_length=200, blank=True)  # Stocké comme une chaîne séparée par des virgules
+    metadata = models.JSONField(null=True, blank=True)  # Réponse enrichie de Gemini (vocabulaire rare, score de difficulté...)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, related_name='created_dictations')
+    pool_bucket = models.CharField(max_length=64, null=True, blank=True)  # Renseigné tant que la dictée attend dans le pool
+
+    # Agrégats maintenus à chaque tentative (voir stats.record_attempts)
+    attempts_count = models.IntegerField(default=0)
+    scored_attempts_count = models.IntegerField(default=0)
+    total_score = models.FloatField(default=0)
+    best_score = models.FloatField(default=0)
 
     def __str__(self):
         return self.title
 
+    @property
+    def average_score(self):
+        if not self.scored_attempts_count:
+            return None
+        return self.total_score / self.scored_attempts_count
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['is_public', '-created_at', '-id'], name='dictation_public_recent_idx'),
+            models.Index(
+                fields=['pool_bucket', 'created_at'],
+                name='dictation_pool_idx',
+                condition=models.Q(pool_bucket__isnull=False)
+            ),
+        ]
 
 class DictationAttempt(models.Model):
     dictation = models.ForeignKey(Dictation, on_delete=models.CASCADE, related_name='attempts')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='attempts')
     user_text = models.TextField()
     score = models.FloatField(null=True, blank=True)
     feedback = models.TextField(blank=True, null=True)
@@ -38,3 +65,124 @@ class DictationAttempt(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['dictation', '-created_at'], name='attempt_dictation_recent_idx'),
+            models.Index(fields=['user', '-created_at'], name='attempt_user_recent_idx'),
+        ]
+
+class DictationError(models.Model):
+    """Erreur relevée lors de la correction d'une tentative, une ligne par erreur."""
+    CATEGORY_CHOICES = [(category, category.capitalize()) for category in ERROR_CATEGORIES]
+
+    attempt = models.ForeignKey(DictationAttempt, on_delete=models.CASCADE, related_name='errors')
+    # Dénormalisés depuis la tentative pour agréger sans jointure
+    dictation = models.ForeignKey(Dictation, on_delete=models.CASCADE, related_name='errors')
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True, related_name='dictation_errors')
+    word = models.CharField(max_length=255, blank=True)  # Ce qu'a écrit l'élève
+    correction = models.CharField(max_length=255, blank=True)  # Ce qu'il fallait écrire
+    category = models.CharField(max_length=20, choices=CATEGORY_CHOICES, default='autre')
+    position = models.PositiveIntegerField(null=True, blank=True)  # Indice du mot dans la dictée
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.word} -> {self.correction} ({self.category})"
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['dictation', 'correction'], name='error_dictation_word_idx'),
+            models.Index(fields=['dictation', 'category'], name='error_dictation_category_idx'),
+            models.Index(fields=['user', 'category'], name='error_user_category_idx'),
+        ]
+
+class UserProfile(models.Model):
+    LEVEL_CHOICES = [
+        ('beginner', 'Débutant'),
+        ('intermediate', 'Intermédiaire'),
+        ('advanced', 'Avancé'),
+        ('expert', 'Expert'),
+    ]
+
+    user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='profile')
+    level = models.CharField(max_length=20, choices=LEVEL_CHOICES, default='beginner')
+    # Agrégats maintenus à chaque tentative (voir stats.record_attempts)
+    total_score = models.FloatField(default=0)
+    total_attempts = models.IntegerField(default=0)
+    scored_attempts_count = models.IntegerField(default=0)
+    best_score = models.FloatField(default=0)
+    mastered_count = models.IntegerField(default=0)  # Dictées maîtrisées (UserProgress.is_mastered)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_active = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Profile of {self.user}"
+
+    @property
+    def average_score(self):
+        if not self.scored_attempts_count:
+            return None
+        return self.total_score / self.scored_attempts_count
+
+class UserProgress(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='progress')
+    dictation = models.ForeignKey(Dictation, on_delete=models.CASCADE, related_name='user_progress')
+    best_score = models.FloatField(default=0)
+    attempts_count = models.IntegerField(default=0)
+    last_attempt = models.DateTimeField(null=True, blank=True)
+    is_mastered = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"Progress of {self.user} on {self.dictation.title}"
+
+    class Meta:
+        unique_together = [('user', 'dictation')]
+        indexes = [
+            models.Index(fields=['user', '-last_attempt'], name='progress_user_recent_idx'),
+        ]
+
+class UserErrorStat(models.Model):
+    """Nombre d'erreurs d'un utilisateur par catégorie, maintenu à chaque tentative."""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='error_stats')
+    category = models.CharField(max_length=20, choices=DictationError.CATEGORY_CHOICES)
+    count = models.IntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.user} : {self.count} {self.category}"
+
+    class Meta:
+        unique_together = [('user', 'category')]
+
+class UserAchievement(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='achievements')
+    title = models.CharField(max_length=100)
+    description = models.TextField()
+    achieved_at = models.DateTimeField(auto_now_add=True)
+    badge = models.ImageField(upload_to='achievements/', null=True, blank=True)
+
+    def __str__(self):
+        return self.title
+
+class UserFeedback(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='feedbacks')
+    dictation = models.ForeignKey(Dictation, on_delete=models.CASCADE, related_name='feedbacks')
+    rating = models.IntegerField(choices=[(i, i) for i in range(1, 6)])
+    comment = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        unique_together = [('user', 'dictation')]
+
+class DictationCorrection(models.Model):
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='dictation_corrections')
+    dictation = models.ForeignKey(Dictation, on_delete=models.CASCADE, related_name='corrections')
+    user_text = models.TextField()
+    original_text = models.TextField()
+    score = models.FloatField(default=0)
+    error_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['dictation', '-created_at'], name='correction_dict_recent_idx'),
+            models.Index(fields=['user', '-created_at'], name='correction_user_recent_idx'),
+        ]
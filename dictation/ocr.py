@@ -0,0 +1,145 @@
+"""
+Reconnaissance de texte (Tesseract) hors du thread de la requête.
+
+Les images sont prétraitées (orientation EXIF, niveaux de gris, réduction,
+binarisation adaptative) puis passées à Tesseract dans un pool de processus
+persistant. Le pool utilise 'spawn' : les workers ne partagent ni les
+connexions ni les threads du processus Django.
+"""
+import io
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+# Rayon de la moyenne locale et écart (niveaux de gris) de la binarisation adaptative
+BINARIZE_RADIUS = 15
+BINARIZE_OFFSET = 10
+
+_pool = None
+_pool_lock = threading.Lock()
+
+class OCRError(Exception):
+    """Échec de l'OCR dans un worker (Tesseract absent, image illisible, ...)."""
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 1)
+
+def preprocess_image(image, max_dimension):
+    """
+    Prépare une photo pour Tesseract.
+
+    Args:
+        image (PIL.Image.Image): Image ouverte mais pas encore décodée
+        max_dimension (int): Plus grand côté conservé, en pixels
+
+    Returns:
+        tuple: (image binarisée, durées de chaque étape en millisecondes)
+    """
+    from PIL import Image, ImageChops, ImageFilter, ImageOps
+
+    timings = {}
+    started = time.perf_counter()
+    # Les JPEG sont décodés directement à l'échelle 1/2, 1/4 ou 1/8 la plus proche
+    width, height = image.size
+    scale = min(1.0, max_dimension / max(width, height))
+    image.draft('L', (int(width * scale), int(height * scale)))
+    image.load()
+    timings['decode'] = _elapsed_ms(started)
+
+    started = time.perf_counter()
+    image = ImageOps.exif_transpose(image)
+    timings['orientation'] = _elapsed_ms(started)
+
+    started = time.perf_counter()
+    image = image.convert('L')
+    timings['grayscale'] = _elapsed_ms(started)
+
+    started = time.perf_counter()
+    if max(image.size) > max_dimension:
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+    timings['downscale'] = _elapsed_ms(started)
+
+    # Binarisation adaptative : un pixel est de l'encre s'il est nettement plus sombre
+    # que la moyenne de son voisinage, ce qui résiste aux ombres et à l'éclairage inégal
+    started = time.perf_counter()
+    local_mean = image.filter(ImageFilter.BoxBlur(BINARIZE_RADIUS))
+    darkness = ImageChops.subtract(local_mean, image)
+    image = darkness.point(lambda value: 0 if value > BINARIZE_OFFSET else 255, mode='1')
+    timings['binarize'] = _elapsed_ms(started)
+    return image, timings
+
+def run_ocr(image_bytes, max_dimension, lang):
+    """
+    Exécuté dans un worker du pool : prétraitement puis Tesseract.
+
+    Returns:
+        tuple: (texte extrait, durées de chaque étape en millisecondes)
+    """
+    from PIL import Image
+    import pytesseract
+
+    # Les exceptions de pytesseract ne se reconstruisent pas toutes après sérialisation
+    # vers le processus parent, ce qui mettrait le pool hors service
+    try:
+        image, timings = preprocess_image(Image.open(io.BytesIO(image_bytes)), max_dimension)
+        started = time.perf_counter()
+        text = pytesseract.image_to_string(image, lang=lang)
+        timings['ocr'] = _elapsed_ms(started)
+    except Exception as e:
+        raise OCRError(f"{type(e).__name__}: {str(e)}") from None
+    return text, timings
+
+def get_ocr_pool():
+    """Retourne le pool de processus OCR du processus courant, créé au premier appel."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ProcessPoolExecutor(
+                    max_workers=settings.OCR_MAX_WORKERS,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+    return _pool
+
+def _reset_ocr_pool(broken_pool):
+    global _pool
+    with _pool_lock:
+        if _pool is broken_pool:
+            _pool = None
+    broken_pool.shutdown(wait=False, cancel_futures=True)
+
+def extract_text_from_image(image_bytes):
+    """
+    Extrait le texte d'une image dans le pool OCR.
+
+    Returns:
+        tuple: (texte extrait, durées en millisecondes : étapes du worker, attente
+        dans le pool et total)
+
+    Raises:
+        OCRError: Si le prétraitement ou Tesseract échoue
+        concurrent.futures.TimeoutError: Si l'OCR dépasse OCR_TIMEOUT secondes
+    """
+    started = time.perf_counter()
+    pool = get_ocr_pool()
+    try:
+        future = pool.submit(run_ocr, image_bytes, settings.OCR_MAX_DIMENSION, settings.OCR_LANG)
+        text, timings = future.result(timeout=settings.OCR_TIMEOUT)
+    except BrokenProcessPool:
+        # Un worker a été tué (mémoire, signal) : le pool sera recréé à la prochaine demande
+        logger.error("Pool OCR hors service, il sera recréé")
+        _reset_ocr_pool(pool)
+        raise
+    timings['total'] = _elapsed_ms(started)
+    timings['queue'] = round(max(0.0, timings['total'] - sum(
+        value for key, value in timings.items() if key != 'total'
+    )), 1)
+    logger.info(f"OCR terminé en {timings['total']} ms : {timings}")
+    return text, timings
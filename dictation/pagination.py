@@ -0,0 +1,9 @@
+from rest_framework.pagination import CursorPagination
+
+class DictationCursorPagination(CursorPagination):
+    """
+    Pagination par curseur sur (created_at, id) : ni COUNT(*) ni OFFSET,
+    le coût d'une page ne dépend pas de la taille de la table.
+    """
+    page_size = 10
+    ordering = ('-created_at', '-id')
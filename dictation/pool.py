@@ -0,0 +1,168 @@
+import hashlib
+import json
+import logging
+import unicodedata
+import redis
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from .cache import get_redis
+from .models import Dictation
+from .services import build_dictation_payload
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+# Paramètres qui déterminent le compartiment du pool, avec leur valeur par défaut
+POOL_BUCKET_DEFAULTS = {
+    'niveau': 'facile',
+    'longueurTexte': 'moyenne',
+    'typeContenu': 'narratif',
+    'sujet': 'la vie au village',
+}
+
+METRICS_KEY = 'dictation:pool:metrics'
+# Paramètres du premier défaut de cache de chaque compartiment non configuré
+MISSED_PARAMS_KEY = 'dictation:pool:missed-params'
+PENDING_KEY_PREFIX = 'dictation:pool:pending:'
+
+def _normalize(value):
+    value = ' '.join(str(value).split()).lower()
+    decomposed = unicodedata.normalize('NFD', value)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+def pool_bucket_key(params):
+    """
+    Calcule le compartiment du pool d'une demande de génération à partir de
+    niveau, longueurTexte, typeContenu et sujet normalisés. Les autres paramètres
+    (âge, objectif...) ne font qu'affiner le prompt et sont ignorés ici.
+    """
+    normalized = {
+        field: _normalize(params.get(field) or default)
+        for field, default in POOL_BUCKET_DEFAULTS.items()
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode('utf-8')).hexdigest()[:40]
+
+def _record_metric(bucket, outcome):
+    try:
+        get_redis().hincrby(METRICS_KEY, f"{bucket}:{outcome}", 1)
+    except redis.RedisError as e:
+        logger.warning(f"Écriture des métriques du pool impossible : {str(e)}")
+
+def claim_pooled_dictation(params):
+    """
+    Retire du pool une dictée prête pour ces paramètres et la publie.
+
+    Returns:
+        dict: La structure renvoyée par generate_dictation, ou None si le pool est vide
+    """
+    bucket = pool_bucket_key(params)
+    with transaction.atomic():
+        dictation = (
+            Dictation.objects.select_for_update(skip_locked=True)
+            .filter(pool_bucket=bucket)
+            .order_by('created_at')
+            .first()
+        )
+        if dictation is not None:
+            dictation.pool_bucket = None
+            dictation.is_public = True
+            dictation.created_at = timezone.now()
+            dictation.save(update_fields=['pool_bucket', 'is_public', 'created_at', 'updated_at'])
+
+    if dictation is None:
+        _record_metric(bucket, 'misses')
+        try:
+            get_redis().hsetnx(MISSED_PARAMS_KEY, bucket, json.dumps(params))
+        except redis.RedisError:
+            pass
+        return None
+
+    _record_metric(bucket, 'hits')
+    metadata = dictation.metadata or {}
+    logger.info(f"Dictée {dictation.id} servie depuis le pool ({bucket[:12]})")
+    return build_dictation_payload(dictation, metadata, metadata.get('audio_url'))
+
+def available_by_bucket():
+    """Nombre de dictées prêtes par compartiment (une seule requête GROUP BY)."""
+    rows = (
+        Dictation.objects.filter(pool_bucket__isnull=False)
+        .order_by()
+        .values('pool_bucket')
+        .annotate(count=Count('id'))
+    )
+    return {row['pool_bucket']: row['count'] for row in rows}
+
+def pool_metrics():
+    """
+    Retourne, par compartiment, les succès et défauts du pool et le stock disponible.
+    """
+    try:
+        raw = get_redis().hgetall(METRICS_KEY)
+    except redis.RedisError as e:
+        logger.warning(f"Lecture des métriques du pool impossible : {str(e)}")
+        raw = {}
+    metrics = {}
+    for field, value in raw.items():
+        bucket, outcome = field.decode().rsplit(':', 1)
+        metrics.setdefault(bucket, {'hits': 0, 'misses': 0, 'available': 0})[outcome] = int(value)
+    for bucket, count in available_by_bucket().items():
+        metrics.setdefault(bucket, {'hits': 0, 'misses': 0, 'available': 0})['available'] = count
+    return metrics
+
+def buckets_to_watch():
+    """
+    Compartiments entretenus par le pool : ceux de DICTATION_POOL_BUCKETS, plus les
+    compartiments les plus demandés parmi les défauts de cache.
+
+    Returns:
+        dict: compartiment -> paramètres de génération
+    """
+    buckets = {pool_bucket_key(params): params for params in settings.DICTATION_POOL_BUCKETS}
+    try:
+        client = get_redis()
+        missed_params = client.hgetall(MISSED_PARAMS_KEY)
+        misses = {
+            bucket.decode(): int(client.hget(METRICS_KEY, f"{bucket.decode()}:misses") or 0)
+            for bucket in missed_params
+        }
+    except redis.RedisError as e:
+        logger.warning(f"Lecture des défauts du pool impossible : {str(e)}")
+        return buckets
+    popular = sorted(
+        (bucket for bucket, count in misses.items() if count >= settings.DICTATION_POOL_MIN_MISSES),
+        key=lambda bucket: misses[bucket],
+        reverse=True
+    )
+    for bucket in popular[:settings.DICTATION_POOL_MAX_LEARNED_BUCKETS]:
+        buckets.setdefault(bucket, json.loads(missed_params[bucket.encode()]))
+    return buckets
+
+def reserve_refills(bucket, available):
+    """
+    Calcule combien de générations lancer pour ce compartiment et les marque en cours.
+    Rien n'est lancé tant que le stock (prêt + en cours) reste au-dessus du seuil bas.
+    """
+    pending_key = PENDING_KEY_PREFIX + bucket
+    client = get_redis()
+    pending = int(client.get(pending_key) or 0)
+    if available + pending >= settings.DICTATION_POOL_LOW_WATERMARK:
+        return 0
+    missing = settings.DICTATION_POOL_TARGET_SIZE - available - pending
+    if missing > 0:
+        pipe = client.pipeline()
+        pipe.incrby(pending_key, missing)
+        # Filet de sécurité si une tâche de génération disparaît sans décrémenter
+        pipe.expire(pending_key, settings.DICTATION_POOL_REFILL_INTERVAL * 4)
+        pipe.execute()
+    return max(missing, 0)
+
+def release_refill(bucket):
+    """Décrémente le compteur de générations en cours d'un compartiment."""
+    try:
+        client = get_redis()
+        if client.decr(PENDING_KEY_PREFIX + bucket) < 0:
+            client.delete(PENDING_KEY_PREFIX + bucket)
+    except redis.RedisError as e:
+        logger.warning(f"Mise à jour du pool impossible : {str(e)}")
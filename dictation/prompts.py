@@ -1,28 +1,372 @@
-def generate_dictation_prompt(params):
+"""
+Registre des prompts envoyés aux LLM, au format de requête de Gemini (traduit
+pour les autres fournisseurs par providers.py).
+
+Chaque prompt sépare sa partie fixe (rôle, consignes, format de réponse),
+construite une seule fois au chargement du module et envoyée en
+systemInstruction, de sa partie variable (textes, paramètres de l'élève),
+seule formatée à chaque requête. La taille de la réponse est plafonnée par
+maxOutputTokens, ajusté à la longueur du texte à reproduire. Les prompts qui
+attendent du JSON déclarent son schéma (responseSchema) : Gemini renvoie
+alors un objet JSON seul, validé par structured.py.
+"""
+import logging
+from django.conf import settings
+from .errors import ERROR_CATEGORIES
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+def estimate_tokens(text: str) -> int:
+    """Estimation grossière du nombre de tokens d'un texte français (~4 caractères par token)."""
+    return len(text) // 4 + 1
+
+class PromptTemplate:
     """
-    Génère un prompt pour l'API Gemini qui créera une dictée adaptée aux paramètres fournis.
+    Prompt précompilé : consigne système fixe et gabarit (str.format) de la partie
+    variable.
+
+    Args:
+        name (str): Nom du prompt dans le registre
+        system_instruction (str): Partie fixe, envoyée en systemInstruction
+        template (str): Gabarit du message de l'utilisateur
+        max_output_tokens (int): Plafond par défaut de la réponse
+        response_schema (dict, optional): Schéma de la réponse JSON attendue
     """
-    prompt = f"""Crée une dictée en français avec les caractéristiques suivantes :
-- Niveau : {params.get('niveau', 'moyen')}
-- Âge : {params.get('age', '15')} ans
-- Niveau scolaire : {params.get('niveauScolaire', 'Étudiant')}
-- Objectif d'apprentissage : {params.get('objectifApprentissage', 'accord')}
-- Difficultés spécifiques : {params.get('difficultesSpecifiques', 'homophone')}
-- Temps disponible : {params.get('tempsDisponible', '15')} minutes
-- Sujet : {params.get('sujet', 'animaux')}
-- Longueur du texte : {params.get('longueurTexte', 'moyen')}
-- Type de contenu : {params.get('typeContenu', 'narratif')}
-- Vitesse de lecture : {params.get('vitesseLecture', 'normale')}
-
-Instructions spécifiques :
-1. Crée UNIQUEMENT le texte de la dictée, sans introduction ni conclusion
-2. Le texte doit être cohérent et adapté au niveau spécifié
-3. Inclure les points grammaticaux demandés de manière naturelle
-4. Éviter les phrases trop longues ou complexes
-5. Utiliser un vocabulaire approprié au niveau scolaire
-6. Le texte doit être facilement dictable
-
-Format de réponse souhaité :
-[Texte de la dictée uniquement, sans numérotation ni marqueurs]"""
-
-    return prompt 
\ No newline at end of file
+
+    def __init__(self, name, system_instruction, template, max_output_tokens, response_schema=None):
+        self.name = name
+        self.system_instruction = system_instruction.strip()
+        self.template = template.strip()
+        self.max_output_tokens = max_output_tokens
+        self.response_schema = response_schema
+        self.system_tokens = estimate_tokens(self.system_instruction)
+        self._system_part = {"parts": [{"text": self.system_instruction}]}
+
+    def build_payload(self, parts=None, max_output_tokens=None, **values):
+        """
+        Construit la requête generateContent.
+
+        Args:
+            parts (list, optional): Parties ajoutées après le texte (image, ...)
+            max_output_tokens (int, optional): Plafond de la réponse, borné par
+                GEMINI_MAX_OUTPUT_TOKENS
+            **values: Valeurs du gabarit
+
+        Returns:
+            dict: Corps de la requête (systemInstruction, contents, generationConfig)
+        """
+        text = self.template.format(**values)
+        max_output_tokens = min(max_output_tokens or self.max_output_tokens, settings.GEMINI_MAX_OUTPUT_TOKENS)
+        logger.debug(
+            f"Prompt {self.name} : ~{self.system_tokens} tokens fixes, ~{estimate_tokens(text)} variables, "
+            f"réponse plafonnée à {max_output_tokens}"
+        )
+        generation_config = {"maxOutputTokens": max_output_tokens}
+        if self.response_schema:
+            generation_config.update(responseMimeType="application/json", responseSchema=self.response_schema)
+        return {
+            "systemInstruction": self._system_part,
+            "contents": [{"role": "user", "parts": [{"text": text}, *(parts or [])]}],
+            "generationConfig": generation_config,
+        }
+
+# Consignes de correction communes aux prompts individuel et groupé
+CORRECTION_RULES = f"""Ta mission est de :
+1. Comparer le texte de l'élève au texte original, non pas mot à mot, mais en tenant compte du **sens global**, du **contexte**, de la **syntaxe** et de la **logique grammaticale**.
+2. Ne pénalise pas toute la suite du texte si l'élève a juste oublié ou ajouté un mot. Continue l'analyse avec un **alignement intelligent**.
+3. Ignore les répétitions exactes de phrases. Ne les considère pas comme des fautes si elles suivent le sens dicté.
+4. Accepte certaines tournures francophones locales tant qu'elles restent grammaticalement correctes et cohérentes.
+5. Identifie uniquement les **vraies erreurs** (orthographe, conjugaison, accord, ponctuation, grammaire).
+6. Attribue une note sur 100 selon ce barème :
+   - Mot clairement manquant : -5 points
+   - Erreur d'orthographe : -2 points
+   - Erreur de grammaire ou d'accord : -3 points
+   - Erreur de ponctuation : -1 point
+   - Mauvaise construction ou confusion sémantique : -3 points
+    Ne cumule pas les fautes en cascade : une seule pénalité par erreur source.
+7. Reconstitue le texte **corrigé**, exactement comme dans la dictée originale, mais **sans les répétitions**.
+
+Pour chaque erreur, indique sa catégorie (category) parmi : {', '.join(ERROR_CATEGORIES)}, et fournis une description claire et pédagogique :
+- Le type d'erreur
+- La règle concernée
+- Un conseil pour éviter cette erreur
+Exemple : {{"word": "chie", "correction": "chien", "category": "orthographe", "description": "Erreur d'orthographe : 'chie' est incorrect. Conseil : attention aux noms communs terminés en -ien."}}
+
+Dans "pedagogical_advice", donne un résumé des erreurs fréquentes (summary), des conseils pratiques pour s'améliorer (tips) et des exercices simples à faire (exercises)."""
+
+CORRECTOR_ROLE = (
+    "Tu es un professeur de français expérimenté qui corrige les dictées d'élèves en Afrique "
+    "francophone (Burkina Faso en particulier). Tu fais une correction juste, logique et bienveillante. "
+    "Les textes qui te sont fournis sont nettoyés : sans casse ni espaces superflus."
+)
+
+CORRECTION_FORMAT = """{
+  "score": <note sur 100>,
+  "errors": [{"word": "...", "correction": "...", "category": "...", "description": "..."}],
+  "correction": "Texte corrigé sans fautes et sans répétitions",
+  "total_words": <nombre de mots dans le texte original>,
+  "error_count": <nombre d'erreurs réelles détectées>,
+  "pedagogical_advice": {"summary": "...", "tips": ["..."], "exercises": ["..."]}
+}"""
+
+def _string_list():
+    return {"type": "ARRAY", "items": {"type": "STRING"}}
+
+# Schémas des réponses JSON (sous-ensemble OpenAPI accepté par responseSchema)
+CORRECTION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "score": {"type": "INTEGER", "minimum": 0, "maximum": 100},
+        "errors": {
+            "type": "ARRAY",
+            "items": {
+                "type": "OBJECT",
+                "properties": {
+                    "word": {"type": "STRING"},
+                    "correction": {"type": "STRING"},
+                    "category": {"type": "STRING", "enum": ERROR_CATEGORIES},
+                    "description": {"type": "STRING"},
+                },
+                "required": ["word", "correction", "category", "description"],
+                "propertyOrdering": ["word", "correction", "category", "description"],
+            },
+        },
+        "correction": {"type": "STRING"},
+        "total_words": {"type": "INTEGER"},
+        "error_count": {"type": "INTEGER"},
+        "pedagogical_advice": {
+            "type": "OBJECT",
+            "properties": {
+                "summary": {"type": "STRING"},
+                "tips": _string_list(),
+                "exercises": _string_list(),
+            },
+            "required": ["summary", "tips", "exercises"],
+            "propertyOrdering": ["summary", "tips", "exercises"],
+        },
+    },
+    "required": ["score", "errors", "correction", "total_words", "error_count", "pedagogical_advice"],
+    "propertyOrdering": ["score", "errors", "correction", "total_words", "error_count", "pedagogical_advice"],
+}
+
+BATCH_CORRECTION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "corrections": {
+            "type": "ARRAY",
+            "items": {
+                **CORRECTION_SCHEMA,
+                "properties": {"copie": {"type": "INTEGER"}, **CORRECTION_SCHEMA["properties"]},
+                "required": ["copie", *CORRECTION_SCHEMA["required"]],
+                "propertyOrdering": ["copie", *CORRECTION_SCHEMA["propertyOrdering"]],
+            },
+        },
+    },
+    "required": ["corrections"],
+}
+
+GENERATION_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "title": {"type": "STRING"},
+        "text": {"type": "STRING"},
+        "difficulty": {"type": "STRING"},
+        "longueur_reelle": {"type": "STRING"},
+        "vocabulaire_rare": _string_list(),
+        "score_difficulte": {"type": "NUMBER", "minimum": 1, "maximum": 10},
+        "types_conjugaisons": _string_list(),
+        "accords_complexes": _string_list(),
+    },
+    "required": ["title", "text", "difficulty", "longueur_reelle", "vocabulaire_rare", "score_difficulte"],
+    "propertyOrdering": [
+        "title", "text", "difficulty", "longueur_reelle", "vocabulaire_rare",
+        "score_difficulte", "types_conjugaisons", "accords_complexes",
+    ],
+}
+
+CORRECTION_PROMPT = PromptTemplate(
+    'correction',
+    f"""{CORRECTOR_ROLE}
+
+{CORRECTION_RULES}
+
+Réponds uniquement avec un objet JSON strictement valide, sans texte autour, sans markdown ni commentaire :
+{CORRECTION_FORMAT}""",
+    """Texte ORIGINAL de la dictée :
+---
+{dictation_text}
+---
+
+Texte écrit par l'élève :
+---
+{user_text}
+---""",
+    max_output_tokens=2048,
+    response_schema=CORRECTION_SCHEMA,
+)
+
+BATCH_CORRECTION_PROMPT = PromptTemplate(
+    'batch_correction',
+    f"""{CORRECTOR_ROLE}
+Tu reçois plusieurs copies d'une même dictée, à corriger chacune indépendamment des autres.
+
+{CORRECTION_RULES}
+
+Réponds uniquement avec un objet JSON strictement valide, sans texte autour ni markdown, contenant exactement une correction par copie, dans l'ordre :
+{{"corrections": [{{"copie": <numéro de la copie>, ...correction de la copie...}}]}}
+où chaque correction a la forme :
+{CORRECTION_FORMAT}""",
+    """Texte ORIGINAL de la dictée :
+---
+{dictation_text}
+---
+
+{count} copies d'élèves :
+
+{copies}""",
+    max_output_tokens=8192,
+    response_schema=BATCH_CORRECTION_SCHEMA,
+)
+
+GENERATION_PROMPT = PromptTemplate(
+    'generation',
+    """Tu es un professeur de français expert, spécialisé dans la création de dictées pédagogiques culturelles pour des élèves burkinabè. Tu dois générer une dictée adaptée à un profil d'élève donné, sous forme d'un objet JSON enrichi, sans aucun retour à la ligne, balise ou symbole de formatage. Le texte doit être 100 % lisible et naturel.
+
+## Contraintes de création
+1. Respecte strictement le sujet imposé.
+2. La longueur réelle du texte doit correspondre à :
+   - Court : 3 à 4 phrases
+   - Moyenne : 6 à 8 phrases
+   - Long : 10 à 12 phrases ou plus
+3. Chaque phrase de plus de 10 mots doit être répétée 3 fois, les plus courtes, 2 fois, naturellement.
+4. Utilise un vocabulaire soutenu, culturellement situé (Burkina Faso), et évite toute simplification abusive.
+5. Intègre au moins 3 mots rares, peu utilisés ou typiques du terroir burkinabè. Pas de glossaire.
+6. Si demandé, inclure des conjugaisons complexes (imparfait, passé simple, conditionnel, etc.) et des accords grammaticaux exigeants.
+7. Ne retourne AUCUN astérisque, tiret, retour à la ligne, ni balise HTML ou Markdown.
+8. Retourne un objet JSON enrichi selon le format ci-dessous.
+
+## Format de réponse JSON obligatoire
+{
+  "title": "Un titre original et évocateur du thème choisi",
+  "text": "Texte intégral de la dictée avec répétitions naturelles intégrées",
+  "difficulty": "<niveau de difficulté demandé>",
+  "longueur_reelle": "<longueur souhaitée>",
+  "vocabulaire_rare": ["mot1", "mot2", "mot3"],
+  "score_difficulte": un score entre 1 et 10 basé sur la richesse lexicale, syntaxique et les pièges orthographiques,
+  "types_conjugaisons": ["passé simple", "imparfait", "futur"]  // si conjugaisons difficiles demandées,
+  "accords_complexes": ["accord sujet-verbe inversé", "participe passé avec avoir"]  // si accords grammaticaux demandés
+}""",
+    """## Profil de l'élève
+- Âge : {age} ans
+- Niveau scolaire : {niveau_scolaire}
+- Objectif d'apprentissage : {objectif}
+- Difficultés spécifiques : {difficultes}
+- Temps disponible : {temps} minutes
+
+## Paramètres de la dictée
+- Sujet imposé : "{sujet}"
+- Longueur souhaitée : {longueur}
+- Niveau de difficulté : {niveau}
+- Type de contenu : {type_contenu}
+- Vitesse de lecture : {vitesse}
+- Inclure orthographe complexe : {orthographe}
+- Inclure conjugaisons difficiles : {conjugaison}
+- Inclure accords grammaticaux : {grammaire}""",
+    max_output_tokens=3072,
+    response_schema=GENERATION_SCHEMA,
+)
+
+HANDWRITING_PROMPT = PromptTemplate(
+    'handwriting',
+    """Tu es un expert en reconnaissance de texte manuscrit en français.
+Examine l'image fournie et extrais exactement le texte que tu y vois.
+Retourne uniquement le texte extrait, sans commentaires ni formatage.""",
+    "Texte manuscrit de cette photo :",
+    max_output_tokens=2048,
+)
+
+OCR_CORRECTION_PROMPT = PromptTemplate(
+    'ocr_correction',
+    """Tu es un assistant spécialisé dans la correction de textes en français.
+Corrige les erreurs d'orthographe et de grammaire du texte fourni tout en conservant son sens original.
+Retourne uniquement le texte corrigé, sans commentaires ni formatage.""",
+    "{text}",
+    max_output_tokens=2048,
+)
+
+PROMPTS = {
+    prompt.name: prompt
+    for prompt in (
+        CORRECTION_PROMPT, BATCH_CORRECTION_PROMPT, GENERATION_PROMPT, HANDWRITING_PROMPT, OCR_CORRECTION_PROMPT
+    )
+}
+
+def get_prompt(name):
+    """Retourne le prompt enregistré sous ce nom."""
+    return PROMPTS[name]
+
+# Sortie d'une correction hors texte corrigé (erreurs, conseils), en tokens
+CORRECTION_OUTPUT_OVERHEAD = 1536
+
+def correction_output_tokens(cleaned_dictation_text: str, copies: int = 1) -> int:
+    """
+    Plafond de réponse d'une correction : le texte corrigé reproduit la dictée,
+    plus les erreurs et les conseils pédagogiques, pour chaque copie.
+    """
+    return copies * (CORRECTION_OUTPUT_OVERHEAD + 2 * estimate_tokens(cleaned_dictation_text))
+
+def build_correction_payload(cleaned_dictation_text: str, cleaned_user_text: str) -> dict:
+    """Construit la requête de correction d'une copie (textes déjà nettoyés)."""
+    return CORRECTION_PROMPT.build_payload(
+        dictation_text=cleaned_dictation_text,
+        user_text=cleaned_user_text,
+        max_output_tokens=correction_output_tokens(cleaned_dictation_text),
+    )
+
+def build_batch_correction_payload(cleaned_dictation_text: str, cleaned_user_texts: list) -> dict:
+    """Construit la requête de correction de plusieurs copies d'une même dictée."""
+    copies = "\n\n".join(
+        f"Copie {number} :\n---\n{text}\n---"
+        for number, text in enumerate(cleaned_user_texts, start=1)
+    )
+    return BATCH_CORRECTION_PROMPT.build_payload(
+        dictation_text=cleaned_dictation_text,
+        count=len(cleaned_user_texts),
+        copies=copies,
+        max_output_tokens=correction_output_tokens(cleaned_dictation_text, len(cleaned_user_texts)),
+    )
+
+def build_generation_payload(params) -> dict:
+    """Construit la requête de génération d'une dictée à partir des paramètres du client."""
+    return GENERATION_PROMPT.build_payload(
+        age=params.get('age', '12'),
+        niveau_scolaire=params.get('niveauScolaire', 'Étudiant'),
+        objectif=params.get('objectifApprentissage', 'orthographe'),
+        difficultes=params.get('difficultesSpecifiques', '') or 'aucune',
+        temps=params.get('tempsDisponible', '10'),
+        sujet=params.get('sujet', '') or 'la vie au village',
+        longueur=params.get('longueurTexte', '') or 'moyenne',
+        niveau=params.get('niveau', 'facile') or 'moyen',
+        type_contenu=params.get('typeContenu', '') or 'narratif',
+        vitesse=params.get('vitesseLecture', '') or 'normale',
+        orthographe='oui' if params.get('includeOrthographe', False) else 'non',
+        conjugaison='oui' if params.get('includeConjugaison', False) else 'non',
+        grammaire='oui' if params.get('includeGrammaire', False) else 'non',
+    )
+
+def build_handwriting_payload(image_data: str, mime_type: str = 'image/jpeg') -> dict:
+    """
+    Construit la requête Gemini d'extraction du texte manuscrit d'une image.
+
+    Args:
+        image_data (str): L'image encodée en base64
+        mime_type (str): Le type MIME de l'image
+    """
+    return HANDWRITING_PROMPT.build_payload(
+        parts=[{"inline_data": {"mime_type": mime_type, "data": image_data}}]
+    )
+
+def build_ocr_correction_payload(text: str) -> dict:
+    """Construit la requête de correction d'un texte issu de l'OCR (texte corrigé seul en sortie)."""
+    return OCR_CORRECTION_PROMPT.build_payload(max_output_tokens=estimate_tokens(text) * 2 + 256, text=text)
@@ -0,0 +1,694 @@
+"""
+Fournisseurs de LLM pour la correction et la génération, avec requêtes
+doublées (hedging) et coupe-circuits.
+
+Chaque fournisseur reçoit une requête au format du registre de prompts et
+retourne le texte de la réponse. Sa latence (jusqu'à une réponse valide) est
+suivie sur une fenêtre glissante propre au processus. Si le premier appel n'a
+pas abouti après le percentile LLM_HEDGE_PERCENTILE de ces latences, un
+double est envoyé au fournisseur suivant (jamais au même, et pas de double
+avec un seul fournisseur) : la première réponse valide est retenue et l'autre
+appel est annulé. Un fournisseur
+en échec est remplacé aussitôt par le suivant ; après LLM_BREAKER_FAILURES
+échecs consécutifs, son coupe-circuit l'écarte pendant LLM_BREAKER_RESET
+secondes. En streaming, le repli n'a lieu qu'avant le premier fragment.
+"""
+import asyncio
+import json
+import logging
+import math
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from contextlib import aclosing, closing
+import httpx
+from django.conf import settings
+from . import gemini, governor
+from .streaming import IncrementalJSONObjectParser
+from .structured import InvalidLLMResponse, agenerate_validated, generate_validated
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_registry_lock = threading.Lock()
+_hedge_executor = None
+_hedge_slots = None
+_executor_lock = threading.Lock()
+
+class ProviderUnavailable(Exception):
+    """Aucun fournisseur de LLM n'est disponible (non configuré ou coupe-circuit ouvert)."""
+
+class LatencyWindow:
+    """Latences récentes d'un fournisseur (secondes), pour le calcul des percentiles."""
+
+    def __init__(self, size=None):
+        self._samples = deque(maxlen=size or settings.LLM_LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def __len__(self):
+        return len(self._samples)
+
+    def percentile(self, percent):
+        """Percentile par rang le plus proche, None sans échantillon."""
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        rank = max(1, math.ceil(percent / 100 * len(samples)))
+        return samples[rank - 1]
+
+class CircuitBreaker:
+    """
+    Coupe-circuit d'un fournisseur : ouvert après `threshold` échecs consécutifs,
+    il laisse passer un appel d'essai toutes les `reset_timeout` secondes
+    (demi-ouvert) et se referme dès qu'un appel réussit.
+    """
+
+    def __init__(self, name, threshold=None, reset_timeout=None):
+        self.name = name
+        self._threshold = threshold
+        self._reset_timeout = reset_timeout
+        self.failures = 0
+        self.state = 'closed'
+        self._opened_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def threshold(self):
+        return self._threshold or settings.LLM_BREAKER_FAILURES
+
+    @property
+    def reset_timeout(self):
+        return self._reset_timeout or settings.LLM_BREAKER_RESET
+
+    def allow(self):
+        """Indique si un appel peut partir ; passe en demi-ouvert à la fin du délai."""
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+                self._opened_at = time.monotonic()
+                logger.info(f"Coupe-circuit {self.name} demi-ouvert : appel d'essai")
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != 'closed':
+                logger.info(f"Coupe-circuit {self.name} refermé")
+            self.failures = 0
+            self.state = 'closed'
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == 'half_open' or (self.state == 'closed' and self.failures >= self.threshold):
+                self.state = 'open'
+                self._opened_at = time.monotonic()
+                logger.warning(f"Coupe-circuit {self.name} ouvert après {self.failures} échec(s)")
+
+class LLMProvider:
+    """
+    Fournisseur de LLM. Les sous-classes implémentent generate_text et
+    agenerate_text (requête du registre de prompts -> texte de la réponse).
+    """
+    name = None
+
+    def __init__(self, name=None):
+        self.name = name or self.name
+        self.latency = LatencyWindow()
+        self.breaker = CircuitBreaker(self.name)
+        self.counters = {'calls': 0, 'failures': 0, 'hedges': 0, 'hedge_wins': 0}
+        self._counters_lock = threading.Lock()
+
+    @property
+    def configured(self):
+        return True
+
+    def generate_text(self, payload):
+        raise NotImplementedError
+
+    async def agenerate_text(self, payload):
+        raise NotImplementedError
+
+    def stream_text(self, payload):
+        """Produit la réponse fragment par fragment."""
+        raise NotImplementedError
+
+    def astream_text(self, payload):
+        """Version asynchrone de stream_text (générateur asynchrone)."""
+        raise NotImplementedError
+
+    def count(self, counter):
+        with self._counters_lock:
+            self.counters[counter] += 1
+
+    def hedge_delay(self):
+        """
+        Délai avant l'envoi d'un double : percentile LLM_HEDGE_PERCENTILE des
+        latences récentes, LLM_HEDGE_DEFAULT_DELAY tant qu'elles sont trop peu nombreuses.
+        """
+        if len(self.latency) < settings.LLM_HEDGE_MIN_SAMPLES:
+            return settings.LLM_HEDGE_DEFAULT_DELAY
+        return max(settings.LLM_HEDGE_MIN_DELAY, self.latency.percentile(settings.LLM_HEDGE_PERCENTILE))
+
+    def stats(self):
+        percentiles = {f"p{p}": self.latency.percentile(p) for p in (50, 95, 99)}
+        return {
+            **self.counters,
+            'state': self.breaker.state,
+            'samples': len(self.latency),
+            **{key: round(value, 3) if value is not None else None for key, value in percentiles.items()},
+            'hedge_delay': round(self.hedge_delay(), 3),
+        }
+
+class GeminiProvider(LLMProvider):
+    """Gemini via le client REST partagé (gemini.py)."""
+    name = 'gemini'
+
+    @property
+    def configured(self):
+        return bool(settings.GEMINI_API_KEY)
+
+    def generate_text(self, payload):
+        return gemini.generate_text(payload)
+
+    async def agenerate_text(self, payload):
+        return await gemini.async_generate_text(payload)
+
+    def stream_text(self, payload):
+        return gemini.stream_text(payload)
+
+    def astream_text(self, payload):
+        return gemini.async_stream_text(payload)
+
+def _parts_text(parts):
+    return '\n'.join(part['text'] for part in parts if 'text' in part)
+
+def chat_request(payload, model):
+    """
+    Traduit une requête du registre de prompts (format Gemini) en requête
+    Chat Completions : consignes système, tours user/model, plafond de sortie et
+    mode JSON, le schéma attendu étant ajouté aux consignes.
+    """
+    messages = []
+    system = _parts_text(payload['systemInstruction']['parts']) if payload.get('systemInstruction') else ''
+    config = payload.get('generationConfig', {})
+    if config.get('responseSchema'):
+        system += f"\n\nSchéma JSON de la réponse : {json.dumps(config['responseSchema'], ensure_ascii=False)}"
+    if system:
+        messages.append({'role': 'system', 'content': system.strip()})
+    for content in payload['contents']:
+        if any('text' not in part for part in content['parts']):
+            raise ValueError("Requête multimodale non prise en charge par ce fournisseur")
+        role = 'assistant' if content.get('role') == 'model' else 'user'
+        messages.append({'role': role, 'content': _parts_text(content['parts'])})
+    request = {'model': model, 'messages': messages}
+    if config.get('maxOutputTokens'):
+        request['max_tokens'] = config['maxOutputTokens']
+    if config.get('temperature') is not None:
+        request['temperature'] = config['temperature']
+    if config.get('responseMimeType') == 'application/json':
+        request['response_format'] = {'type': 'json_object'}
+    return request
+
+class OpenAIProvider(LLMProvider):
+    """OpenAI Chat Completions via le client openai 1.x (un client par processus, un par boucle en async)."""
+    name = 'openai'
+
+    def __init__(self, name=None):
+        super().__init__(name)
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._async_clients = weakref.WeakKeyDictionary()
+
+    @property
+    def configured(self):
+        return bool(settings.OPENAI_API_KEY)
+
+    def _client_options(self):
+        return {
+            'api_key': settings.OPENAI_API_KEY,
+            'timeout': httpx.Timeout(settings.GEMINI_READ_TIMEOUT, connect=settings.GEMINI_CONNECT_TIMEOUT),
+            'max_retries': settings.GEMINI_MAX_RETRIES,
+        }
+
+    def get_client(self):
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import openai
+                    self._client = openai.OpenAI(**self._client_options())
+        return self._client
+
+    def get_async_client(self):
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            import openai
+            client = openai.AsyncOpenAI(**self._client_options())
+            self._async_clients[loop] = client
+        return client
+
+    def _extract_text(self, response, started):
+        choice = response.choices[0]
+        usage = response.usage
+        logger.info(
+            f"OpenAI {settings.OPENAI_MODEL} : {getattr(usage, 'prompt_tokens', '?')} tokens en entrée, "
+            f"{getattr(usage, 'completion_tokens', '?')} en sortie, {round((time.perf_counter() - started) * 1000)} ms"
+        )
+        if choice.finish_reason == 'length':
+            logger.warning("Réponse OpenAI tronquée par max_tokens")
+        return choice.message.content or ''
+
+    def generate_text(self, payload):
+        request = chat_request(payload, settings.OPENAI_MODEL)
+        with governor.governed('openai', settings.OPENAI_MODEL, settings.OPENAI_API_KEY):
+            started = time.perf_counter()
+            response = self.get_client().chat.completions.create(**request)
+        return self._extract_text(response, started)
+
+    async def agenerate_text(self, payload):
+        request = chat_request(payload, settings.OPENAI_MODEL)
+        async with governor.agoverned('openai', settings.OPENAI_MODEL, settings.OPENAI_API_KEY):
+            started = time.perf_counter()
+            response = await self.get_async_client().chat.completions.create(**request)
+        return self._extract_text(response, started)
+
+    def stream_text(self, payload):
+        request = chat_request(payload, settings.OPENAI_MODEL)
+        with governor.governed('openai', settings.OPENAI_MODEL, settings.OPENAI_API_KEY):
+            chunks = self.get_client().chat.completions.create(**request, stream=True)
+            try:
+                for chunk in chunks:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                chunks.response.close()
+
+    async def astream_text(self, payload):
+        request = chat_request(payload, settings.OPENAI_MODEL)
+        async with governor.agoverned('openai', settings.OPENAI_MODEL, settings.OPENAI_API_KEY):
+            chunks = await self.get_async_client().chat.completions.create(**request, stream=True)
+            try:
+                async for chunk in chunks:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+            finally:
+                await chunks.response.aclose()
+
+class FakeProvider(LLMProvider):
+    """
+    Fournisseur simulé pour reproduire des latences de queue et des pannes.
+
+    Args:
+        name (str): Nom sous lequel l'enregistrer (register_provider)
+        response (str | callable): Texte renvoyé, ou fonction requête -> texte
+        latency (float | callable): Latence en secondes, ou fonction sans argument
+            qui la tire (ex. lambda: 5.0 if random.random() < 0.05 else 0.2)
+        error (Exception, optional): Exception levée après la latence
+        chunk_size (int): Taille des fragments en mode streaming
+    """
+
+    def __init__(self, name, response='{}', latency=0.0, error=None, chunk_size=16):
+        super().__init__(name)
+        self.response = response
+        self.latency_model = latency
+        self.error = error
+        self.chunk_size = chunk_size
+
+    def _respond(self, payload):
+        if self.error is not None:
+            raise self.error
+        return self.response(payload) if callable(self.response) else self.response
+
+    def _delay(self):
+        return self.latency_model() if callable(self.latency_model) else self.latency_model
+
+    def generate_text(self, payload):
+        time.sleep(self._delay())
+        return self._respond(payload)
+
+    async def agenerate_text(self, payload):
+        await asyncio.sleep(self._delay())
+        return self._respond(payload)
+
+    def _fragments(self, payload):
+        text = self._respond(payload)
+        return [text[index:index + self.chunk_size] for index in range(0, len(text), self.chunk_size)]
+
+    def stream_text(self, payload):
+        time.sleep(self._delay())
+        yield from self._fragments(payload)
+
+    async def astream_text(self, payload):
+        await asyncio.sleep(self._delay())
+        for fragment in self._fragments(payload):
+            yield fragment
+
+PROVIDER_CLASSES = {
+    'gemini': GeminiProvider,
+    'openai': OpenAIProvider,
+}
+
+def get_provider(name):
+    """Retourne l'instance (unique par processus) du fournisseur nommé."""
+    provider = _registry.get(name)
+    if provider is None:
+        with _registry_lock:
+            provider = _registry.get(name)
+            if provider is None:
+                if name not in PROVIDER_CLASSES:
+                    raise ProviderUnavailable(f"Fournisseur de LLM inconnu : {name}")
+                provider = _registry[name] = PROVIDER_CLASSES[name]()
+    return provider
+
+def register_provider(provider):
+    """Enregistre (ou remplace) un fournisseur, par exemple un FakeProvider."""
+    with _registry_lock:
+        _registry[provider.name] = provider
+    return provider
+
+def reset_providers():
+    """Oublie les fournisseurs enregistrés, leurs latences et leurs coupe-circuits."""
+    with _registry_lock:
+        _registry.clear()
+
+def get_providers():
+    """
+    Fournisseurs configurés de LLM_PROVIDERS, dans l'ordre de préférence. Si aucun
+    n'est configuré, le premier est retourné : son appel lèvera l'erreur explicite.
+    """
+    providers = [get_provider(name) for name in settings.LLM_PROVIDERS]
+    return [provider for provider in providers if provider.configured] or providers[:1]
+
+def _get_hedge_executor():
+    global _hedge_executor, _hedge_slots
+    if _hedge_executor is None:
+        with _executor_lock:
+            if _hedge_executor is None:
+                _hedge_slots = threading.BoundedSemaphore(settings.LLM_HEDGE_MAX_IN_FLIGHT)
+                _hedge_executor = ThreadPoolExecutor(
+                    max_workers=settings.LLM_HEDGE_MAX_IN_FLIGHT,
+                    thread_name_prefix='llm-hedge'
+                )
+    return _hedge_executor
+
+def _take_hedge_slot():
+    """
+    Réserve une place pour un double ; False si LLM_HEDGE_MAX_IN_FLIGHT doubles
+    sont déjà en cours dans le processus (le double n'est alors pas envoyé).
+    """
+    _get_hedge_executor()
+    return _hedge_slots.acquire(blocking=False)
+
+def _release_hedge_slot(_future=None):
+    _hedge_slots.release()
+
+def _spawn(func, *args):
+    """
+    Exécute func(*args) dans un thread dédié et retourne son Future. L'appel
+    principal et les replis ne passent pas par le pool des doubles : ils ne
+    peuvent pas y attendre derrière des doubles perdants.
+    """
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(func(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name='llm-call', daemon=True).start()
+    return future
+
+def _record_outcome(provider, started, error=None):
+    if error is None:
+        provider.latency.record(time.perf_counter() - started)
+        provider.breaker.record_success()
+        return
+    # Le refus du régulateur local ne dit rien de la santé du fournisseur
+    if not isinstance(error, governor.RateLimitExceeded):
+        provider.count('failures')
+        provider.breaker.record_failure()
+
+def _attempt(provider, payload, parse, kind):
+    provider.count('calls')
+    started = time.perf_counter()
+    try:
+        result = generate_validated(payload, parse, kind, generate=provider.generate_text)
+    except Exception as e:
+        _record_outcome(provider, started, e)
+        raise
+    _record_outcome(provider, started)
+    return result
+
+async def _aattempt(provider, payload, parse, kind):
+    provider.count('calls')
+    started = time.perf_counter()
+    try:
+        result = await agenerate_validated(payload, parse, kind, generate=provider.agenerate_text)
+    except Exception as e:
+        _record_outcome(provider, started, e)
+        raise
+    _record_outcome(provider, started)
+    return result
+
+class _Plan:
+    """
+    Déroulé des appels d'une requête : fournisseur principal, délai avant le
+    double et fournisseurs de repli, dans l'ordre de préférence. Le coupe-circuit
+    d'un fournisseur n'est consulté qu'au moment de lui confier un appel.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.queue = get_providers()
+        self.primary = self._next_allowed()
+        if self.primary is None:
+            raise ProviderUnavailable("Aucun fournisseur de LLM disponible (coupe-circuits ouverts)")
+        # Pas de double vers le même fournisseur : il doublerait la consommation du quota
+        self.delay = self.primary.hedge_delay() if settings.LLM_HEDGING_ENABLED and self.queue else None
+        self.errors = []
+
+    def _next_allowed(self):
+        while self.queue:
+            provider = self.queue.pop(0)
+            if provider.breaker.allow():
+                return provider
+        return None
+
+    def hedge_timeout(self):
+        return self.delay
+
+    def next_hedge(self):
+        """
+        Fournisseur du double, ou None si aucun n'est disponible ou si le
+        processus a déjà LLM_HEDGE_MAX_IN_FLIGHT doubles en cours. Un seul double
+        par requête ; la place réservée est à libérer par l'appelant.
+        """
+        delay, self.delay = self.delay, None
+        if not _take_hedge_slot():
+            logger.info(f"{self.primary.name} sans réponse après {delay:.2f}s, trop de doubles en cours : pas de double")
+            return None
+        provider = self._next_allowed()
+        if provider is None:
+            _release_hedge_slot()
+            return None
+        logger.info(f"{self.primary.name} sans réponse après {delay:.2f}s, double envoyé à {provider.name}")
+        self.primary.count('hedges')
+        return provider
+
+    def next_failover(self):
+        # Après un repli, plus de double : il viserait un fournisseur en échec ou déjà sollicité
+        self.delay = None
+        provider = self._next_allowed()
+        if provider is not None:
+            logger.info(f"Repli sur {provider.name} ({self.kind})")
+        return provider
+
+    def failed(self, provider, error):
+        logger.warning(f"Échec de {provider.name} ({self.kind}) : {str(error)}")
+        self.errors.append(error)
+
+    def won(self, provider, is_hedge):
+        if is_hedge:
+            logger.info(f"Requête doublée : réponse retenue de {provider.name}")
+            self.primary.count('hedge_wins')
+
+    def fail(self):
+        if len(self.errors) == 1:
+            raise self.errors[0]
+        message = "Tous les fournisseurs de LLM ont échoué : " + ' ; '.join(str(e) for e in self.errors)
+        # Fournisseurs joignables mais réponses inexploitables : ce n'est pas une panne
+        if all(isinstance(error, ValueError) for error in self.errors):
+            raise InvalidLLMResponse(message)
+        raise ProviderUnavailable(message)
+
+def generate(payload: dict, parse, kind: str):
+    """
+    Obtient une réponse validée (voir structured.generate_validated) du premier
+    fournisseur disponible, avec double envoyé à un autre fournisseur après le
+    délai de hedging et repli sur le suivant en cas d'échec.
+
+    Les appels synchrones ne peuvent pas être interrompus : l'appel perdant est
+    annulé s'il n'a pas commencé, sinon sa réponse est ignorée. Les doubles
+    passent par un pool borné à LLM_HEDGE_MAX_IN_FLIGHT ; quand il est plein,
+    aucun double n'est envoyé.
+
+    Raises:
+        ProviderUnavailable: Si aucun fournisseur n'est disponible ou si tous ont échoué
+        ValueError: Si tous les fournisseurs appelés ont renvoyé une réponse invalide
+    """
+    plan = _Plan(kind)
+    if plan.delay is None and not plan.queue:
+        # Ni double ni repli possibles : appel direct, sans autre thread
+        return _attempt(plan.primary, payload, parse, kind)
+    pending = {_spawn(_attempt, plan.primary, payload, parse, kind): (plan.primary, False)}
+    try:
+        while pending:
+            done, _ = wait(pending, timeout=plan.hedge_timeout(), return_when=FIRST_COMPLETED)
+            if not done:
+                provider = plan.next_hedge()
+                if provider is not None:
+                    future = _get_hedge_executor().submit(_attempt, provider, payload, parse, kind)
+                    future.add_done_callback(_release_hedge_slot)
+                    pending[future] = (provider, True)
+                continue
+            for future in done:
+                provider, is_hedge = pending.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    plan.failed(provider, e)
+                    continue
+                plan.won(provider, is_hedge)
+                return result
+            if not pending:
+                provider = plan.next_failover()
+                if provider is not None:
+                    pending[_spawn(_attempt, provider, payload, parse, kind)] = (provider, False)
+        plan.fail()
+    finally:
+        for future in pending:
+            future.cancel()
+
+async def agenerate(payload: dict, parse, kind: str):
+    """
+    Version asynchrone de generate : l'appel perdant est annulé (requête HTTP
+    interrompue). Les doubles en cours sont bornés de la même façon.
+    """
+    plan = _Plan(kind)
+    pending = {asyncio.ensure_future(_aattempt(plan.primary, payload, parse, kind)): (plan.primary, False)}
+    try:
+        while pending:
+            done, _ = await asyncio.wait(pending, timeout=plan.hedge_timeout(), return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                provider = plan.next_hedge()
+                if provider is not None:
+                    task = asyncio.ensure_future(_aattempt(provider, payload, parse, kind))
+                    task.add_done_callback(_release_hedge_slot)
+                    pending[task] = (provider, True)
+                continue
+            for task in done:
+                provider, is_hedge = pending.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    plan.failed(provider, e)
+                    continue
+                plan.won(provider, is_hedge)
+                return result
+            if not pending:
+                provider = plan.next_failover()
+                if provider is not None:
+                    pending[asyncio.ensure_future(_aattempt(provider, payload, parse, kind))] = (provider, False)
+        plan.fail()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+def stream(payload: dict, parse, kind: str):
+    """
+    Relaie la réponse du premier fournisseur disponible fragment par fragment,
+    jusqu'à la fin de l'objet JSON, puis la valide (une demande de réparation au
+    même fournisseur au besoin). Si l'appel échoue avant le premier fragment, le
+    fournisseur suivant prend le relais ; après, l'erreur est transmise. Pas de
+    double en streaming : il dupliquerait le flux relayé au client.
+
+    Yields:
+        tuple: ('token', fragment) pour chaque fragment, puis ('result', données validées)
+    """
+    plan = _Plan(kind)
+    provider = plan.primary
+    while provider is not None:
+        provider.count('calls')
+        started = time.perf_counter()
+        parser = IncrementalJSONObjectParser()
+        try:
+            with closing(provider.stream_text(payload)) as fragments:
+                for fragment in fragments:
+                    yield 'token', fragment
+                    # Objet JSON complet : la suite du flux n'est pas lue
+                    if parser.feed(fragment):
+                        break
+            result = generate_validated(
+                payload, parse, kind, response_text=parser.response_text(), generate=provider.generate_text
+            )
+        except Exception as e:
+            _record_outcome(provider, started, e)
+            if parser.length:
+                raise
+            plan.failed(provider, e)
+            provider = plan.next_failover()
+            continue
+        _record_outcome(provider, started)
+        yield 'result', result
+        return
+    plan.fail()
+
+async def astream(payload: dict, parse, kind: str):
+    """Version asynchrone de stream."""
+    plan = _Plan(kind)
+    provider = plan.primary
+    while provider is not None:
+        provider.count('calls')
+        started = time.perf_counter()
+        parser = IncrementalJSONObjectParser()
+        try:
+            async with aclosing(provider.astream_text(payload)) as fragments:
+                async for fragment in fragments:
+                    yield 'token', fragment
+                    # Objet JSON complet : la suite du flux n'est pas lue
+                    if parser.feed(fragment):
+                        break
+            result = await agenerate_validated(
+                payload, parse, kind, response_text=parser.response_text(), generate=provider.agenerate_text
+            )
+        except Exception as e:
+            _record_outcome(provider, started, e)
+            if parser.length:
+                raise
+            plan.failed(provider, e)
+            provider = plan.next_failover()
+            continue
+        _record_outcome(provider, started)
+        yield 'result', result
+        return
+    plan.fail()
+
+def provider_stats():
+    """Latences, appels, doubles et état des coupe-circuits des fournisseurs de ce processus."""
+    return {name: get_provider(name).stats() for name in settings.LLM_PROVIDERS}
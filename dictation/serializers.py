@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from .models import Dictation, DictationAttempt
+from .errors import ERROR_CATEGORIES
+from .models import Dictation, DictationAttempt, UserProfile, UserProgress
 
 class DictationSerializer(serializers.ModelSerializer):
     class Meta:
@@ -10,6 +11,24 @@ class DictationSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['id', 'created_at']
 
+class DictationListSerializer(serializers.ModelSerializer):
+    """Représentation compacte pour les listes : le texte complet n'est renvoyé que par retrieve."""
+    class Meta:
+        model = Dictation
+        fields = [
+            'id', 'title', 'difficulty',
+            'created_at', 'audio_file', 'is_public', 'category', 'tags'
+        ]
+        read_only_fields = ['id', 'created_at']
+
+class DictationStatsSerializer(serializers.ModelSerializer):
+    average_score = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = Dictation
+        fields = ['id', 'attempts_count', 'scored_attempts_count', 'average_score', 'best_score']
+        read_only_fields = fields
+
 class DictationAttemptSerializer(serializers.ModelSerializer):
     dictation = DictationSerializer(read_only=True)
     
@@ -19,4 +38,61 @@ class DictationAttemptSerializer(serializers.ModelSerializer):
             'id', 'dictation', 'user_text', 'score',
             'feedback', 'mistakes', 'time_taken', 'created_at', 'is_completed'
         ]
-        read_only_fields = ['id', 'score', 'feedback', 'mistakes', 'created_at']
\ No newline at end of file
+        read_only_fields = ['id', 'score', 'feedback', 'mistakes', 'created_at']
+
+class UserProfileStatsSerializer(serializers.ModelSerializer):
+    average_score = serializers.FloatField(read_only=True)
+
+    class Meta:
+        model = UserProfile
+        fields = [
+            'level', 'total_attempts', 'scored_attempts_count', 'average_score',
+            'best_score', 'mastered_count', 'last_active'
+        ]
+        read_only_fields = fields
+
+class UserProgressSerializer(serializers.ModelSerializer):
+    dictation_title = serializers.CharField(source='dictation.title', read_only=True)
+
+    class Meta:
+        model = UserProgress
+        fields = ['dictation', 'dictation_title', 'best_score', 'attempts_count', 'last_attempt', 'is_mastered']
+        read_only_fields = fields
+
+# Validation des réponses JSON des LLM (voir structured.py)
+
+class CorrectionErrorSerializer(serializers.Serializer):
+    word = serializers.CharField(allow_blank=True, default='')
+    correction = serializers.CharField(allow_blank=True, default='')
+    # Absente des corrections en cache antérieures : déduite alors de la description
+    category = serializers.ChoiceField(choices=ERROR_CATEGORIES, required=False)
+    description = serializers.CharField(allow_blank=True, default='')
+
+class PedagogicalAdviceSerializer(serializers.Serializer):
+    summary = serializers.CharField(allow_blank=True, default='')
+    tips = serializers.ListField(child=serializers.CharField(allow_blank=True), default=list)
+    exercises = serializers.ListField(child=serializers.CharField(allow_blank=True), default=list)
+
+class CorrectionResultSerializer(serializers.Serializer):
+    score = serializers.IntegerField(min_value=0, max_value=100)
+    errors = CorrectionErrorSerializer(many=True)
+    correction = serializers.CharField(allow_blank=True, default='')
+    total_words = serializers.IntegerField(min_value=0, required=False)
+    error_count = serializers.IntegerField(min_value=0, required=False)
+    pedagogical_advice = PedagogicalAdviceSerializer(required=False)
+
+class BatchCorrectionItemSerializer(CorrectionResultSerializer):
+    copie = serializers.IntegerField(required=False)
+
+class BatchCorrectionResultSerializer(serializers.Serializer):
+    corrections = BatchCorrectionItemSerializer(many=True)
+
+class GeneratedDictationSerializer(serializers.Serializer):
+    title = serializers.CharField()
+    text = serializers.CharField()
+    difficulty = serializers.CharField()
+    longueur_reelle = serializers.CharField()
+    vocabulaire_rare = serializers.ListField(child=serializers.CharField())
+    score_difficulte = serializers.FloatField()
+    types_conjugaisons = serializers.ListField(child=serializers.CharField(), required=False)
+    accords_complexes = serializers.ListField(child=serializers.CharField(), required=False)
@@ -1,70 +1,124 @@
+import base64
+import io
 import os
+import re
+import difflib
 import logging
-import google.generativeai as genai
+import unicodedata
+import uuid
 from datetime import datetime
-from gtts import gTTS
-import json
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import aclosing, closing
+from functools import lru_cache
+from asgiref.sync import sync_to_async
 from django.conf import settings
-import requests
+from django.db import transaction
+from . import gemini, providers
+from .errors import structure_errors
+from .prompts import build_correction_payload, build_generation_payload, build_handwriting_payload
+from .structured import InvalidLLMResponse, describe_error, validate_response
+from .singleflight import arun_once, run_once, singleflight_key
+from .cache import (
+    correction_cache_key,
+    get_cached_correction,
+    store_correction,
+    audio_segment_cache_key,
+    get_cached_audio_segment,
+    store_audio_segment,
+    vision_cache_key,
+    get_cached_extraction,
+    store_extraction,
+)
 
 # Configuration du logging
 logger = logging.getLogger(__name__)
 
-# Configuration de Cloudinary
-cloudinary.config(
-    cloud_name=settings.CLOUDINARY_STORAGE['CLOUD_NAME'],
-    api_key=settings.CLOUDINARY_STORAGE['API_KEY'],
-    api_secret=settings.CLOUDINARY_STORAGE['API_SECRET']
-)
+@lru_cache(maxsize=None)
+def get_cloudinary_uploader():
+    """
+    Configure Cloudinary au premier upload et retourne son module d'upload.
+    L'import est différé pour ne pas alourdir le démarrage des workers.
+    """
+    import cloudinary
+    import cloudinary.uploader
+    cloudinary.config(
+        cloud_name=settings.CLOUDINARY_STORAGE['CLOUD_NAME'],
+        api_key=settings.CLOUDINARY_STORAGE['API_KEY'],
+        api_secret=settings.CLOUDINARY_STORAGE['API_SECRET']
+    )
+    return cloudinary.uploader
 
-def configure_gemini_api():
-    """Configure l'API Gemini avec la clé API."""
-    try:
-        api_key = settings.GEMINI_API_KEY
-        if not api_key:
-            raise ValueError("La clé API Gemini n'est pas configurée")
-        genai.configure(api_key=api_key)
-        logger.info("Configuration de l'API Gemini réussie")
-    except Exception as e:
-        logger.error(f"Erreur lors de la configuration de l'API Gemini : {str(e)}")
-        raise
+# Une phrase se termine par un point, un point d'exclamation, d'interrogation ou des points de suspension
+SENTENCE_PATTERN = re.compile(r'[^.!?…]+[.!?…]*')
 
-def generate_audio_from_text(text, output_path):
+def split_into_sentences(text):
+    """Découpe le texte de la dictée en phrases, ponctuation finale comprise."""
+    return [sentence.strip() for sentence in SENTENCE_PATTERN.findall(text) if sentence.strip()]
+
+def synthesize_sentence(sentence, lang='fr', slow=True):
     """
-    Génère un fichier audio à partir du texte de la dictée en utilisant gTTS.
+    Synthétise une phrase avec gTTS, en passant par le cache des segments audio.
+
+    Returns:
+        bytes: Le segment MP3 de la phrase
+    """
+    key = audio_segment_cache_key(sentence, lang, slow)
+    audio = get_cached_audio_segment(key)
+    if audio is not None:
+        return audio
+    from gtts import gTTS
+    buffer = io.BytesIO()
+    gTTS(text=sentence, lang=lang, slow=slow).write_to_fp(buffer)
+    audio = buffer.getvalue()
+    store_audio_segment(key, audio)
+    return audio
+
+def synthesize_speech(text, lang='fr', slow=True):
+    """
+    Synthétise le texte phrase par phrase et assemble le MP3 final.
+    Chaque phrase distincte n'est synthétisée qu'une fois (les répétitions de la
+    dictée réutilisent le même segment) et les phrases sont générées en parallèle.
+
+    Returns:
+        bytes: Le fichier MP3 complet
+    """
+    sentences = split_into_sentences(text)
+    unique_sentences = list(dict.fromkeys(sentences))
+    if not unique_sentences:
+        raise ValueError("Le texte à synthétiser est vide")
+    workers = min(settings.TTS_MAX_WORKERS, len(unique_sentences))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        segments = dict(zip(
+            unique_sentences,
+            executor.map(lambda sentence: synthesize_sentence(sentence, lang, slow), unique_sentences)
+        ))
+    logger.info(f"Audio assemblé : {len(sentences)} phrase(s), {len(unique_sentences)} segment(s) distinct(s)")
+    # Les trames MP3 se concatènent telles quelles, comme le fait gTTS entre ses propres morceaux
+    return b''.join(segments[sentence] for sentence in sentences)
+
+def generate_audio_from_text(text, public_id):
+    """
+    Génère l'audio de la dictée avec gTTS et l'envoie sur Cloudinary depuis la mémoire.
     
     Args:
         text (str): Le texte à convertir en audio
-        output_path (str): Le chemin complet où sauvegarder le fichier audio
+        public_id (str): L'identifiant du fichier dans le dossier Cloudinary "dictations"
         
     Returns:
         str: L'URL Cloudinary du fichier audio
     """
     try:
-        # S'assurer que le répertoire parent existe
-        os.makedirs(os.path.dirname(output_path), exist_ok=True)
-        
-        # Convertir le texte en audio avec gTTS
-        tts = gTTS(text=text, lang='fr', slow=True)
-        tts.save(output_path)
-        
-        logger.info(f"Audio généré localement : {output_path}")
+        # Convertir le texte en audio, phrase par phrase, sans passer par le disque
+        audio_buffer = io.BytesIO(synthesize_speech(text, lang='fr', slow=True))
         
         # Upload sur Cloudinary
-        cloudinary_response = cloudinary.uploader.upload(
-            output_path,
+        cloudinary_response = get_cloudinary_uploader().upload(
+            audio_buffer,
             resource_type="video",
             folder="dictations",
-            public_id=os.path.basename(output_path).replace('.mp3', '')
+            public_id=public_id
         )
         
-        # Supprimer le fichier local
-        if os.path.exists(output_path):
-            os.remove(output_path)
-        
         logger.info(f"Audio uploadé sur Cloudinary : {cloudinary_response['secure_url']}")
         return cloudinary_response['secure_url']
         
@@ -72,149 +126,122 @@ def generate_audio_from_text(text, output_path):
         logger.error(f"Erreur lors de la génération de l'audio : {str(e)}")
         raise
 
-def generate_dictation(params):
+def build_dictation_payload(dictation, result, audio_url):
+    """
+    Construit la structure enrichie renvoyée au client pour une dictée générée.
+
+    Args:
+        dictation (Dictation): La dictée enregistrée
+        result (dict): La réponse JSON de Gemini (ou Dictation.metadata)
+        audio_url (str): L'URL Cloudinary de l'audio
+    """
+    return {
+        'id': dictation.id,
+        'text': dictation.text,
+        'audio_url': audio_url,
+        'title': dictation.title,
+        'difficulty': dictation.difficulty,
+        'longueur_reelle': result.get('longueur_reelle'),
+        'vocabulaire_rare': result.get('vocabulaire_rare'),
+        'score_difficulte': result.get('score_difficulte'),
+        'types_conjugaisons': result.get('types_conjugaisons'),
+        'accords_complexes': result.get('accords_complexes'),
+    }
+
+def parse_generation_response(response_text):
+    """
+    Décode et valide l'objet JSON renvoyé par Gemini pour une génération.
+
+    Raises:
+        InvalidLLMResponse: Si la réponse n'est pas un JSON valide ou si des champs obligatoires manquent
+    """
+    from .serializers import GeneratedDictationSerializer
+    return validate_response(response_text, GeneratedDictationSerializer)
+
+def save_generated_dictation(result, pool_bucket=None, progress_callback=None):
+    """
+    Synthétise l'audio d'une dictée générée, l'enregistre et retourne la structure enrichie.
+
+    Args:
+        result (dict): La réponse validée de Gemini
+        pool_bucket (str, optional): Compartiment du pool où mettre la dictée en réserve
+        progress_callback (callable, optional): Appelée avec (étape, pourcentage)
+    """
+    report_progress = progress_callback or (lambda step, percent: None)
+    timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    public_id = f'dictation_{timestamp}_{uuid.uuid4().hex[:8]}'
+    report_progress('generation_audio', 50)
+    audio_url = generate_audio_from_text(result['text'], public_id)
+    report_progress('enregistrement', 90)
+    from .models import Dictation
+    # Les dictées du pool ont besoin de leurs métadonnées pour être servies plus tard
+    store_metadata = settings.DICTATION_STORE_METADATA or pool_bucket is not None
+    dictation = Dictation.objects.create(
+        title=result['title'],
+        text=result['text'],
+        difficulty=result['difficulty'],
+        audio_file=f'dictations/{public_id}.mp3',
+        metadata={**result, 'audio_url': audio_url} if store_metadata else None,
+        is_public=pool_bucket is None,
+        pool_bucket=pool_bucket
+    )
+    return build_dictation_payload(dictation, result, audio_url)
+
+def generate_dictation(params, progress_callback=None, pool_bucket=None):
     """
     Génère une dictée personnalisée en fonction des paramètres fournis.
     
     Args:
         params (dict): Dictionnaire contenant les paramètres de génération
+        progress_callback (callable, optional): Appelée avec (étape, pourcentage)
+            à chaque étape de la génération (utilisé par la tâche Celery)
+        pool_bucket (str, optional): Si fourni, la dictée est mise en réserve dans ce
+            compartiment du pool (non publique) au lieu d'être publiée
         
     Returns:
         dict: Dictionnaire contenant le texte de la dictée et le chemin du fichier audio
     """
-    try:
-        # Extraction des nouveaux paramètres
-        age = params.get('age', '12')
-        niveau_scolaire = params.get('niveauScolaire', 'Étudiant')
-        objectif = params.get('objectifApprentissage', 'orthographe')
-        difficultes = params.get('difficultesSpecifiques', '')
-        temps = params.get('tempsDisponible', '10')
-        niveau = params.get('niveau', 'facile')
-        sujet = params.get('sujet', '')
-        longueur = params.get('longueurTexte', '')
-        type_contenu = params.get('typeContenu', '')
-        vitesse = params.get('vitesseLecture', '')
-        inclure_grammaire = params.get('includeGrammaire', False)
-        inclure_conjugaison = params.get('includeConjugaison', False)
-        inclure_orthographe = params.get('includeOrthographe', False)
-
-        # Nouveau prompt enrichi
-        prompt = f"""
-Tu es un professeur de français expert, spécialisé dans la création de dictées pédagogiques culturelles pour des élèves burkinabè. Tu dois générer une dictée adaptée à un profil d’élève donné, sous forme d’un objet JSON enrichi, sans aucun retour à la ligne, balise ou symbole de formatage. Le texte doit être 100 % lisible et naturel.
-
-## Profil de l'élève
-- Âge : {age} ans
-- Niveau scolaire : {niveau_scolaire}
-- Objectif d'apprentissage : {objectif}
-- Difficultés spécifiques : {difficultes or 'aucune'}
-- Temps disponible : {temps} minutes
-
-## Paramètres de la dictée
-- Sujet imposé : {sujet or 'la vie au village'}
-- Longueur souhaitée : {longueur or 'moyenne'}
-- Niveau de difficulté : {niveau or 'moyen'}
-- Type de contenu : {type_contenu or 'narratif'}
-- Vitesse de lecture : {vitesse or 'normale'}
-- Inclure orthographe complexe : {'oui' if inclure_orthographe else 'non'}
-- Inclure conjugaisons difficiles : {'oui' if inclure_conjugaison else 'non'}
-- Inclure accords grammaticaux : {'oui' if inclure_grammaire else 'non'}
-
-## Contraintes de création
-1. Respecte strictement le sujet imposé : \"{sujet or 'la vie au village'}\".
-2. La longueur réelle du texte doit correspondre à :
-   - Court : 3 à 4 phrases
-   - Moyenne : 6 à 8 phrases
-   - Long : 10 à 12 phrases ou plus
-3. Chaque phrase de plus de 10 mots doit être répétée 3 fois, les plus courtes, 2 fois, naturellement.
-4. Utilise un vocabulaire soutenu, culturellement situé (Burkina Faso), et évite toute simplification abusive.
-5. Intègre au moins 3 mots rares, peu utilisés ou typiques du terroir burkinabè. Pas de glossaire.
-6. Si demandé, inclure des conjugaisons complexes (imparfait, passé simple, conditionnel, etc.) et des accords grammaticaux exigeants.
-7. Ne retourne AUCUN astérisque, tiret, retour à la ligne, ni balise HTML ou Markdown.
-8. Retourne un objet JSON enrichi selon le format ci-dessous.
-
-## Format de réponse JSON obligatoire
-{{
-  "title": "Un titre original et évocateur du thème choisi",
-  "text": "Texte intégral de la dictée avec répétitions naturelles intégrées",
-  "difficulty": "{niveau or 'moyen'}",
-  "longueur_reelle": "{longueur or 'moyenne'}",
-  "vocabulaire_rare": ["mot1", "mot2", "mot3"],
-  "score_difficulte": un score entre 1 et 10 basé sur la richesse lexicale, syntaxique et les pièges orthographiques,
-  "types_conjugaisons": ["passé simple", "imparfait", "futur"]  // si includeConjugaison,
-  "accords_complexes": ["accord sujet-verbe inversé", "participe passé avec avoir"]  // si includeGrammaire
-}}
-"""        # Utiliser l'API REST Gemini
-        api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={settings.GEMINI_API_KEY}"
-        
-        payload = {
-            "contents": [{
-                "parts": [
-                    {"text": prompt}
-                ]
-            }]
-        }
-
-        response = requests.post(
-            api_url,
-            json=payload,
-            headers={'Content-Type': 'application/json'}
-        )
+    def report_progress(step, percent):
+        if progress_callback:
+            progress_callback(step, percent)
 
-        if response.status_code != 200:
-            logger.error(f"Erreur Gemini API: {response.text}")
-            raise Exception(f"Erreur API: {response.status_code}")
-
-        result = response.json()
-        response_text = result['candidates'][0]['content']['parts'][0]['text']
+    try:
+        payload = build_generation_payload(params)
+        # Gemini, doublé ou relayé par un autre fournisseur si sa réponse tarde ou échoue
+        report_progress('generation_texte', 10)
         try:
-            if not response_text.startswith('{'):
-                response_text = response_text[response_text.find('{'):]
-            if not response_text.endswith('}'):
-                response_text = response_text[:response_text.rfind('}')+1]
-            result = json.loads(response_text)
-            # Validation des champs requis (au moins ceux du format enrichi)
-            required_fields = ['text', 'title', 'difficulty', 'longueur_reelle', 'vocabulaire_rare', 'score_difficulte']
-            if not all(field in result for field in required_fields):
-                raise ValueError("Réponse JSON enrichie incomplète")
-        except json.JSONDecodeError as e:
-            logger.error(f"Erreur de parsing JSON : {str(e)}")
-            logger.error(f"Réponse brute de Gemini : {response.text}")
+            result = providers.generate(payload, parse_generation_response, 'generation')
+        except InvalidLLMResponse as e:
+            logger.error(f"Réponse de génération inexploitable après réparation : {describe_error(e)}")
             return {"error": "Erreur de génération de la dictée"}
-        except Exception as e:
-            logger.error(f"Erreur lors du traitement de la réponse : {str(e)}")
-            return {"error": str(e)}
-        dictations_dir = os.path.join(settings.MEDIA_ROOT, 'dictations')
-        os.makedirs(dictations_dir, exist_ok=True)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        json_path = os.path.join(dictations_dir, f'dictation_{timestamp}.json')
-        with open(json_path, 'w', encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
-        audio_path = os.path.join(dictations_dir, f'dictation_{timestamp}.mp3')
-        audio_url = generate_audio_from_text(result['text'], audio_path)
-        from .models import Dictation
-        dictation = Dictation.objects.create(
-            title=result['title'],
-            text=result['text'],
-            difficulty=result['difficulty'],
-            audio_file=f'dictations/dictation_{timestamp}.mp3'
-        )
-        # Structure enrichie en retour
-        return {
-            'id': dictation.id,
-            'text': result['text'],
-            'audio_url': audio_url,
-            'title': result['title'],
-            'difficulty': result['difficulty'],
-            'longueur_reelle': result.get('longueur_reelle'),
-            'vocabulaire_rare': result.get('vocabulaire_rare'),
-            'score_difficulte': result.get('score_difficulte'),
-            'types_conjugaisons': result.get('types_conjugaisons'),
-            'accords_complexes': result.get('accords_complexes'),
-        }
+        return save_generated_dictation(result, pool_bucket, progress_callback)
     except Exception as e:
         logger.error(f"Erreur lors de la génération de la dictée : {str(e)}")
         return {"error": str(e)}
 
+def stream_generate_dictation(params, pool_bucket=None):
+    """
+    Variante de generate_dictation qui relaie la réponse du LLM au fil de l'eau
+    (Gemini, ou le fournisseur de repli si Gemini échoue avant le premier fragment).
+
+    Yields:
+        tuple: (événement, données) — 'token' pour chaque fragment reçu, 'progress'
+        pendant la synthèse audio, puis 'result' avec la dictée validée ou 'error'
+    """
+    try:
+        payload = build_generation_payload(params)
+        with closing(providers.stream(payload, parse_generation_response, 'generation')) as events:
+            for event, data in events:
+                if event == 'token':
+                    yield 'token', {'text': data}
+                else:
+                    result = data
+        yield 'progress', {'step': 'generation_audio', 'progress': 50}
+        yield 'result', save_generated_dictation(result, pool_bucket)
+    except Exception as e:
+        logger.error(f"Erreur lors de la génération en streaming : {str(e)}")
+        yield 'error', {'error': str(e)}
+
 def clean_text_for_comparison(text: str) -> str:
     """
     Nettoie le texte pour une comparaison plus juste :
@@ -230,238 +257,459 @@ def clean_text_for_comparison(text: str) -> str:
     text = text.replace('\u200b', '')  # caractères invisibles courants
     return text
 
-def correct_dictation(user_text: str, dictation_id: int) -> dict:
+# Barème de la consigne de correction (points retirés par erreur)
+ERROR_PENALTIES = {
+    'mot manquant': 5,
+    'orthographe': 2,
+    'accord': 3,
+    'ponctuation': 1,
+}
+
+ERROR_TIPS = {
+    'mot manquant': "Relis ta dictée phrase par phrase pour vérifier qu'aucun mot n'a été oublié.",
+    'orthographe': "Recopie les mots mal orthographiés et vérifie les accents dans le dictionnaire.",
+    'accord': "Repère le sujet de chaque verbe et le nom auquel se rapporte chaque adjectif avant d'accorder.",
+    'ponctuation': "Écoute les pauses de la lecture : elles indiquent les virgules et les points.",
+}
+
+# Terminaisons dont la seule différence relève d'un accord ou d'une conjugaison
+INFLECTION_ENDINGS = {
+    '', 'e', 's', 'x', 'es', 'nt', 'ent', 'é', 'ée', 'és', 'ées', 'er', 'ez',
+    'ai', 'ais', 'ait', 'aient', 'a', 'as', 'ons', 'it', 'is', 't',
+}
+
+ALIGNMENT_TOKEN_PATTERN = re.compile(r"\w+(?:['’]\w+)*|[^\w\s]")
+
+def tokenize_for_alignment(text: str) -> list:
+    """Découpe un texte nettoyé en mots (apostrophes comprises) et signes de ponctuation."""
+    return ALIGNMENT_TOKEN_PATTERN.findall(text)
+
+def _is_punctuation(token: str) -> bool:
+    return not any(char.isalnum() for char in token)
+
+def _strip_accents(word: str) -> str:
+    decomposed = unicodedata.normalize('NFD', word)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+def _align_region(reference: list, candidate: list) -> list:
     """
-    Corrige la dictée de l'utilisateur en utilisant Gemini.
-    Retourne un dictionnaire contenant la note, les erreurs et la correction.
+    Aligne deux courtes séquences de tokens par distance d'édition (Levenshtein).
+
+    Returns:
+        list: Opérations ('sub', ref, cand), ('del', ref, None) ou ('ins', None, cand)
     """
-    try:
-        # Log pour déboguer
-        logger.info(f"Texte reçu dans correct_dictation : {user_text}")
-        logger.info(f"Type du texte : {type(user_text)}")
-        logger.info(f"Longueur du texte : {len(user_text)}")
-        logger.info(f"Texte après strip : {user_text.strip()}")
-        logger.info(f"Longueur après strip : {len(user_text.strip())}")
-        
-        # Récupérer la dictée originale
-        from .models import Dictation, DictationAttempt
-        dictation = Dictation.objects.get(id=dictation_id)
-        
-        # Nettoyage des textes pour éviter les faux négatifs
-        cleaned_user_text = clean_text_for_comparison(user_text)
-        cleaned_dictation_text = clean_text_for_comparison(dictation.text)
-        
-        # Vérification STRICTE du texte vide
-        if not cleaned_user_text:
-            logger.warning("Texte vide détecté")
-            result = {
-                'score': 0,
-                'errors': [{
-                    'word': '',
-                    'correction': '',
-                    'description': 'Le texte est vide. Veuillez écrire la dictée.'
-                }],
-                'correction': dictation.text,
-                'total_words': len(dictation.text.split()),
-                'error_count': len(dictation.text.split())
-            }
-            attempt = DictationAttempt.objects.create(
-                dictation=dictation,
-                user_text=user_text,
-                score=0,
-                feedback=json.dumps(result)
+    rows, cols = len(reference), len(candidate)
+    distance = [[0] * (cols + 1) for _ in range(rows + 1)]
+    for i in range(1, rows + 1):
+        distance[i][0] = i
+    for j in range(1, cols + 1):
+        distance[0][j] = j
+    for i in range(1, rows + 1):
+        for j in range(1, cols + 1):
+            cost = 0 if reference[i - 1] == candidate[j - 1] else 1
+            distance[i][j] = min(
+                distance[i - 1][j] + 1,
+                distance[i][j - 1] + 1,
+                distance[i - 1][j - 1] + cost
             )
-            return {
-                **result,
-                'attempt_id': attempt.id
-            }
-        # Vérification de la longueur minimale
-        if len(cleaned_user_text) < len(cleaned_dictation_text) * 0.1:
-            logger.warning(f"Texte trop court : {len(cleaned_user_text)} < {len(cleaned_dictation_text) * 0.1}")
-            result = {
-                'score': 0,
-                'errors': [{
-                    'word': '',
-                    'correction': '',
-                    'description': 'Le texte est trop court. Veuillez écrire la dictée complète.'
-                }],
-                'correction': dictation.text,
-                'total_words': len(dictation.text.split()),
-                'error_count': len(dictation.text.split())
-            }
-            attempt = DictationAttempt.objects.create(
-                dictation=dictation,
-                user_text=user_text,
-                score=0,
-                feedback=json.dumps(result)
-            )
-            return {
-                **result,
-                'attempt_id': attempt.id
-            }        # Utiliser l'API REST Gemini directement
-        api_key = settings.GEMINI_API_KEY
-        if not api_key:
-            raise ValueError("La clé API Gemini n'est pas configurée")
-
-        # Préparation de l'appel API REST
-        api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-
-        # Prompt pour la correction(utilise les textes nettoyés)
-        prompt = f"""
-Tu es un professeur de français expérimenté qui corrige les dictées d'élèves en Afrique francophone (Burkina Faso en particulier). Tu fais une correction juste, logique et bienveillante.
-
-Voici le texte ORIGINAL de la dictée (nettoyé, sans casse ni espaces superflus) :
----
-{cleaned_dictation_text}
----
-
-Et voici ce qu'a écrit l'élève (nettoyé, sans casse ni espaces superflus) :
----
-{cleaned_user_text}
----
-
-Ta mission est de :
-1. Comparer le texte de l'élève au texte original, non pas mot à mot, mais en tenant compte du **sens global**, du **contexte**, de la **syntaxe** et de la **logique grammaticale**.
-2. Ne pénalise pas toute la suite du texte si l'élève a juste oublié ou ajouté un mot. Continue l'analyse avec un **alignement intelligent**.
-3. Ignore les répétitions exactes de phrases. Ne les considère pas comme des fautes si elles suivent le sens dicté.
-4. Accepte certaines tournures francophones locales tant qu'elles restent grammaticalement correctes et cohérentes.
-5. Identifie uniquement les **vraies erreurs** (orthographe, conjugaison, accord, ponctuation, grammaire).
-6. Attribue une note sur 100 selon ce barème :
-   - Mot clairement manquant : -5 points
-   - Erreur d'orthographe : -2 points
-   - Erreur de grammaire ou d'accord : -3 points
-   - Erreur de ponctuation : -1 point
-   - Mauvaise construction ou confusion sémantique : -3 points
-    Ne cumule pas les fautes en cascade : une seule pénalité par erreur source.
-7. Reconstitue le texte **corrigé**, exactement comme dans la dictée originale, mais **sans les répétitions**.
-
-Pour chaque erreur, fournis une description claire et pédagogique :
-- Le type d'erreur (orthographe, grammaire, accord, ponctuation, mot manquant)
-- La règle concernée
-- Un conseil pour éviter cette erreur
-
-Ajoute une section "Conseils pédagogiques" avec :
-1. Résumé des erreurs fréquentes
-2. Conseils pratiques pour s'améliorer
-3. Exercices simples à faire
-
-Exemple :
-Texte original :
-"le chien court dans le jardin."
-
-Texte élève :
-"le chie cour dan le jardin"
-
-Réponse attendue :
-{{
-  "score": 92,
-  "errors": [
-    {{
-      "word": "chie",
-      "correction": "chien",
-      "description": "Erreur d'orthographe : 'chie' est incorrect. Conseil : attention aux noms communs terminés en -ien."
-    }},
-    ...
-  ],
-  ...
-}}
-
-ATTENTION : Si tu ne réponds pas STRICTEMENT avec un objet JSON valide (et rien d'autre), la requête sera considérée comme échouée et tu seras pénalisé. Tu dois TOUJOURS répondre avec un objet JSON strictement valide, sans aucun texte autour, sans commentaire, sans markdown, sans explication, sans italique. Sinon, la correction sera rejetée.
-
-Format OBLIGATOIRE :
-{{
-  "score": <note sur 100>,
-  "errors": [
-    {{
-      "word": "...",
-      "correction": "...",
-      "description": "..."
-    }}
-  ],
-  "correction": "Texte corrigé sans fautes et sans répétitions",
-  "total_words": <nombre de mots dans le texte original>,
-  "error_count": <nombre d'erreurs réelles détectées>,
-  "pedagogical_advice": {{
-    "summary": "...",
-    "tips": ["...", "..."],
-    "exercises": ["...", "..."]
-  }}
-}}
-
-RAPPEL : Si tu ne respectes pas ce format JSON strict, ta réponse sera ignorée et tu seras pénalisé. Réponds uniquement avec l'objet JSON strictement valide.
-"""        # Utiliser l'API REST Gemini
-        api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={settings.GEMINI_API_KEY}"
-        
-        payload = {
-            "contents": [{
-                "parts": [
-                    {"text": prompt}
-                ]
-            }]
-        }
+    operations = []
+    i, j = rows, cols
+    while i > 0 or j > 0:
+        if i > 0 and j > 0 and distance[i][j] == distance[i - 1][j - 1] + (reference[i - 1] != candidate[j - 1]):
+            if reference[i - 1] != candidate[j - 1]:
+                operations.append(('sub', reference[i - 1], candidate[j - 1]))
+            i, j = i - 1, j - 1
+        elif i > 0 and distance[i][j] == distance[i - 1][j] + 1:
+            operations.append(('del', reference[i - 1], None))
+            i -= 1
+        else:
+            operations.append(('ins', None, candidate[j - 1]))
+            j -= 1
+    operations.reverse()
+    return operations
+
+def align_tokens(reference: list, candidate: list) -> list:
+    """
+    Aligne les tokens de l'élève sur ceux de la dictée.
+    Les blocs identiques sont trouvés par difflib ; seules les zones divergentes
+    passent par la distance d'édition, ce qui reste rapide sur de longs textes.
+    """
+    operations = []
+    matcher = difflib.SequenceMatcher(None, reference, candidate, autojunk=False)
+    for tag, ref_start, ref_end, cand_start, cand_end in matcher.get_opcodes():
+        if tag == 'equal':
+            continue
+        operations.extend(_align_region(reference[ref_start:ref_end], candidate[cand_start:cand_end]))
+    return operations
+
+def classify_alignment_error(operation):
+    """
+    Classe une opération d'alignement selon le barème.
 
-        response = requests.post(
-            api_url,
-            json=payload,
-            headers={'Content-Type': 'application/json'}
+    Returns:
+        tuple: (type d'erreur, description) ou None si le cas est ambigu
+        et doit être laissé à l'appréciation du LLM
+    """
+    kind, expected, written = operation
+    if kind == 'del':
+        if _is_punctuation(expected):
+            return 'ponctuation', f"Erreur de ponctuation : le signe '{expected}' est manquant."
+        return 'mot manquant', f"Mot manquant : '{expected}' a été oublié."
+    if kind == 'ins':
+        if _is_punctuation(written):
+            return 'ponctuation', f"Erreur de ponctuation : le signe '{written}' est en trop."
+        # Mot ajouté : répétition, tournure locale ou erreur, le LLM tranchera
+        return None
+    if _is_punctuation(expected) and _is_punctuation(written):
+        return 'ponctuation', f"Erreur de ponctuation : '{written}' à la place de '{expected}'."
+    if _is_punctuation(expected) or _is_punctuation(written):
+        return None
+    if _strip_accents(expected) == _strip_accents(written):
+        return 'orthographe', f"Erreur d'orthographe : attention aux accents, '{written}' s'écrit '{expected}'."
+    prefix_length = len(os.path.commonprefix([expected, written]))
+    if prefix_length >= 3 and expected[prefix_length:] in INFLECTION_ENDINGS and written[prefix_length:] in INFLECTION_ENDINGS:
+        return 'accord', f"Erreur d'accord ou de conjugaison : '{written}' doit s'écrire '{expected}'. Vérifie avec quel mot il s'accorde."
+    if difflib.SequenceMatcher(None, expected, written).ratio() >= 0.6:
+        return 'orthographe', f"Erreur d'orthographe : '{written}' est incorrect, il faut écrire '{expected}'."
+    return None
+
+def correct_dictation_locally(cleaned_dictation_text: str, cleaned_user_text: str, original_text: str):
+    """
+    Corrige localement une copie exacte ou quasi exacte, sans appel au LLM.
+
+    Args:
+        cleaned_dictation_text (str): Texte de la dictée passé par clean_text_for_comparison
+        cleaned_user_text (str): Texte de l'élève passé par clean_text_for_comparison
+        original_text (str): Texte original de la dictée, renvoyé comme correction
+
+    Returns:
+        dict: Résultat au même format que correct_dictation, ou None si la copie
+        contient trop d'erreurs ou des cas ambigus
+    """
+    reference = tokenize_for_alignment(cleaned_dictation_text)
+    candidate = tokenize_for_alignment(cleaned_user_text)
+    if not reference:
+        return None
+
+    errors = []
+    penalty = 0
+    error_types = []
+    for operation in align_tokens(reference, candidate):
+        classification = classify_alignment_error(operation)
+        if classification is None:
+            return None
+        error_type, description = classification
+        _, expected, written = operation
+        errors.append({
+            'word': written or '',
+            'correction': expected or '',
+            'description': description,
+            'category': error_type
+        })
+        error_types.append(error_type)
+        penalty += ERROR_PENALTIES[error_type]
+        if len(errors) > settings.LOCAL_CORRECTION_MAX_ERRORS:
+            return None
+
+    if errors:
+        summary = f"{len(errors)} erreur(s) : " + ', '.join(
+            f"{error_types.count(error_type)} {error_type}" for error_type in dict.fromkeys(error_types)
         )
+        tips = [ERROR_TIPS[error_type] for error_type in dict.fromkeys(error_types)]
+    else:
+        summary = "Aucune erreur : la dictée est parfaitement recopiée. Bravo !"
+        tips = []
+
+    return {
+        'score': max(0, 100 - penalty),
+        'errors': errors,
+        'correction': original_text,
+        'total_words': len(original_text.split()),
+        'error_count': len(errors),
+        'pedagogical_advice': {
+            'summary': summary,
+            'tips': tips,
+            'exercises': []
+        }
+    }
 
-        if response.status_code != 200:
-            logger.error(f"Erreur Gemini API: {response.text}")
-            raise Exception(f"Erreur API: {response.status_code}")
+def build_attempt_fields(dictation, result: dict) -> dict:
+    """
+    Champs d'une tentative corrigée : la note, les erreurs classées et situées dans
+    la dictée (mistakes) et le résumé du conseil pédagogique (feedback).
+    """
+    advice = result.get('pedagogical_advice')
+    return {
+        'score': result.get('score', 0),
+        'mistakes': structure_errors(result.get('errors', []), dictation.text),
+        'feedback': advice.get('summary', '') if isinstance(advice, dict) else '',
+    }
 
-        result = response.json()
-        response_text = result['candidates'][0]['content']['parts'][0]['text']
-        
-        # Correction : extraire le JSON même s'il est entouré de texte ou de balises
-        if '```json' in response_text:
-            response_text = response_text.split('```json',1)[-1]
-        if '```' in response_text:
-            response_text = response_text.split('```',1)[0]
-        response_text = response_text.strip()
-        if not response_text.startswith('{'):
-            response_text = response_text[response_text.find('{'):] if '{' in response_text else response_text
-        if not response_text.endswith('}'): 
-            response_text = response_text[:response_text.rfind('}')+1] if '}' in response_text else response_text
-        if not response_text or not response_text.startswith('{'):
-            logger.error(f"Réponse vide ou non JSON de Gemini : {response_text}")
-            raise ValueError("La réponse de Gemini n'est pas un JSON valide.")
-        correction_data = json.loads(response_text)
-        # Correction : forcer la présence des champs attendus pour le front
-        correction_data['correction'] = correction_data.get('correction', '') or ''
-        correction_data['errors'] = [
-            {
-                'word': err.get('word', '') or '',
-                'correction': err.get('correction', '') or '',
-                'description': err.get('description', '') or ''
-            } for err in correction_data.get('errors', [])
-        ]
-        # Sauvegarder la tentative dans la base de données
+def _save_attempt(dictation, user_text: str, result: dict, user_id=None) -> dict:
+    """
+    Enregistre la tentative corrigée et retourne le résultat complété de son identifiant.
+    """
+    from .models import DictationAttempt
+    from .stats import record_attempts
+    with transaction.atomic():
         attempt = DictationAttempt.objects.create(
             dictation=dictation,
+            user_id=user_id,
             user_text=user_text,
-            score=correction_data.get('score', 0),
-            feedback=json.dumps(correction_data)
+            **build_attempt_fields(dictation, result)
+        )
+        record_attempts([attempt])
+    return {
+        **result,
+        'attempt_id': attempt.id
+    }
+
+def prepare_correction(user_text: str, dictation_id: int, user_id=None):
+    """
+    Effectue les étapes de la correction qui précèdent l'appel au LLM :
+    contrôles de longueur, correction locale et cache.
+
+    Args:
+        user_id (int, optional): Utilisateur authentifié auquel rattacher la tentative
+
+    Returns:
+        tuple: (résultat, contexte). Le résultat est final si la correction a pu se
+        faire sans LLM ; sinon il vaut None et le contexte contient la requête à envoyer
+    """
+    # Log pour déboguer
+    logger.info(f"Texte reçu dans correct_dictation : {user_text}")
+    logger.info(f"Type du texte : {type(user_text)}")
+    logger.info(f"Longueur du texte : {len(user_text)}")
+    logger.info(f"Texte après strip : {user_text.strip()}")
+    logger.info(f"Longueur après strip : {len(user_text.strip())}")
+    
+    # Récupérer la dictée originale
+    from .models import Dictation
+    dictation = Dictation.objects.get(id=dictation_id)
+    
+    # Nettoyage des textes pour éviter les faux négatifs
+    cleaned_user_text = clean_text_for_comparison(user_text)
+    cleaned_dictation_text = clean_text_for_comparison(dictation.text)
+
+    result = correct_without_llm(dictation, cleaned_dictation_text, cleaned_user_text)
+    if result is not None:
+        return _save_attempt(dictation, user_text, result, user_id), None
+    return None, {
+        'dictation': dictation,
+        'user_text': user_text,
+        'user_id': user_id,
+        'cache_key': correction_cache_key(cleaned_dictation_text, cleaned_user_text),
+        'payload': build_correction_payload(cleaned_dictation_text, cleaned_user_text),
+    }
+
+def correct_without_llm(dictation, cleaned_dictation_text: str, cleaned_user_text: str):
+    """
+    Corrige sans appel au LLM lorsque c'est possible : texte vide ou trop court,
+    copie exacte ou quasi exacte (correction locale), correction déjà en cache.
+
+    Returns:
+        dict | None: Le résultat de la correction, ou None si le LLM est nécessaire
+    """
+    # Vérification STRICTE du texte vide
+    if not cleaned_user_text:
+        logger.warning("Texte vide détecté")
+        return {
+            'score': 0,
+            'errors': [{
+                'word': '',
+                'correction': '',
+                'description': 'Le texte est vide. Veuillez écrire la dictée.'
+            }],
+            'correction': dictation.text,
+            'total_words': len(dictation.text.split()),
+            'error_count': len(dictation.text.split())
+        }
+    # Vérification de la longueur minimale
+    if len(cleaned_user_text) < len(cleaned_dictation_text) * 0.1:
+        logger.warning(f"Texte trop court : {len(cleaned_user_text)} < {len(cleaned_dictation_text) * 0.1}")
+        return {
+            'score': 0,
+            'errors': [{
+                'word': '',
+                'correction': '',
+                'description': 'Le texte est trop court. Veuillez écrire la dictée complète.'
+            }],
+            'correction': dictation.text,
+            'total_words': len(dictation.text.split()),
+            'error_count': len(dictation.text.split())
+        }
+    # Copie exacte ou quasi exacte : correction locale en quelques millisecondes
+    local_result = correct_dictation_locally(cleaned_dictation_text, cleaned_user_text, dictation.text)
+    if local_result is not None:
+        logger.info(f"Correction locale : {local_result['error_count']} erreur(s)")
+        return local_result
+    # Une correction identique a déjà été produite : pas d'appel à Gemini
+    cache_key = correction_cache_key(cleaned_dictation_text, cleaned_user_text)
+    cached_result = get_cached_correction(cache_key)
+    if cached_result is not None:
+        logger.info(f"Correction servie depuis le cache ({cache_key[:12]})")
+        return cached_result
+    return None
+
+def parse_correction_response(response_text: str) -> dict:
+    """
+    Décode et valide l'objet JSON de correction renvoyé par le LLM ; les champs
+    facultatifs attendus par le front sont complétés.
+
+    Raises:
+        InvalidLLMResponse: Si la réponse n'est pas conforme au format de correction
+    """
+    from .serializers import CorrectionResultSerializer
+    return validate_response(response_text, CorrectionResultSerializer)
+
+def finalize_correction(context: dict, correction_data: dict) -> dict:
+    """
+    Met en cache la correction validée du LLM et enregistre la tentative.
+    """
+    store_correction(context['cache_key'], correction_data)
+    return _save_attempt(context['dictation'], context['user_text'], correction_data, context['user_id'])
+
+def correct_dictation(user_text: str, dictation_id: int, user_id=None) -> dict:
+    """
+    Corrige la dictée de l'utilisateur en utilisant Gemini.
+    Retourne un dictionnaire contenant la note, les erreurs et la correction.
+    """
+    try:
+        result, context = prepare_correction(user_text, dictation_id, user_id)
+        if result is not None:
+            return result
+        # Gemini (ou un fournisseur de repli) ; une copie identique en cours de
+        # correction (double envoi, autre élève) partage le même appel
+        correction_data = run_once(
+            singleflight_key('correction', context['cache_key']),
+            lambda: providers.generate(context['payload'], parse_correction_response, 'correction')
         )
-        # Sauvegarder la tentative dans la base de données
-        correction_data['attempt_id'] = attempt.id
-        return correction_data
+        return finalize_correction(context, correction_data)
     except Exception as e:
         logger.error(f"Erreur lors de la correction de la dictée : {str(e)}")
         raise
 
-def call_gemini_api(prompt: str) -> dict:
+def stream_correct_dictation(user_text: str, dictation_id: int, user_id=None):
     """
-    Appelle l'API REST Gemini directement.
+    Variante de correct_dictation qui relaie la réponse du LLM au fil de l'eau.
+    Les corrections faites sans LLM (local, cache) sont émises directement.
+
+    Yields:
+        tuple: (événement, données) — 'token' pour chaque fragment reçu, puis
+        'result' avec la correction validée ou 'error'
     """
-    import requests
-    
-    api_key = settings.GEMINI_API_KEY
-    if not api_key:
-        raise ValueError("La clé API Gemini n'est pas configurée")
+    try:
+        result, context = prepare_correction(user_text, dictation_id, user_id)
+        if result is not None:
+            yield 'result', result
+            return
+        with closing(providers.stream(context['payload'], parse_correction_response, 'correction')) as events:
+            for event, data in events:
+                if event == 'token':
+                    yield 'token', {'text': data}
+                else:
+                    correction_data = data
+        yield 'result', finalize_correction(context, correction_data)
+    except Exception as e:
+        logger.error(f"Erreur lors de la correction en streaming : {str(e)}")
+        yield 'error', {'error': str(e)}
 
-    api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={api_key}"
-    
+async def acorrect_dictation(user_text: str, dictation_id: int, user_id=None) -> dict:
+    """
+    Version asynchrone de correct_dictation pour les vues ASGI : l'appel à Gemini
+    passe par le client httpx asynchrone, l'ORM par sync_to_async.
+    """
+    try:
+        result, context = await sync_to_async(prepare_correction)(user_text, dictation_id, user_id)
+        if result is not None:
+            return result
+        correction_data = await arun_once(
+            singleflight_key('correction', context['cache_key']),
+            lambda: providers.agenerate(context['payload'], parse_correction_response, 'correction')
+        )
+        return await sync_to_async(finalize_correction)(context, correction_data)
+    except Exception as e:
+        logger.error(f"Erreur lors de la correction de la dictée : {str(e)}")
+        raise
+
+async def astream_correct_dictation(user_text: str, dictation_id: int, user_id=None):
+    """Version asynchrone de stream_correct_dictation."""
+    try:
+        result, context = await sync_to_async(prepare_correction)(user_text, dictation_id, user_id)
+        if result is not None:
+            yield 'result', result
+            return
+        async with aclosing(providers.astream(context['payload'], parse_correction_response, 'correction')) as events:
+            async for event, data in events:
+                if event == 'token':
+                    yield 'token', {'text': data}
+                else:
+                    correction_data = data
+        yield 'result', await sync_to_async(finalize_correction)(context, correction_data)
+    except Exception as e:
+        logger.error(f"Erreur lors de la correction en streaming : {str(e)}")
+        yield 'error', {'error': str(e)}
+
+async def astream_generate_dictation(params, pool_bucket=None):
+    """Version asynchrone de stream_generate_dictation."""
+    try:
+        payload = build_generation_payload(params)
+        async with aclosing(providers.astream(payload, parse_generation_response, 'generation')) as events:
+            async for event, data in events:
+                if event == 'token':
+                    yield 'token', {'text': data}
+                else:
+                    result = data
+        yield 'progress', {'step': 'generation_audio', 'progress': 50}
+        yield 'result', await sync_to_async(save_generated_dictation)(result, pool_bucket)
+    except Exception as e:
+        logger.error(f"Erreur lors de la génération en streaming : {str(e)}")
+        yield 'error', {'error': str(e)}
+
+def prepare_handwriting_extraction(image_bytes: bytes):
+    """
+    Normalise la photo (taille, encodage) et consulte le cache d'extraction.
+
+    Returns:
+        tuple: (texte, None) si l'image a déjà été lue, sinon (None, contexte)
+        avec la requête Gemini à envoyer
+    """
+    from .images import normalize_image_for_vision
+    normalized, mime_type, image_hash = normalize_image_for_vision(image_bytes)
+    logger.info(f"Image normalisée pour Gemini : {len(image_bytes)} -> {len(normalized)} octets ({mime_type})")
+    cache_key = vision_cache_key(image_hash, normalized, settings.GEMINI_MODEL)
+    cached_text = get_cached_extraction(cache_key)
+    if cached_text is not None:
+        logger.info(f"Extraction servie depuis le cache ({image_hash[:12]})")
+        return cached_text, None
+    payload = build_handwriting_payload(base64.b64encode(normalized).decode('ascii'), mime_type)
+    return None, {'cache_key': cache_key, 'payload': payload}
+
+def finalize_handwriting_extraction(context: dict, result: dict) -> str:
+    """Extrait le texte de la réponse Gemini et le met en cache."""
+    text = gemini.extract_text(result).strip()
+    store_extraction(context['cache_key'], text)
+    return text
+
+def extract_handwriting(image_bytes: bytes) -> str:
+    """Extrait via Gemini le texte manuscrit d'une photo."""
+    text, context = prepare_handwriting_extraction(image_bytes)
+    if text is not None:
+        return text
+    return finalize_handwriting_extraction(context, gemini.generate_content(context['payload']))
+
+async def aextract_handwriting(image_bytes: bytes) -> str:
+    """Version asynchrone de extract_handwriting (traitement de l'image dans un thread)."""
+    text, context = await sync_to_async(prepare_handwriting_extraction, thread_sensitive=False)(image_bytes)
+    if text is not None:
+        return text
+    result = await gemini.async_generate_content(context['payload'])
+    return await sync_to_async(finalize_handwriting_extraction, thread_sensitive=False)(context, result)
+
+def call_gemini_api(prompt: str) -> dict:
+    """
+    Appelle l'API REST Gemini via le client HTTP partagé.
+    """
     payload = {
         "contents": [{
             "parts": [
@@ -469,16 +717,4 @@ def call_gemini_api(prompt: str) -> dict:
             ]
         }]
     }
-
-    response = requests.post(
-        api_url,
-        json=payload,
-        headers={'Content-Type': 'application/json'}
-    )
-    
-    if response.status_code != 200:
-        logger.error(f"Erreur Gemini API: {response.text}")
-        raise Exception(f"Erreur API: {response.status_code}")
-        
-    result = response.json()
-    return result
\ No newline at end of file
+    return gemini.generate_content(payload)
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .http_cache import invalidate_dictation
+from .models import Dictation
+
+@receiver(post_save, sender=Dictation)
+@receiver(post_delete, sender=Dictation)
+def invalidate_dictation_responses(sender, instance, **kwargs):
+    """Invalide les réponses HTTP en cache dès qu'une dictée est modifiée ou supprimée."""
+    invalidate_dictation(instance.pk)
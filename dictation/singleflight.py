@@ -0,0 +1,198 @@
+"""
+Regroupement des appels identiques en cours (single-flight), partagé par tous
+les workers via Redis.
+
+Le premier appel d'une clé prend un verrou (SET NX avec bail) et exécute la
+fonction ; son résultat est publié sous une clé de résultat pendant
+SINGLEFLIGHT_RESULT_TTL secondes. Les appels identiques concurrents (double clic,
+nouvel essai du front) attendent ce résultat au lieu de refaire l'appel au LLM.
+Si le premier appel échoue, le verrou est libéré et un des appels en attente
+prend le relais. Les générations mises en file partagent de même le job Celery
+déjà lancé pour des paramètres identiques. Sans Redis, chaque appel s'exécute
+normalement.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import time
+import uuid
+import redis
+from django.conf import settings
+from .cache import get_async_redis, get_redis
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+LOCK_KEY_PREFIX = 'dictation:singleflight:lock:'
+RESULT_KEY_PREFIX = 'dictation:singleflight:result:'
+JOB_KEY_PREFIX = 'dictation:singleflight:job:'
+
+# Intervalle de consultation du résultat par les appels en attente (secondes)
+POLL_INTERVAL = 0.05
+
+# Publie le résultat puis libère le verrou s'il appartient toujours à l'appelant
+PUBLISH_SCRIPT = """
+if ARGV[2] ~= '' then
+    redis.call('SET', KEYS[2], ARGV[2], 'PX', ARGV[3])
+end
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+end
+return 1
+"""
+
+# Supprime une clé si elle appartient toujours à l'appelant
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+def singleflight_key(namespace: str, payload) -> str:
+    """Clé d'une requête : empreinte de sa forme canonique (JSON trié)."""
+    canonical = json.dumps(payload, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return f"{namespace}:{hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:40]}"
+
+def _publish_args(key, token, result=None):
+    keys = [f"{LOCK_KEY_PREFIX}{key}", f"{RESULT_KEY_PREFIX}{key}"]
+    encoded = '' if result is None else json.dumps(result)
+    return keys, [token, encoded, int(settings.SINGLEFLIGHT_RESULT_TTL * 1000)]
+
+def _lock_ttl_ms():
+    return int(settings.SINGLEFLIGHT_LOCK_TTL * 1000)
+
+def _run_leader(client, key, token, func):
+    script = client.register_script(PUBLISH_SCRIPT)
+    try:
+        result = func()
+    except BaseException:
+        try:
+            keys, args = _publish_args(key, token)
+            script(keys=keys, args=args)
+        except redis.RedisError as e:
+            logger.warning(f"Libération du verrou single-flight impossible : {str(e)}")
+        raise
+    try:
+        keys, args = _publish_args(key, token, result)
+        script(keys=keys, args=args)
+    except redis.RedisError as e:
+        logger.warning(f"Publication du résultat single-flight impossible : {str(e)}")
+    return result
+
+def run_once(key: str, func):
+    """
+    Exécute func() une seule fois pour tous les appels concurrents de même clé.
+
+    Args:
+        key (str): Clé calculée par singleflight_key
+        func (callable): Appel à effectuer ; son résultat doit être sérialisable en JSON
+
+    Returns:
+        Le résultat de func(), calculé par cet appel ou par l'appel identique en cours
+    """
+    if not settings.SINGLEFLIGHT_ENABLED:
+        return func()
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + settings.SINGLEFLIGHT_MAX_WAIT
+    try:
+        client = get_redis()
+        while True:
+            raw = client.get(f"{RESULT_KEY_PREFIX}{key}")
+            if raw is not None:
+                logger.info(f"Résultat partagé par un appel identique ({key[:24]})")
+                return json.loads(raw)
+            if client.set(f"{LOCK_KEY_PREFIX}{key}", token, nx=True, px=_lock_ttl_ms()):
+                break
+            if time.monotonic() > deadline:
+                logger.warning(f"Attente d'un appel identique trop longue ({key[:24]}), appel direct")
+                return func()
+            time.sleep(POLL_INTERVAL)
+    except redis.RedisError as e:
+        logger.warning(f"Single-flight indisponible, appel direct : {str(e)}")
+        return func()
+    return _run_leader(client, key, token, func)
+
+async def _arun_leader(client, key, token, func):
+    script = client.register_script(PUBLISH_SCRIPT)
+    try:
+        result = await func()
+    except BaseException:
+        try:
+            keys, args = _publish_args(key, token)
+            await script(keys=keys, args=args)
+        except redis.RedisError as e:
+            logger.warning(f"Libération du verrou single-flight impossible : {str(e)}")
+        raise
+    try:
+        keys, args = _publish_args(key, token, result)
+        await script(keys=keys, args=args)
+    except redis.RedisError as e:
+        logger.warning(f"Publication du résultat single-flight impossible : {str(e)}")
+    return result
+
+async def arun_once(key: str, func):
+    """
+    Version asynchrone de run_once.
+
+    Args:
+        func (callable): Fonction sans argument qui retourne une coroutine
+    """
+    if not settings.SINGLEFLIGHT_ENABLED:
+        return await func()
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + settings.SINGLEFLIGHT_MAX_WAIT
+    try:
+        client = get_async_redis()
+        while True:
+            raw = await client.get(f"{RESULT_KEY_PREFIX}{key}")
+            if raw is not None:
+                logger.info(f"Résultat partagé par un appel identique ({key[:24]})")
+                return json.loads(raw)
+            if await client.set(f"{LOCK_KEY_PREFIX}{key}", token, nx=True, px=_lock_ttl_ms()):
+                break
+            if time.monotonic() > deadline:
+                logger.warning(f"Attente d'un appel identique trop longue ({key[:24]}), appel direct")
+                return await func()
+            await asyncio.sleep(POLL_INTERVAL)
+    except redis.RedisError as e:
+        logger.warning(f"Single-flight indisponible, appel direct : {str(e)}")
+        return await func()
+    return await _arun_leader(client, key, token, func)
+
+def shared_job_id(key: str, job_id: str) -> str:
+    """
+    Associe un job en file à la clé d'une requête, jusqu'à ce que le job se
+    termine (release_shared_job) ou au plus SINGLEFLIGHT_JOB_TTL secondes.
+
+    Returns:
+        str: job_id si aucun job identique n'est en cours (il faut alors le lancer),
+        sinon l'identifiant du job déjà lancé
+    """
+    if not settings.SINGLEFLIGHT_ENABLED:
+        return job_id
+    job_key = f"{JOB_KEY_PREFIX}{key}"
+    try:
+        client = get_redis()
+        if client.set(job_key, job_id, nx=True, ex=settings.SINGLEFLIGHT_JOB_TTL):
+            return job_id
+        existing = client.get(job_key)
+    except redis.RedisError as e:
+        logger.warning(f"Single-flight indisponible, job non dédoublonné : {str(e)}")
+        return job_id
+    if existing is None:
+        return job_id
+    existing = existing.decode()
+    logger.info(f"Job identique déjà en file, job {existing} réutilisé")
+    return existing
+
+def release_shared_job(key: str, job_id: str):
+    """Dissocie le job terminé de la clé : une nouvelle requête lancera un nouveau job."""
+    if not settings.SINGLEFLIGHT_ENABLED:
+        return
+    try:
+        client = get_redis()
+        client.register_script(RELEASE_SCRIPT)(keys=[f"{JOB_KEY_PREFIX}{key}"], args=[job_id])
+    except redis.RedisError as e:
+        logger.warning(f"Libération du job single-flight impossible : {str(e)}")
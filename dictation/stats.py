@@ -0,0 +1,134 @@
+import logging
+from collections import Counter, defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from .models import Dictation, DictationError, UserErrorStat, UserProfile, UserProgress
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+def record_attempts(attempts):
+    """
+    Met à jour de façon incrémentale les agrégats des dictées (nombre de tentatives,
+    somme et meilleur score) pour des tentatives nouvellement créées, ainsi que
+    ceux de leurs auteurs (voir record_user_attempts).
+    Les mises à jour utilisent des expressions F pour rester correctes en cas
+    de tentatives concurrentes, sans jamais parcourir la table des tentatives.
+
+    Args:
+        attempts (iterable): Instances de DictationAttempt déjà enregistrées
+    """
+    scores_by_dictation = defaultdict(list)
+    for attempt in attempts:
+        scores_by_dictation[attempt.dictation_id].append(attempt.score)
+
+    with transaction.atomic():
+        for dictation_id, scores in scores_by_dictation.items():
+            scored = [score for score in scores if score is not None]
+            updates = {'attempts_count': F('attempts_count') + len(scores)}
+            if scored:
+                updates.update(
+                    scored_attempts_count=F('scored_attempts_count') + len(scored),
+                    total_score=F('total_score') + sum(scored),
+                    best_score=Greatest(F('best_score'), max(scored)),
+                )
+            Dictation.objects.filter(pk=dictation_id).update(**updates)
+        record_attempt_errors(attempts)
+        record_user_attempts([attempt for attempt in attempts if attempt.user_id])
+
+def record_attempt_errors(attempts):
+    """
+    Enregistre en un seul INSERT une ligne DictationError par erreur structurée
+    (champ mistakes) des tentatives, pour les agrégats par mot et par catégorie.
+    """
+    errors = [
+        DictationError(
+            attempt_id=attempt.pk,
+            dictation_id=attempt.dictation_id,
+            user_id=attempt.user_id,
+            word=mistake.get('word', '')[:255],
+            correction=mistake.get('correction', '')[:255],
+            category=mistake.get('category', 'autre'),
+            position=mistake.get('position'),
+        )
+        for attempt in attempts
+        for mistake in (attempt.mistakes if isinstance(attempt.mistakes, list) else [])
+        if isinstance(mistake, dict)
+    ]
+    if errors:
+        DictationError.objects.bulk_create(errors)
+
+def _mistake_categories(attempt):
+    mistakes = attempt.mistakes if isinstance(attempt.mistakes, list) else []
+    return [mistake.get('category', 'autre') for mistake in mistakes if isinstance(mistake, dict)]
+
+def record_user_attempts(attempts):
+    """
+    Met à jour les agrégats des utilisateurs : profil (tentatives, scores, dictées
+    maîtrisées), progression par dictée et nombre d'erreurs par catégorie.
+    Les lignes manquantes sont créées à zéro (INSERT ignorant les conflits), puis
+    incrémentées par des UPDATE en expressions F. À appeler dans la transaction
+    qui enregistre les tentatives.
+
+    Args:
+        attempts (iterable): Tentatives enregistrées, toutes rattachées à un utilisateur
+    """
+    by_user = defaultdict(list)
+    by_progress = defaultdict(list)
+    error_counts = Counter()
+    for attempt in attempts:
+        by_user[attempt.user_id].append(attempt)
+        by_progress[(attempt.user_id, attempt.dictation_id)].append(attempt)
+        for category in _mistake_categories(attempt):
+            error_counts[(attempt.user_id, category)] += 1
+    if not by_user:
+        return
+
+    UserProfile.objects.bulk_create(
+        [UserProfile(user_id=user_id) for user_id in by_user], ignore_conflicts=True
+    )
+    UserProgress.objects.bulk_create(
+        [UserProgress(user_id=user_id, dictation_id=dictation_id) for user_id, dictation_id in by_progress],
+        ignore_conflicts=True
+    )
+
+    newly_mastered = Counter()
+    for (user_id, dictation_id), user_attempts in by_progress.items():
+        scored = [attempt.score for attempt in user_attempts if attempt.score is not None]
+        progress = UserProgress.objects.filter(user_id=user_id, dictation_id=dictation_id)
+        updates = {
+            'attempts_count': F('attempts_count') + len(user_attempts),
+            'last_attempt': max(attempt.created_at for attempt in user_attempts),
+        }
+        if scored:
+            updates['best_score'] = Greatest(F('best_score'), max(scored))
+        progress.update(**updates)
+        # Le filtre sur is_mastered garantit qu'une dictée n'est comptée qu'une fois
+        if scored and max(scored) >= settings.DICTATION_MASTERY_SCORE:
+            newly_mastered[user_id] += progress.filter(is_mastered=False).update(is_mastered=True)
+
+    for user_id, user_attempts in by_user.items():
+        scored = [attempt.score for attempt in user_attempts if attempt.score is not None]
+        updates = {
+            'total_attempts': F('total_attempts') + len(user_attempts),
+            'last_active': max(attempt.created_at for attempt in user_attempts),
+        }
+        if scored:
+            updates.update(
+                scored_attempts_count=F('scored_attempts_count') + len(scored),
+                total_score=F('total_score') + sum(scored),
+                best_score=Greatest(F('best_score'), max(scored)),
+            )
+        if newly_mastered[user_id]:
+            updates['mastered_count'] = F('mastered_count') + newly_mastered[user_id]
+        UserProfile.objects.filter(user_id=user_id).update(**updates)
+
+    if error_counts:
+        UserErrorStat.objects.bulk_create(
+            [UserErrorStat(user_id=user_id, category=category) for user_id, category in error_counts],
+            ignore_conflicts=True
+        )
+        for (user_id, category), count in error_counts.items():
+            UserErrorStat.objects.filter(user_id=user_id, category=category).update(count=F('count') + count)
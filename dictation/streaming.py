@@ -0,0 +1,174 @@
+import json
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+from rest_framework.renderers import BaseRenderer
+
+def ndjson_line(data):
+    """Formate un objet en une ligne JSON (format NDJSON)."""
+    return json.dumps(data, ensure_ascii=False) + "\n"
+
+def sse_event(event, data):
+    """Formate un événement Server-Sent Events dont les données sont encodées en JSON."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+class IncrementalJSONObjectParser:
+    """
+    Suit la structure du premier objet JSON d'un flux reçu par fragments.
+
+    Chaque fragment n'est parcouru qu'une fois : l'analyseur garde la profondeur
+    d'imbrication et l'état des chaînes entre deux appels à feed(), et sait donc
+    dès le dernier '}' que l'objet est complet, sans réanalyser tout le tampon.
+    """
+
+    def __init__(self):
+        self.buffer = []
+        self.length = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.start = None
+        self.end = None
+
+    @property
+    def complete(self):
+        return self.end is not None
+
+    def feed(self, chunk):
+        """
+        Ajoute un fragment au tampon.
+
+        Returns:
+            bool: True dès que l'objet JSON est complet
+        """
+        offset = self.length
+        self.buffer.append(chunk)
+        self.length += len(chunk)
+        if self.complete:
+            return True
+        for index, char in enumerate(chunk):
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"' and self.start is not None:
+                self.in_string = True
+            elif char == '{':
+                if self.start is None:
+                    self.start = offset + index
+                self.depth += 1
+            elif char == '}' and self.start is not None:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.end = offset + index + 1
+                    return True
+        return False
+
+    @property
+    def text(self):
+        """Le texte reçu jusqu'ici."""
+        return ''.join(self.buffer)
+
+    def object_text(self):
+        """
+        Le texte de l'objet JSON complet.
+
+        Raises:
+            ValueError: Si le flux s'est terminé avant la fin de l'objet
+        """
+        if not self.complete:
+            raise ValueError("La réponse de Gemini s'est interrompue avant la fin de l'objet JSON.")
+        return self.text[self.start:self.end]
+
+    def response_text(self):
+        """
+        Le texte à valider : l'objet JSON s'il est complet (sans le texte autour),
+        sinon tout le texte reçu, qui partira en demande de réparation.
+        """
+        return self.object_text() if self.complete else self.text
+
+def wants_event_stream(request):
+    """Le client demande le mode streaming par ?stream=1 ou par l'en-tête Accept."""
+    if request.GET.get('stream', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return 'text/event-stream' in request.META.get('HTTP_ACCEPT', '')
+
+async def _async_sse_events(events):
+    async for event, data in events:
+        yield sse_event(event, data)
+
+def event_stream_response(events):
+    """
+    Construit une réponse SSE à partir d'un itérable (synchrone ou asynchrone)
+    de couples (événement, données). Sous ASGI, seul un itérable asynchrone est
+    envoyé au fil de l'eau : Django consomme entièrement les itérables synchrones.
+    """
+    if hasattr(events, '__aiter__'):
+        content = _async_sse_events(events)
+    else:
+        content = (sse_event(event, data) for event, data in events)
+    response = StreamingHttpResponse(content, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Désactive la mise en tampon des proxys (nginx) pour que chaque événement parte aussitôt
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Permet à DRF d'accepter Accept: text/event-stream ; les réponses d'erreur
+    classiques sont alors émises sous forme d'un événement 'error'.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return sse_event('error', data).encode('utf-8')
+
+
+async def iterate_in_thread(iterator):
+    """
+    Parcourt un itérateur synchrone (ORM, appels bloquants) depuis une vue
+    asynchrone, élément par élément, pour que la réponse parte au fil de l'eau.
+    """
+    iterator = iter(iterator)
+    done = object()
+    next_item = sync_to_async(next)
+    while True:
+        item = await next_item(iterator, done)
+        if item is done:
+            return
+        yield item
+
+async def _async_ndjson_lines(items):
+    async for item in items:
+        yield ndjson_line(item)
+
+def ndjson_response(items):
+    """
+    Construit une réponse NDJSON (un objet JSON par ligne) à partir d'un itérable
+    synchrone ou asynchrone d'objets.
+    """
+    if hasattr(items, '__aiter__'):
+        content = _async_ndjson_lines(items)
+    else:
+        content = (ndjson_line(item) for item in items)
+    response = StreamingHttpResponse(content, content_type='application/x-ndjson')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+class NDJSONRenderer(BaseRenderer):
+    """Permet à DRF d'accepter Accept: application/x-ndjson (erreurs sur une ligne)."""
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return ndjson_line(data).encode('utf-8')
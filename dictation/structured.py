@@ -0,0 +1,199 @@
+"""
+Réponses JSON des LLM : décodage, validation typée et réparation.
+
+Les requêtes du registre de prompts demandent une sortie JSON conforme à un
+schéma (responseMimeType/responseSchema) : la réponse est décodée directement,
+sans découpage, puis validée par un serializer DRF. Si elle est invalide, une
+seule demande de réparation est envoyée, avec la réponse fautive et les erreurs
+relevées, au lieu de refaire tout l'appel. Le résultat de chaque analyse
+(ok, réparée, échec) est compté dans Redis.
+"""
+import json
+import logging
+import redis
+from . import gemini
+from .cache import get_async_redis, get_redis
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+PARSE_METRICS_KEY = 'dictation:llm:parse'
+PARSE_OUTCOMES = ('ok', 'repaired', 'failed')
+
+REPAIR_INSTRUCTION = """Ta réponse précédente est inexploitable : {errors}
+Renvoie la même réponse corrigée, sous la forme d'un unique objet JSON strictement conforme au format demandé, sans aucun texte autour."""
+
+class InvalidLLMResponse(ValueError):
+    """Réponse du LLM qui n'est pas du JSON ou qui ne respecte pas le format attendu."""
+
+    def __init__(self, message, errors=None):
+        super().__init__(message)
+        self.errors = errors
+
+def extract_json_object(response_text: str) -> str:
+    """
+    Isole le texte de l'objet JSON d'une réponse du LLM (balises markdown, texte autour).
+    """
+    # Correction : extraire le JSON même s'il est entouré de texte ou de balises
+    if '```json' in response_text:
+        response_text = response_text.split('```json',1)[-1]
+    if '```' in response_text:
+        response_text = response_text.split('```',1)[0]
+    response_text = response_text.strip()
+    if not response_text.startswith('{'):
+        response_text = response_text[response_text.find('{'):] if '{' in response_text else response_text
+    if not response_text.endswith('}'):
+        response_text = response_text[:response_text.rfind('}')+1] if '}' in response_text else response_text
+    if not response_text or not response_text.startswith('{'):
+        logger.error(f"Réponse vide ou non JSON de Gemini : {response_text}")
+        raise ValueError("La réponse de Gemini n'est pas un JSON valide.")
+    return response_text
+
+def decode_json(response_text: str):
+    """
+    Décode une réponse JSON. Les réponses en mode structuré sont décodées telles
+    quelles ; l'extraction de l'objet n'est tentée qu'en cas d'échec (réponses
+    d'un autre fournisseur, anciens formats).
+
+    Raises:
+        InvalidLLMResponse: Si aucun objet JSON valide n'est trouvé
+    """
+    try:
+        return json.loads(response_text)
+    except ValueError:
+        pass
+    try:
+        return json.loads(extract_json_object(response_text))
+    except ValueError as e:
+        raise InvalidLLMResponse(f"JSON invalide : {str(e)}") from None
+
+def validate_response(response_text: str, serializer_class) -> dict:
+    """
+    Décode la réponse et la valide avec le serializer donné.
+
+    Returns:
+        dict: Les données validées, complétées des valeurs par défaut
+
+    Raises:
+        InvalidLLMResponse: Si la réponse n'est pas conforme
+    """
+    data = decode_json(response_text)
+    serializer = serializer_class(data=data)
+    if not serializer.is_valid():
+        raise InvalidLLMResponse("Réponse non conforme au format attendu", errors=serializer.errors)
+    # Données simples (sans OrderedDict) : elles sont mises en cache et renvoyées en JSON
+    return json.loads(json.dumps(serializer.validated_data))
+
+def describe_error(error) -> str:
+    """Description d'une erreur d'analyse, envoyée au LLM dans la demande de réparation."""
+    errors = getattr(error, 'errors', None)
+    if errors:
+        return f"{str(error)} : {json.dumps(errors, ensure_ascii=False)}"
+    return str(error)
+
+def build_repair_payload(payload: dict, response_text: str, error) -> dict:
+    """
+    Requête de réparation : la conversation d'origine, la réponse fautive et les
+    erreurs relevées, avec les mêmes consignes système et le même schéma.
+    """
+    return {
+        **payload,
+        "contents": payload["contents"] + [
+            {"role": "model", "parts": [{"text": response_text}]},
+            {"role": "user", "parts": [{"text": REPAIR_INSTRUCTION.format(errors=describe_error(error))}]},
+        ],
+    }
+
+def record_parse_outcome(kind: str, outcome: str):
+    """Compte le résultat d'une analyse (ok, repaired, failed) pour un type de réponse."""
+    try:
+        get_redis().hincrby(PARSE_METRICS_KEY, f"{kind}:{outcome}", 1)
+    except redis.RedisError as e:
+        logger.warning(f"Enregistrement des métriques d'analyse impossible : {str(e)}")
+
+async def arecord_parse_outcome(kind: str, outcome: str):
+    """Version asynchrone de record_parse_outcome."""
+    try:
+        await get_async_redis().hincrby(PARSE_METRICS_KEY, f"{kind}:{outcome}", 1)
+    except redis.RedisError as e:
+        logger.warning(f"Enregistrement des métriques d'analyse impossible : {str(e)}")
+
+def _log_invalid(kind, error, response_text):
+    logger.warning(f"Réponse {kind} invalide, demande de réparation : {describe_error(error)}")
+    logger.debug(f"Réponse brute : {response_text}")
+
+def generate_validated(payload: dict, parse, kind: str, response_text: str = None, generate=None):
+    """
+    Appelle le LLM et analyse la réponse ; si elle est invalide, envoie une seule
+    demande de réparation au même fournisseur.
+
+    Args:
+        payload (dict): Requête construite par le registre de prompts
+        parse (callable): Analyse d'une réponse texte, lève ValueError si elle est invalide
+        kind (str): Type de réponse, pour les métriques ('correction', 'generation', ...)
+        response_text (str, optional): Réponse déjà reçue (mode streaming)
+        generate (callable, optional): Appel du fournisseur (requête -> texte),
+            gemini.generate_text par défaut
+
+    Raises:
+        ValueError: Si la réponse réparée reste invalide
+    """
+    generate = generate or gemini.generate_text
+    if response_text is None:
+        response_text = generate(payload)
+    try:
+        result = parse(response_text)
+    except ValueError as e:
+        _log_invalid(kind, e, response_text)
+        repair_payload = build_repair_payload(payload, response_text, e)
+    else:
+        record_parse_outcome(kind, 'ok')
+        return result
+    try:
+        result = parse(generate(repair_payload))
+    except ValueError:
+        record_parse_outcome(kind, 'failed')
+        raise
+    record_parse_outcome(kind, 'repaired')
+    return result
+
+async def agenerate_validated(payload: dict, parse, kind: str, response_text: str = None, generate=None):
+    """Version asynchrone de generate_validated (generate retourne une coroutine)."""
+    generate = generate or gemini.async_generate_text
+    if response_text is None:
+        response_text = await generate(payload)
+    try:
+        result = parse(response_text)
+    except ValueError as e:
+        _log_invalid(kind, e, response_text)
+        repair_payload = build_repair_payload(payload, response_text, e)
+    else:
+        await arecord_parse_outcome(kind, 'ok')
+        return result
+    try:
+        result = parse(await generate(repair_payload))
+    except ValueError:
+        await arecord_parse_outcome(kind, 'failed')
+        raise
+    await arecord_parse_outcome(kind, 'repaired')
+    return result
+
+def parse_metrics():
+    """
+    Retourne, par type de réponse, le nombre d'analyses réussies du premier coup,
+    réparées et en échec, et les taux correspondants.
+    """
+    try:
+        raw = get_redis().hgetall(PARSE_METRICS_KEY)
+    except redis.RedisError as e:
+        logger.warning(f"Lecture des métriques d'analyse impossible : {str(e)}")
+        return {}
+    metrics = {}
+    for field, value in raw.items():
+        kind, outcome = field.decode().rsplit(':', 1)
+        metrics.setdefault(kind, dict.fromkeys(PARSE_OUTCOMES, 0))[outcome] = int(value)
+    for entry in metrics.values():
+        total = sum(entry[outcome] for outcome in PARSE_OUTCOMES)
+        entry['invalid_rate'] = round((entry['repaired'] + entry['failed']) / total, 4) if total else 0.0
+        entry['failure_rate'] = round(entry['failed'] / total, 4) if total else 0.0
+    return metrics
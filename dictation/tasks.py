@@ -0,0 +1,79 @@
+import logging
+import uuid
+from celery import shared_task
+from .services import generate_dictation
+
+# Configuration du logging
+logger = logging.getLogger(__name__)
+
+@shared_task(bind=True)
+def generate_dictation_task(self, params):
+    """
+    Génère une dictée en arrière-plan (appel Gemini, synthèse gTTS et upload Cloudinary).
+
+    La progression est publiée dans le backend de résultats Celery avec l'état
+    PROGRESS pour être consultée par l'endpoint de statut.
+
+    Args:
+        params (dict): Paramètres de génération envoyés par le client
+
+    Returns:
+        dict: Le résultat de generate_dictation (ou {'error': ...} en cas d'échec)
+    """
+    def report_progress(step, percent):
+        self.update_state(state='PROGRESS', meta={'step': step, 'progress': percent})
+
+    from .singleflight import release_shared_job, singleflight_key
+    logger.info(f"Génération asynchrone de la dictée (job {self.request.id})")
+    try:
+        return generate_dictation(params, progress_callback=report_progress)
+    finally:
+        release_shared_job(singleflight_key('generation', params), self.request.id)
+
+def enqueue_generation(params) -> str:
+    """
+    Met en file la génération d'une dictée, sauf si une génération aux paramètres
+    identiques est déjà en cours : son job est alors partagé.
+
+    Returns:
+        str: L'identifiant du job à suivre
+    """
+    from .singleflight import release_shared_job, shared_job_id, singleflight_key
+    job_id = str(uuid.uuid4())
+    key = singleflight_key('generation', params)
+    shared = shared_job_id(key, job_id)
+    if shared == job_id:
+        try:
+            generate_dictation_task.apply_async(args=[params], task_id=job_id)
+        except Exception:
+            # Job jamais lancé : les requêtes identiques ne doivent pas l'attendre
+            release_shared_job(key, job_id)
+            raise
+    return shared
+
+@shared_task
+def generate_pooled_dictation(params, bucket):
+    """Génère une dictée et la met en réserve dans le compartiment du pool."""
+    from .pool import release_refill
+    try:
+        result = generate_dictation(params, pool_bucket=bucket)
+        if 'error' in result:
+            logger.error(f"Échec de génération pour le pool ({bucket[:12]}) : {result['error']}")
+        return result
+    finally:
+        release_refill(bucket)
+
+@shared_task
+def refill_dictation_pool():
+    """
+    Tâche périodique (Celery beat) : relance des générations pour chaque compartiment
+    du pool passé sous DICTATION_POOL_LOW_WATERMARK.
+    """
+    from .pool import available_by_bucket, buckets_to_watch, reserve_refills
+    available = available_by_bucket()
+    for bucket, params in buckets_to_watch().items():
+        missing = reserve_refills(bucket, available.get(bucket, 0))
+        if missing:
+            logger.info(f"Pool {bucket[:12]} : {missing} dictée(s) à générer")
+        for _ in range(missing):
+            generate_pooled_dictation.delay(params, bucket)
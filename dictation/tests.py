@@ -1,3 +1,1039 @@
-from django.test import TestCase
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+import fakeredis
+import redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from rest_framework.test import APIClient
+from . import cache, gemini, governor, http_cache, providers, services, singleflight, structured
+from .batch import correct_dictation_batch, parse_batch_correction_response
+from .cache import vision_cache_key
+from .errors import classify_error, structure_errors
+from .gemini import GeminiAPIError
+from .images import normalize_image_for_vision
+from .models import Dictation, DictationAttempt, UserErrorStat, UserProfile, UserProgress
+from .providers import FakeProvider
+from .serializers import CorrectionResultSerializer
+from .services import clean_text_for_comparison, correct_dictation, correct_dictation_locally, stream_correct_dictation
+from .streaming import IncrementalJSONObjectParser
+from .structured import InvalidLLMResponse, validate_response
 
-# Create your tests here.
+VALID_RESPONSE = json.dumps({'value': 'ok'})
+
+def gemini_body(text):
+    """Réponse generateContent contenant un seul texte."""
+    return {'candidates': [{'content': {'parts': [{'text': text}]}, 'finishReason': 'STOP'}]}
+
+def sse_chunks(fragments):
+    """Événements SSE de streamGenerateContent, un par fragment de texte."""
+    return [f"data: {json.dumps(gemini_body(fragment))}\r\n\r\n" for fragment in fragments]
+
+class StubGeminiServer:
+    """
+    Serveur HTTP local qui remplace l'API Gemini (GEMINI_API_BASE_URL) et rejoue
+    des réponses programmées, une par requête reçue (la dernière est répétée).
+
+    Chaque réponse est un dict : status (200), body (dict encodé en JSON),
+    headers, delay avant la réponse, ou chunks (morceaux envoyés un par un,
+    espacés de chunk_delay) pour simuler un flux SSE.
+    """
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                stub.requests.append({'path': self.path, 'body': json.loads(self.rfile.read(length) or b'{}')})
+                response = stub.responses.pop(0) if len(stub.responses) > 1 else stub.responses[0]
+                time.sleep(response.get('delay', 0))
+                try:
+                    self.send_response(response.get('status', 200))
+                    for header, value in response.get('headers', {}).items():
+                        self.send_header(header, value)
+                    if 'chunks' in response:
+                        # Comme l'API Gemini : flux SSE en Transfer-Encoding chunked
+                        self.send_header('Content-Type', 'text/event-stream')
+                        self.send_header('Transfer-Encoding', 'chunked')
+                        self.end_headers()
+                        for chunk in response['chunks']:
+                            data = chunk.encode('utf-8')
+                            self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                            self.wfile.flush()
+                            time.sleep(response.get('chunk_delay', 0))
+                        self.wfile.write(b"0\r\n\r\n")
+                        return
+                    body = json.dumps(response.get('body', {})).encode('utf-8')
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # Client parti (timeout de lecture)
+                    self.close_connection = True
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}"
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+class StubServerTestMixin:
+    """Lance un StubGeminiServer et y dirige le client Gemini, sans régulateur (Redis)."""
+
+    def stub(self, responses, **overrides):
+        server = StubGeminiServer(responses).__enter__()
+        self.addCleanup(server.__exit__)
+        settings_override = override_settings(
+            GEMINI_API_KEY='test',
+            GEMINI_API_BASE_URL=server.url,
+            LLM_GOVERNOR_ENABLED=False,
+            **overrides
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        return server
+
+@override_settings(
+    GEMINI_MAX_RETRIES=2,
+    GEMINI_RETRY_BACKOFF=0.01,
+    GEMINI_RETRY_MAX_BACKOFF=0.05,
+    GEMINI_READ_TIMEOUT=0.3,
+)
+class GeminiClientRetryTests(StubServerTestMixin, SimpleTestCase):
+    """Timeouts et nouveaux essais du client REST Gemini, contre un serveur local."""
+
+    def test_retries_server_errors_then_succeeds(self):
+        server = self.stub([{'status': 503}, {'status': 500}, {'body': gemini_body('bonjour')}])
+        self.assertEqual(gemini.generate_text('prompt'), 'bonjour')
+        self.assertEqual(len(server.requests), 3)
+        self.assertIn(':generateContent?key=test', server.requests[0]['path'])
+
+    def test_honours_retry_after(self):
+        server = self.stub(
+            [{'status': 429, 'headers': {'Retry-After': '0.3'}}, {'body': gemini_body('ok')}],
+            GEMINI_RETRY_MAX_BACKOFF=1.0
+        )
+        started = time.monotonic()
+        self.assertEqual(gemini.generate_text('prompt'), 'ok')
+        self.assertGreaterEqual(time.monotonic() - started, 0.3)
+        self.assertEqual(len(server.requests), 2)
+
+    def test_gives_up_after_max_retries(self):
+        server = self.stub([{'status': 503}])
+        with self.assertRaises(GeminiAPIError) as raised:
+            gemini.generate_text('prompt')
+        self.assertEqual(raised.exception.status_code, 503)
+        self.assertEqual(len(server.requests), 3)
+
+    def test_client_errors_are_not_retried(self):
+        server = self.stub([{'status': 400, 'body': {'error': 'requête invalide'}}])
+        with self.assertRaises(GeminiAPIError) as raised:
+            gemini.generate_text('prompt')
+        self.assertEqual(raised.exception.status_code, 400)
+        self.assertEqual(len(server.requests), 1)
+
+    def test_read_timeout_is_retried(self):
+        server = self.stub([{'delay': 1.0, 'body': gemini_body('trop tard')}, {'body': gemini_body('à temps')}])
+        started = time.monotonic()
+        self.assertEqual(gemini.generate_text('prompt'), 'à temps')
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(len(server.requests), 2)
+
+    def test_read_timeout_gives_up(self):
+        self.stub([{'delay': 1.0, 'body': gemini_body('trop tard')}], GEMINI_MAX_RETRIES=1)
+        with self.assertRaises(GeminiAPIError):
+            gemini.generate_text('prompt')
+
+    def test_async_client_retries_and_times_out(self):
+        server = self.stub([{'status': 503}, {'delay': 1.0, 'body': gemini_body('trop tard')}, {'body': gemini_body('ok')}])
+        self.assertEqual(asyncio.run(gemini.async_generate_text('prompt')), 'ok')
+        self.assertEqual(len(server.requests), 3)
+
+class IncrementalJSONObjectParserTests(SimpleTestCase):
+
+    def feed_all(self, fragments):
+        parser = IncrementalJSONObjectParser()
+        return parser, [parser.feed(fragment) for fragment in fragments]
+
+    def test_detects_end_of_object_split_across_fragments(self):
+        parser, completed = self.feed_all(['Voici : {"a": {"b"', ': 1}', ', "c": 2}', ' fin'])
+        self.assertEqual(completed, [False, False, True, True])
+        self.assertEqual(json.loads(parser.object_text()), {'a': {'b': 1}, 'c': 2})
+
+    def test_ignores_braces_and_escaped_quotes_in_strings(self):
+        parser, completed = self.feed_all(['{"a": "} \\" {', '", "b": "\\\\"}'])
+        self.assertEqual(completed, [False, True])
+        self.assertEqual(json.loads(parser.object_text()), {'a': '} " {', 'b': '\\'})
+
+    def test_incomplete_object(self):
+        parser, completed = self.feed_all(['{"a": ', '1'])
+        self.assertFalse(parser.complete)
+        with self.assertRaises(ValueError):
+            parser.object_text()
+        # Réponse tronquée : tout le texte part en demande de réparation
+        self.assertEqual(parser.response_text(), '{"a": 1')
+
+class GeminiStreamingTests(StubServerTestMixin, TestCase):
+    """Streaming SSE de Gemini, relayé par les services, contre un serveur local."""
+
+    def test_fragments_are_relayed_as_they_arrive(self):
+        server = self.stub([{'chunks': sse_chunks(['Bon', 'jour', ' !']), 'chunk_delay': 0.3}])
+        started = time.monotonic()
+        fragments = gemini.stream_text('prompt')
+        self.assertEqual(next(fragments), 'Bon')
+        self.assertLess(time.monotonic() - started, 0.3)
+        self.assertEqual(list(fragments), ['jour', ' !'])
+        self.assertIn(':streamGenerateContent', server.requests[0]['path'])
+        self.assertIn('alt=sse', server.requests[0]['path'])
+
+    def test_stream_correct_dictation(self):
+        dictation = Dictation.objects.create(
+            title='Le chat', text="Le petit chat dort sur le canapé rouge du salon.", difficulty='facile'
+        )
+        correction = json.dumps({
+            'score': 80,
+            'errors': [{'word': 'chas', 'correction': 'chat', 'description': "Erreur d'orthographe"}],
+            'correction': dictation.text,
+            'pedagogical_advice': {'summary': 'Attention aux terminaisons.', 'tips': [], 'exercises': []},
+        })
+        fragments = [correction[index:index + 20] for index in range(0, len(correction), 20)]
+        self.stub([{'chunks': sse_chunks(fragments + [' Bonne continuation !'])}], LLM_PROVIDERS=['gemini'])
+
+        events = list(stream_correct_dictation("Le gros chas dormait sous la table du jardin.", dictation.id))
+
+        tokens = ''.join(data['text'] for event, data in events if event == 'token')
+        self.assertEqual(tokens, correction)
+        event, result = events[-1]
+        self.assertEqual(event, 'result')
+        self.assertEqual(result['score'], 80)
+        attempt = DictationAttempt.objects.get(id=result['attempt_id'])
+        self.assertEqual(attempt.feedback, 'Attention aux terminaisons.')
+        self.assertEqual(attempt.mistakes[0]['category'], 'orthographe')
+
+@override_settings(
+    LLM_HEDGING_ENABLED=True,
+    LLM_HEDGE_DEFAULT_DELAY=0.1,
+    LLM_HEDGE_MIN_SAMPLES=20,
+    LLM_BREAKER_FAILURES=2,
+    LLM_BREAKER_RESET=0.2,
+)
+class ProviderHedgingTests(SimpleTestCase):
+    """Double, repli et coupe-circuits de la couche fournisseurs, avec des FakeProvider."""
+
+    def setUp(self):
+        providers.reset_providers()
+        self.addCleanup(providers.reset_providers)
+
+    def register(self, *fakes):
+        for fake in fakes:
+            providers.register_provider(fake)
+        return override_settings(LLM_PROVIDERS=[fake.name for fake in fakes])
+
+    def test_hedge_wins_over_slow_primary(self):
+        slow = FakeProvider('slow', json.dumps({'value': 'slow'}), latency=1.0)
+        fast = FakeProvider('fast', json.dumps({'value': 'fast'}), latency=0.01)
+        with self.register(slow, fast):
+            started = time.monotonic()
+            result = providers.generate({}, json.loads, 'test')
+        self.assertEqual(result, {'value': 'fast'})
+        self.assertLess(time.monotonic() - started, 0.8)
+        self.assertEqual(slow.counters['hedges'], 1)
+        self.assertEqual(slow.counters['hedge_wins'], 1)
+
+    def test_single_provider_is_not_hedged(self):
+        only = FakeProvider('only', VALID_RESPONSE, latency=0.3)
+        with self.register(only):
+            self.assertEqual(providers.generate({}, json.loads, 'test'), {'value': 'ok'})
+        self.assertEqual(only.counters['calls'], 1)
+        self.assertEqual(only.counters['hedges'], 0)
+
+    def test_failover_to_secondary_when_primary_fails(self):
+        primary = FakeProvider('primary', error=RuntimeError('panne'))
+        secondary = FakeProvider('secondary', VALID_RESPONSE, latency=0.3)
+        with self.register(primary, secondary):
+            self.assertEqual(providers.generate({}, json.loads, 'test'), {'value': 'ok'})
+        # Le délai de double est écoulé pendant le repli : pas de nouvel appel au fournisseur en échec
+        self.assertEqual(primary.counters['calls'], 1)
+        self.assertEqual(secondary.counters['calls'], 1)
+
+    def test_invalid_answers_from_every_provider_are_not_an_outage(self):
+        first = FakeProvider('first', 'pas du JSON')
+        second = FakeProvider('second', 'toujours pas')
+        with self.register(first, second):
+            with self.assertRaises(InvalidLLMResponse):
+                providers.generate({'contents': []}, json.loads, 'test')
+        self.assertEqual((first.counters['calls'], second.counters['calls']), (1, 1))
+
+    def test_async_hedge_cancels_loser(self):
+        import asyncio
+        slow = FakeProvider('slow', json.dumps({'value': 'slow'}), latency=1.0)
+        fast = FakeProvider('fast', json.dumps({'value': 'fast'}), latency=0.01)
+        with self.register(slow, fast):
+            started = time.monotonic()
+            result = asyncio.run(providers.agenerate({}, json.loads, 'test'))
+        self.assertEqual(result, {'value': 'fast'})
+        self.assertLess(time.monotonic() - started, 0.8)
+
+    def test_breaker_opens_half_opens_and_closes(self):
+        flaky = FakeProvider('flaky', VALID_RESPONSE, error=RuntimeError('panne'))
+        backup = FakeProvider('backup', VALID_RESPONSE)
+        with self.register(flaky, backup):
+            for _ in range(2):
+                providers.generate({}, json.loads, 'test')
+            self.assertEqual(flaky.breaker.state, 'open')
+
+            # Coupe-circuit ouvert : le fournisseur n'est plus appelé
+            providers.generate({}, json.loads, 'test')
+            self.assertEqual(flaky.counters['calls'], 2)
+
+            # Après le délai, un appel d'essai passe ; il réussit et referme le coupe-circuit
+            time.sleep(0.25)
+            flaky.error = None
+            self.assertTrue(flaky.breaker.allow())
+            self.assertEqual(flaky.breaker.state, 'half_open')
+            flaky.breaker.record_failure()
+            self.assertEqual(flaky.breaker.state, 'open')
+            time.sleep(0.25)
+            providers.generate({}, json.loads, 'test')
+            self.assertEqual(flaky.breaker.state, 'closed')
+            self.assertEqual(flaky.counters['calls'], 3)
+
+    def test_stream_fails_over_before_first_fragment(self):
+        broken = FakeProvider('broken', error=RuntimeError('panne'))
+        streaming = FakeProvider('streaming', 'Voici : ' + VALID_RESPONSE + ' Bonne journée', chunk_size=5)
+        with self.register(broken, streaming):
+            events = list(providers.stream({}, json.loads, 'test'))
+        self.assertEqual(events[-1], ('result', {'value': 'ok'}))
+        # La lecture s'arrête à la fin de l'objet JSON
+        self.assertNotIn('journée', ''.join(data for event, data in events if event == 'token'))
+
+@override_settings(
+    LLM_HEDGING_ENABLED=False,
+    SINGLEFLIGHT_ENABLED=False,
+    BATCH_CORRECTION_PACK_SIZE=1,
+    BATCH_CORRECTION_MAX_WORKERS=1,
+)
+class BatchCorrectionTests(TestCase):
+    """Correction groupée des copies d'une classe, avec un FakeProvider."""
+
+    def setUp(self):
+        providers.reset_providers()
+        self.addCleanup(providers.reset_providers)
+        self.dictation = Dictation.objects.create(
+            title='Le chat', text="Le petit chat dort sur le canapé rouge du salon.", difficulty='facile'
+        )
+        providers.register_provider(FakeProvider('fake', json.dumps({
+            'score': 60,
+            'errors': [],
+            'correction': self.dictation.text,
+            'pedagogical_advice': {'summary': 'Relis-toi.', 'tips': [], 'exercises': []},
+        })))
+
+    def test_corrections_are_saved_before_client_disconnects(self):
+        copies = ["Un tout autre texte pour la première copie.", "Encore un texte différent pour la seconde."]
+        with override_settings(LLM_PROVIDERS=['fake']):
+            events = correct_dictation_batch(self.dictation.id, copies)
+            first = next(events)
+            # Le client se déconnecte après la première correction
+            events.close()
+        self.assertEqual(first['result']['score'], 60)
+        attempt = DictationAttempt.objects.get()
+        self.assertEqual(attempt.user_text, copies[first['index']])
+
+    def test_done_event_lists_attempt_ids_in_order(self):
+        copies = ["Un tout autre texte pour la première copie.", "Encore un texte différent pour la seconde."]
+        with override_settings(LLM_PROVIDERS=['fake']):
+            events = list(correct_dictation_batch(self.dictation.id, copies))
+        done = events[-1]
+        self.assertTrue(done['done'])
+        attempts = [DictationAttempt.objects.get(id=attempt_id) for attempt_id in done['attempt_ids']]
+        self.assertEqual([attempt.user_text for attempt in attempts], copies)
+        self.dictation.refresh_from_db()
+        self.assertEqual(self.dictation.attempts_count, 2)
+
+    COPIES = [
+        "Un tout autre texte pour la première copie.",
+        "Encore un texte différent pour la seconde.",
+        "Une troisième copie qui ne ressemble à rien.",
+        "La quatrième copie est tout aussi éloignée.",
+    ]
+
+    @staticmethod
+    def correction(score, **extra):
+        return {'score': score, 'errors': [], 'correction': 'Le chat.', **extra}
+
+    def test_misnumbered_pack_falls_back_to_one_call_per_copy(self):
+        def respond(payload):
+            if "copies d'élèves" in payload['contents'][0]['parts'][0]['text']:
+                # Deux corrections pour la même copie : impossible de savoir laquelle va à qui
+                return json.dumps({'corrections': [self.correction(10, copie=1), self.correction(20, copie=1)]})
+            return json.dumps(self.correction(70))
+        fake = FakeProvider('numbered', respond)
+        providers.register_provider(fake)
+        with override_settings(LLM_PROVIDERS=['numbered'], BATCH_CORRECTION_PACK_SIZE=2):
+            events = list(correct_dictation_batch(self.dictation.id, self.COPIES[:2]))
+        self.assertEqual(sorted(event['result']['score'] for event in events[:-1]), [70, 70])
+        # Lot, demande de réparation, puis une correction par copie
+        self.assertEqual(fake.counters['calls'], 3)
+
+    @override_settings(LLM_BREAKER_FAILURES=1, LLM_BREAKER_RESET=60)
+    def test_unavailable_providers_are_not_retried_per_copy(self):
+        down = FakeProvider('down', error=RuntimeError('panne'))
+        providers.register_provider(down)
+        with override_settings(LLM_PROVIDERS=['down'], BATCH_CORRECTION_PACK_SIZE=2):
+            events = list(correct_dictation_batch(self.dictation.id, self.COPIES))
+        self.assertEqual(len([event for event in events if 'error' in event]), 4)
+        self.assertEqual(events[-1]['stats']['failed'], 4)
+        # Le premier lot ouvre le coupe-circuit : le second n'appelle plus personne
+        self.assertEqual(down.counters['calls'], 1)
+        self.assertFalse(DictationAttempt.objects.exists())
+
+class ParseBatchCorrectionTests(SimpleTestCase):
+    """Attribution des corrections d'une réponse groupée aux copies."""
+
+    @staticmethod
+    def response(*numbers):
+        return json.dumps({'corrections': [
+            {'copie': number, 'score': number * 10, 'errors': [], 'correction': ''} for number in numbers
+        ]})
+
+    def test_corrections_are_ordered_by_copy_number(self):
+        corrections = parse_batch_correction_response(self.response(2, 1, 3), 3)
+        self.assertEqual([correction['score'] for correction in corrections], [10, 20, 30])
+        self.assertNotIn('copie', corrections[0])
+
+    def test_unreliable_numbering_is_rejected(self):
+        for numbers in ((1, 1, 3), (0, 1, 2), (1, 2)):
+            with self.subTest(numbers=numbers), self.assertRaises(ValueError):
+                parse_batch_correction_response(self.response(*numbers), 3)
+
+class VisionCacheKeyTests(SimpleTestCase):
+    """Clé du cache d'extraction manuscrite."""
+
+    @staticmethod
+    def photo(color):
+        import io
+        from PIL import Image
+        output = io.BytesIO()
+        Image.new('RGB', (64, 64), color).save(output, 'PNG')
+        return output.getvalue()
+
+    def test_same_dhash_different_images_do_not_share_a_key(self):
+        white, _, white_hash = normalize_image_for_vision(self.photo('white'))
+        black, _, black_hash = normalize_image_for_vision(self.photo('black'))
+        # Images unies : dHash identique (aucun contraste entre pixels voisins)
+        self.assertEqual(white_hash, black_hash)
+        self.assertNotEqual(vision_cache_key(white_hash, white, 'model'), vision_cache_key(black_hash, black, 'model'))
+
+    def test_same_image_shares_a_key(self):
+        first, _, first_hash = normalize_image_for_vision(self.photo('white'))
+        second, _, second_hash = normalize_image_for_vision(self.photo('white'))
+        self.assertEqual(vision_cache_key(first_hash, first, 'model'), vision_cache_key(second_hash, second, 'model'))
+
+class ClassifyErrorTests(SimpleTestCase):
+    """Catégorie des erreurs relevées par le correcteur."""
+
+    DESCRIPTIONS = [
+        ("Erreur d'accord : 'petite' doit s'accorder avec 'chats'. Conseil : n'oublie pas d'accorder l'adjectif avec le nom.", 'accord'),
+        ("Erreur d'orthographe : 'chie' est incorrect. Conseil : fais attention à ce point, les noms en -ien.", 'orthographe'),
+        ("Erreur de conjugaison : 'mangeait' est à l'imparfait. Conseil : vérifie l'accord du verbe avec son sujet.", 'conjugaison'),
+        ("Erreur de ponctuation : la virgule est manquante avant 'mais'. Conseil : relis la phrase à voix haute.", 'ponctuation'),
+        ("Mot manquant : 'le' a été oublié. Conseil : relis ta copie mot à mot.", 'mot manquant'),
+        ("Erreur de grammaire ou d'accord, le pronom ne renvoie à rien. Conseil : cherche le nom remplacé.", 'grammaire'),
+        ("Ce mot n'existe pas. Conseil : pense à l'accord du participe passé.", 'autre'),
+    ]
+
+    def test_category_comes_from_the_leading_label(self):
+        for description, expected in self.DESCRIPTIONS:
+            with self.subTest(description=description):
+                self.assertEqual(classify_error({'description': description}), expected)
+
+    def test_given_category_wins(self):
+        error = {'category': 'Accord', 'description': "Erreur d'orthographe : 'petits'. Conseil : attention au point."}
+        self.assertEqual(classify_error(error), 'accord')
+
+    def test_unknown_category_falls_back_to_the_label(self):
+        error = {'category': 'lexique', 'description': "Erreur d'orthographe : 'chie'. Conseil : n'oublie pas le n."}
+        self.assertEqual(classify_error(error), 'orthographe')
+
+    def test_backfill_migration_classifies_like_the_module(self):
+        import importlib
+        migration = importlib.import_module('dictation.migrations.0008_dictation_errors')
+        errors = [{'word': '', 'correction': 'chat', 'description': description} for description, _ in self.DESCRIPTIONS]
+        text = "Le chat dort."
+        self.assertEqual(migration.structure_errors(errors, text), structure_errors(errors, text))
+
+    def test_correction_serializer_checks_the_category(self):
+        def response(category):
+            return json.dumps({
+                'score': 90, 'correction': 'Le chat.',
+                'errors': [{'word': 'chas', 'correction': 'chat', 'category': category, 'description': 'Erreur.'}],
+            })
+        self.assertEqual(validate_response(response('orthographe'), CorrectionResultSerializer)['errors'][0]['category'], 'orthographe')
+        with self.assertRaises(InvalidLLMResponse):
+            validate_response(response('lexique'), CorrectionResultSerializer)
+
+@override_settings(LOCAL_CORRECTION_MAX_ERRORS=3)
+class LocalCorrectionTests(SimpleTestCase):
+    """Correction locale (sans LLM) des copies exactes ou quasi exactes."""
+
+    DICTATION = "Les petits chats dorment sur le canapé, près de la fenêtre."
+
+    def grade(self, user_text):
+        return correct_dictation_locally(
+            clean_text_for_comparison(self.DICTATION), clean_text_for_comparison(user_text), self.DICTATION
+        )
+
+    def categories(self, result):
+        return [(error['category'], error['word'], error['correction']) for error in result['errors']]
+
+    def test_exact_copy(self):
+        result = self.grade("  les petits chats dorment sur le  canapé, près de la fenêtre.")
+        self.assertEqual(result['score'], 100)
+        self.assertEqual(result['errors'], [])
+        self.assertEqual(result['correction'], self.DICTATION)
+
+    def test_accent_and_accord_substitutions(self):
+        result = self.grade("Les petit chats dorment sur le canape, près de la fenêtre.")
+        self.assertEqual(self.categories(result), [('accord', 'petit', 'petits'), ('orthographe', 'canape', 'canapé')])
+        self.assertEqual(result['score'], 100 - 3 - 2)
+        self.assertEqual(result['error_count'], 2)
+
+    def test_conjugation_ending_is_an_accord_error(self):
+        result = self.grade("Les petits chats dorme sur le canapé, près de la fenêtre.")
+        self.assertEqual(self.categories(result), [('accord', 'dorme', 'dorment')])
+        self.assertEqual(result['score'], 97)
+
+    def test_missing_word(self):
+        result = self.grade("Les chats dorment sur le canapé, près de la fenêtre.")
+        self.assertEqual(self.categories(result), [('mot manquant', '', 'petits')])
+        self.assertEqual(result['score'], 95)
+
+    def test_punctuation_only_differences(self):
+        result = self.grade("Les petits chats dorment sur le canapé près de la fenêtre")
+        self.assertEqual(self.categories(result), [('ponctuation', '', ','), ('ponctuation', '', '.')])
+        self.assertEqual(result['score'], 98)
+        result = self.grade("Les petits chats dorment sur le canapé. près de la fenêtre.")
+        self.assertEqual(self.categories(result), [('ponctuation', '.', ',')])
+        self.assertEqual(result['score'], 99)
+
+    def test_too_many_errors_are_left_to_the_llm(self):
+        self.assertIsNone(self.grade("Les petit chat dorme sur le canape, près de la fenêtre."))
+
+    def test_extra_or_unrelated_word_is_left_to_the_llm(self):
+        self.assertIsNone(self.grade("Les petits chats dorment bien sur le canapé, près de la fenêtre."))
+        self.assertIsNone(self.grade("Les petits chats dorment sur le tapis, près de la fenêtre."))
+
+@override_settings(LOCAL_CORRECTION_MAX_ERRORS=3, DICTATION_MASTERY_SCORE=90, SINGLEFLIGHT_ENABLED=False)
+class UserRollupTests(TestCase):
+    """Agrégats par utilisateur maintenus à chaque tentative, et leur lecture par /api/progress/."""
+
+    TEXT = "Les petits chats dorment sur le canapé, près de la fenêtre."
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('eleve', password='secret')
+        self.dictation = Dictation.objects.create(title='Les chats', text=self.TEXT, difficulty='facile')
+
+    def test_two_graded_attempts_update_the_rollups(self):
+        # Mot manquant (-5) et deux accords (-3) : 89, sous le seuil de maîtrise
+        first = correct_dictation("Les petit chat dorment sur canapé, près de la fenêtre.", self.dictation.id, self.user.id)
+        self.assertEqual(first['score'], 89)
+        progress = UserProgress.objects.get(user=self.user, dictation=self.dictation)
+        self.assertFalse(progress.is_mastered)
+
+        second = correct_dictation(self.TEXT, self.dictation.id, self.user.id)
+        self.assertEqual(second['score'], 100)
+
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.total_attempts, 2)
+        self.assertEqual(profile.scored_attempts_count, 2)
+        self.assertEqual(profile.total_score, 189)
+        self.assertEqual(profile.best_score, 100)
+        self.assertEqual(profile.mastered_count, 1)
+        progress.refresh_from_db()
+        self.assertEqual(progress.attempts_count, 2)
+        self.assertEqual(progress.best_score, 100)
+        self.assertTrue(progress.is_mastered)
+        self.assertEqual(
+            dict(UserErrorStat.objects.filter(user=self.user).values_list('category', 'count')),
+            {'mot manquant': 1, 'accord': 2}
+        )
+
+        # Une note plus basse ne fait baisser ni le meilleur score ni les dictées maîtrisées
+        correct_dictation("Les petits chats dorment sur le canape, près de la fenêtre.", self.dictation.id, self.user.id)
+        profile.refresh_from_db()
+        self.assertEqual((profile.total_attempts, profile.best_score, profile.mastered_count), (3, 100, 1))
+
+    def test_progress_endpoint_query_count_does_not_grow(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        correct_dictation(self.TEXT, self.dictation.id, self.user.id)
+        with self.assertNumQueries(3):
+            response = client.get('/api/progress/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['profile']['total_attempts'], 1)
+
+        other = Dictation.objects.create(title='Autre', text="Le soleil brille sur la ville.", difficulty='facile')
+        for _ in range(3):
+            correct_dictation("Le soleil brille sur la vile.", other.id, self.user.id)
+        with self.assertNumQueries(3):
+            response = client.get('/api/progress/')
+        self.assertEqual(response.data['profile']['total_attempts'], 4)
+        self.assertEqual([row['dictation_title'] for row in response.data['dictations']], ['Autre', 'Les chats'])
+        self.assertEqual(response.data['errors_by_category'], [{'category': 'orthographe', 'count': 3}])
+
+class FakeRedisMixin:
+    """Remplace le client Redis des modules donnés par fakeredis (scripts Lua compris)."""
+
+    def use_fake_redis(self, *modules):
+        server = fakeredis.FakeServer()
+        self.redis = fakeredis.FakeRedis(server=server)
+        self.async_redis = fakeredis.FakeAsyncRedis(server=server)
+        for module in modules:
+            for name, client in (('get_redis', self.redis), ('get_async_redis', self.async_redis)):
+                if hasattr(module, name):
+                    patcher = mock.patch.object(module, name, return_value=client)
+                    patcher.start()
+                    self.addCleanup(patcher.stop)
+
+@override_settings(SINGLEFLIGHT_ENABLED=True, SINGLEFLIGHT_MAX_WAIT=5, SINGLEFLIGHT_LOCK_TTL=5, SINGLEFLIGHT_RESULT_TTL=5)
+class SingleFlightTests(FakeRedisMixin, SimpleTestCase):
+    """Regroupement des appels identiques en cours."""
+
+    def setUp(self):
+        self.use_fake_redis(singleflight)
+        self.calls = []
+
+    def slow_call(self, value, delay=0.3, error=None):
+        def call():
+            self.calls.append(value)
+            time.sleep(delay)
+            if error:
+                raise error
+            return {'value': value}
+        return call
+
+    def run_concurrently(self, *funcs):
+        """Lance les appels à 50 ms d'intervalle, le premier devenant le meneur."""
+        results = [None] * len(funcs)
+
+        def run(index, func):
+            try:
+                results[index] = singleflight.run_once('correction:abc', func)
+            except Exception as e:
+                results[index] = e
+
+        threads = []
+        for index, func in enumerate(funcs):
+            threads.append(threading.Thread(target=run, args=(index, func)))
+            threads[-1].start()
+            time.sleep(0.05)
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def test_follower_receives_the_leader_result(self):
+        results = self.run_concurrently(self.slow_call('leader'), self.slow_call('follower'))
+        self.assertEqual(results, [{'value': 'leader'}, {'value': 'leader'}])
+        self.assertEqual(self.calls, ['leader'])
+
+    def test_failing_leader_releases_the_lock(self):
+        results = self.run_concurrently(
+            self.slow_call('leader', error=RuntimeError('panne')), self.slow_call('follower')
+        )
+        self.assertIsInstance(results[0], RuntimeError)
+        self.assertEqual(results[1], {'value': 'follower'})
+        self.assertEqual(self.calls, ['leader', 'follower'])
+        self.assertIsNone(self.redis.get(f"{singleflight.LOCK_KEY_PREFIX}correction:abc"))
+
+    def test_async_follower_receives_the_leader_result(self):
+        async def call(value):
+            self.calls.append(value)
+            await asyncio.sleep(0.3)
+            return {'value': value}
+
+        async def both():
+            leader = asyncio.ensure_future(singleflight.arun_once('generation:abc', lambda: call('leader')))
+            await asyncio.sleep(0.05)
+            follower = await singleflight.arun_once('generation:abc', lambda: call('follower'))
+            return await leader, follower
+
+        self.assertEqual(asyncio.run(both()), ({'value': 'leader'}, {'value': 'leader'}))
+        self.assertEqual(self.calls, ['leader'])
+
+    def test_release_shared_job_keeps_another_jobs_key(self):
+        key = singleflight.singleflight_key('generation', {'difficulty': 'facile'})
+        self.assertEqual(singleflight.shared_job_id(key, 'job-a'), 'job-a')
+        self.assertEqual(singleflight.shared_job_id(key, 'job-b'), 'job-a')
+        singleflight.release_shared_job(key, 'job-b')
+        self.assertEqual(singleflight.shared_job_id(key, 'job-c'), 'job-a')
+        singleflight.release_shared_job(key, 'job-a')
+        self.assertEqual(singleflight.shared_job_id(key, 'job-c'), 'job-c')
+
+    def test_calls_run_directly_without_redis(self):
+        down = redis.Redis(host='127.0.0.1', port=1, socket_connect_timeout=0.2, retry=Retry(NoBackoff(), 0))
+        with mock.patch.object(singleflight, 'get_redis', return_value=down):
+            self.assertEqual(singleflight.run_once('correction:abc', lambda: {'value': 1}), {'value': 1})
+            self.assertEqual(singleflight.run_once('correction:abc', lambda: {'value': 2}), {'value': 2})
+            self.assertEqual(singleflight.shared_job_id('generation:abc', 'job-a'), 'job-a')
+            self.assertEqual(singleflight.shared_job_id('generation:abc', 'job-b'), 'job-b')
+            singleflight.release_shared_job('generation:abc', 'job-a')
+
+class ConditionalCacheTests(FakeRedisMixin, TestCase):
+    """Réponses en cache des dictées : ETag, 304 et invalidation."""
+
+    def setUp(self):
+        self.use_fake_redis(http_cache)
+        self.client = APIClient()
+        self.dictation = Dictation.objects.create(
+            title='Le chat', text="Le petit chat dort.", difficulty='facile', is_public=True
+        )
+        self.url = f'/api/dictations/{self.dictation.pk}/'
+
+    def test_if_none_match_returns_304_without_database_access(self):
+        for url in (self.url, '/api/dictations/'):
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                etag = response['ETag']
+                with self.assertNumQueries(0):
+                    response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response['ETag'], etag)
+
+    def test_save_invalidates_detail_and_list(self):
+        detail_etag = self.client.get(self.url)['ETag']
+        list_etag = self.client.get('/api/dictations/')['ETag']
+
+        self.dictation.title = 'Le chien'
+        self.dictation.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=detail_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], detail_etag)
+        self.assertEqual(json.loads(response.content)['title'], 'Le chien')
+        response = self.client.get('/api/dictations/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item['title'] for item in json.loads(response.content)['results']], ['Le chien'])
+
+    def test_delete_changes_the_list_etag(self):
+        list_etag = self.client.get('/api/dictations/')['ETag']
+        self.dictation.delete()
+        response = self.client.get('/api/dictations/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Last-Modified', response)
+
+    @override_settings(ALLOWED_HOSTS=['*'])
+    def test_detail_is_cached_per_host(self):
+        self.client.get(self.url, HTTP_HOST='a.example.com')
+        with self.assertNumQueries(1):
+            self.client.get(self.url, HTTP_HOST='b.example.com')
+        with self.assertNumQueries(0):
+            self.client.get(self.url, HTTP_HOST='a.example.com')
+        self.assertEqual(self.redis.hlen(http_cache.object_cache_key(self.dictation.pk)), 2)
+
+class GenerateValidatedTests(FakeRedisMixin, SimpleTestCase):
+    """Validation des réponses JSON du LLM et demande de réparation unique."""
+
+    PAYLOAD = {'contents': [{'role': 'user', 'parts': [{'text': 'Corrige cette copie.'}]}]}
+    VALID = json.dumps({'score': 90, 'errors': [], 'correction': 'Le chat dort.'})
+    INVALID = json.dumps({'score': 'très bien', 'errors': []})
+
+    def setUp(self):
+        self.use_fake_redis(structured)
+
+    @staticmethod
+    def parse(response_text):
+        return validate_response(response_text, CorrectionResultSerializer)
+
+    def fake_generate(self, *responses):
+        requests = []
+        responses = list(responses)
+
+        def generate(payload):
+            requests.append(payload)
+            return responses.pop(0)
+        return generate, requests
+
+    def test_valid_first_output_needs_no_repair(self):
+        generate, requests = self.fake_generate(self.VALID)
+        result = structured.generate_validated(self.PAYLOAD, self.parse, 'correction', generate=generate)
+        self.assertEqual(result['score'], 90)
+        self.assertEqual(requests, [self.PAYLOAD])
+        self.assertEqual(structured.parse_metrics()['correction']['ok'], 1)
+
+    def test_invalid_output_is_repaired_once(self):
+        generate, requests = self.fake_generate(self.INVALID, self.VALID)
+        result = structured.generate_validated(self.PAYLOAD, self.parse, 'correction', generate=generate)
+        self.assertEqual(result['score'], 90)
+        self.assertEqual(len(requests), 2)
+        # La réparation reprend la conversation, la réponse fautive et les erreurs relevées
+        model_turn, repair_turn = requests[1]['contents'][1:]
+        self.assertEqual(model_turn, {'role': 'model', 'parts': [{'text': self.INVALID}]})
+        self.assertIn('score', repair_turn['parts'][0]['text'])
+        metrics = structured.parse_metrics()['correction']
+        self.assertEqual((metrics['ok'], metrics['repaired'], metrics['failed']), (0, 1, 0))
+        self.assertEqual(metrics['invalid_rate'], 1.0)
+
+    def test_streamed_response_is_repaired_without_a_new_first_call(self):
+        generate, requests = self.fake_generate(self.VALID)
+        result = structured.generate_validated(
+            self.PAYLOAD, self.parse, 'correction', response_text='pas du JSON', generate=generate
+        )
+        self.assertEqual(result['score'], 90)
+        self.assertEqual(len(requests), 1)
+
+    def test_invalid_twice_raises_and_counts_a_failure(self):
+        generate, requests = self.fake_generate(self.INVALID, 'toujours pas du JSON')
+        with self.assertRaises(InvalidLLMResponse):
+            structured.generate_validated(self.PAYLOAD, self.parse, 'correction', generate=generate)
+        self.assertEqual(len(requests), 2)
+        metrics = structured.parse_metrics()['correction']
+        self.assertEqual((metrics['ok'], metrics['repaired'], metrics['failed']), (0, 0, 1))
+        self.assertEqual(metrics['failure_rate'], 1.0)
+
+    def test_async_repair(self):
+        responses = [self.INVALID, self.VALID]
+
+        async def generate(payload):
+            return responses.pop(0)
+
+        result = asyncio.run(structured.agenerate_validated(self.PAYLOAD, self.parse, 'correction', generate=generate))
+        self.assertEqual(result['score'], 90)
+        self.assertEqual(responses, [])
+        self.assertEqual(structured.parse_metrics()['correction']['repaired'], 1)
+
+@override_settings(CORRECTION_CACHE_TTL=3600, CORRECTION_CACHE_MAX_ENTRIES=3)
+class CorrectionCacheTests(FakeRedisMixin, SimpleTestCase):
+    """Cache des corrections : durée de vie et éviction LRU."""
+
+    def setUp(self):
+        self.use_fake_redis(cache)
+
+    def store(self, name):
+        cache.store_correction(name, {'score': 50, 'name': name})
+
+    def test_least_recently_read_entry_is_evicted(self):
+        for name in ('a', 'b', 'c'):
+            self.store(name)
+        # Lue récemment, « a » passe devant « b » et « c »
+        self.assertEqual(cache.get_cached_correction('a')['name'], 'a')
+        self.store('d')
+        self.assertIsNone(cache.get_cached_correction('b'))
+        for name in ('a', 'c', 'd'):
+            self.assertEqual(cache.get_cached_correction(name)['name'], name)
+        self.assertEqual(self.redis.zcard(cache.CORRECTION_INDEX_KEY), 3)
+
+    def test_entries_expire_and_leave_the_index(self):
+        self.store('a')
+        self.assertTrue(0 < self.redis.ttl(cache.CORRECTION_KEY_PREFIX + 'a') <= 3600)
+        # Entrée dont le TTL est dépassé : retirée de l'index à la prochaine écriture
+        self.redis.zadd(cache.CORRECTION_INDEX_KEY, {'old': time.time() - 3601})
+        self.store('b')
+        self.assertEqual(
+            sorted(member.decode() for member in self.redis.zrange(cache.CORRECTION_INDEX_KEY, 0, -1)), ['a', 'b']
+        )
+
+class FakeTTS:
+    """Remplace gTTS : le « MP3 » d'une phrase est son texte, chaque synthèse est comptée."""
+
+    calls = []
+
+    def __init__(self, text, lang, slow):
+        self.text = text
+        FakeTTS.calls.append(text)
+
+    def write_to_fp(self, fp):
+        fp.write(f"[{self.text}]".encode('utf-8'))
+
+@override_settings(TTS_SEGMENT_CACHE_TTL=3600, TTS_SEGMENT_CACHE_MAX_ENTRIES=2, TTS_MAX_WORKERS=2)
+class SpeechSynthesisTests(FakeRedisMixin, SimpleTestCase):
+    """Synthèse vocale phrase par phrase et cache des segments."""
+
+    def setUp(self):
+        self.use_fake_redis(cache)
+        FakeTTS.calls = []
+        patcher = mock.patch('gtts.gTTS', FakeTTS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_split_into_sentences(self):
+        self.assertEqual(
+            services.split_into_sentences("Le chat dort. Il rêve ! Que fait-il ?  Il attend… Fin"),
+            ['Le chat dort.', 'Il rêve !', 'Que fait-il ?', 'Il attend…', 'Fin']
+        )
+        self.assertEqual(services.split_into_sentences("  "), [])
+
+    def test_repeated_sentences_are_synthesized_once(self):
+        audio = services.synthesize_speech("Le chat dort. Le chien court. Le chat dort.")
+        self.assertEqual(audio, "[Le chat dort.][Le chien court.][Le chat dort.]".encode('utf-8'))
+        self.assertEqual(sorted(FakeTTS.calls), ['Le chat dort.', 'Le chien court.'])
+
+        # Seconde dictée : les segments en cache ne sont pas resynthétisés
+        services.synthesize_speech("Le chien court. Le loup hurle.")
+        self.assertEqual(sorted(FakeTTS.calls), ['Le chat dort.', 'Le chien court.', 'Le loup hurle.'])
+
+    def test_segment_cache_is_bounded(self):
+        for sentence in ('Un.', 'Deux.'):
+            services.synthesize_sentence(sentence)
+        services.synthesize_sentence('Un.')  # lu en cache : devient le plus récent
+        services.synthesize_sentence('Trois.')
+        keys = {sentence: cache.audio_segment_cache_key(sentence, 'fr', True) for sentence in ('Un.', 'Deux.', 'Trois.')}
+        self.assertIsNone(cache.get_cached_audio_segment(keys['Deux.']))
+        self.assertEqual(cache.get_cached_audio_segment(keys['Un.']), b'[Un.]')
+        self.assertEqual(self.redis.zcard(cache.AUDIO_SEGMENT_INDEX_KEY), 2)
+        self.assertTrue(0 < self.redis.ttl(cache.AUDIO_SEGMENT_KEY_PREFIX + keys['Trois.']) <= 3600)
+
+@override_settings(
+    LLM_GOVERNOR_ENABLED=True,
+    LLM_GOVERNOR_RATE=10.0,
+    LLM_GOVERNOR_BURST=20,
+    LLM_GOVERNOR_MAX_IN_FLIGHT=1,
+    LLM_GOVERNOR_LIMITS={},
+    LLM_GOVERNOR_MODE='wait',
+    LLM_GOVERNOR_MAX_WAIT=2.0,
+    LLM_GOVERNOR_LEASE=30.0,
+)
+class GovernorTests(FakeRedisMixin, SimpleTestCase):
+    """Régulation des appels aux LLM : seau à jetons et appels en cours."""
+
+    def setUp(self):
+        self.use_fake_redis(governor)
+        self.scope = governor.governor_scope('gemini', 'model', 'key')
+
+    def in_flight(self):
+        return self.redis.zcard(governor._in_flight_key(self.scope))
+
+    def test_fail_fast_rejects_when_all_slots_are_taken(self):
+        with governor.governed('gemini', 'model', 'key') as permit:
+            self.assertIsNotNone(permit)
+            with self.assertRaises(governor.RateLimitExceeded) as raised:
+                with governor.governed('gemini', 'model', 'key', mode='fail_fast'):
+                    pass
+        self.assertEqual(raised.exception.retry_after_header, '1')
+        metrics = governor.governor_metrics()[self.scope]
+        self.assertEqual((metrics['acquired'], metrics['rejected'], metrics['in_flight']), (1, 1, 0))
+
+    def test_permit_is_released_on_exception(self):
+        with self.assertRaises(RuntimeError):
+            with governor.governed('gemini', 'model', 'key'):
+                self.assertEqual(self.in_flight(), 1)
+                raise RuntimeError('panne')
+        self.assertEqual(self.in_flight(), 0)
+        with governor.governed('gemini', 'model', 'key', mode='fail_fast') as permit:
+            self.assertIsNotNone(permit)
+
+    def test_async_permit_is_released_on_exception(self):
+        async def failing_call():
+            async with governor.agoverned('gemini', 'model', 'key'):
+                self.assertEqual(self.in_flight(), 1)
+                raise RuntimeError('panne')
+
+        with self.assertRaises(RuntimeError):
+            asyncio.run(failing_call())
+        self.assertEqual(self.in_flight(), 0)
+
+    def test_wait_mode_gets_the_slot_once_released(self):
+        holder = governor.governed('gemini', 'model', 'key')
+        holder.__enter__()
+        threading.Timer(0.2, holder.__exit__, args=(None, None, None)).start()
+        started = time.monotonic()
+        with governor.governed('gemini', 'model', 'key') as permit:
+            self.assertIsNotNone(permit)
+        self.assertGreaterEqual(time.monotonic() - started, 0.2)
+        self.assertEqual(governor.governor_metrics()[self.scope]['waited'], 1)
+
+    @override_settings(LLM_GOVERNOR_BURST=2, LLM_GOVERNOR_MAX_IN_FLIGHT=0)
+    def test_token_bucket_limits_the_rate(self):
+        for _ in range(2):
+            with governor.governed('gemini', 'model', 'key'):
+                pass
+        with self.assertRaises(governor.RateLimitExceeded) as raised:
+            with governor.governed('gemini', 'model', 'key', mode='fail_fast'):
+                pass
+        self.assertLessEqual(raised.exception.retry_after, 0.15)
+        # En mode 'wait', le jeton suivant arrive après ~1/rate secondes
+        with governor.governed('gemini', 'model', 'key') as permit:
+            self.assertIsNotNone(permit)
+
+    def test_calls_pass_unregulated_without_redis(self):
+        down = redis.Redis(host='127.0.0.1', port=1, socket_connect_timeout=0.2, retry=Retry(NoBackoff(), 0))
+        with mock.patch.object(governor, 'get_redis', return_value=down):
+            with governor.governed('gemini', 'model', 'key') as permit:
+                self.assertIsNone(permit)
+
+@override_settings(LLM_HEDGING_ENABLED=False, SINGLEFLIGHT_ENABLED=False, LLM_PROVIDERS=['fake'])
+class EvaluateAttemptTests(FakeRedisMixin, TestCase):
+    """POST /api/dictations/<id>/evaluate_attempt/ passe par correct_dictation."""
+
+    CORRECTION = {
+        'score': 65,
+        'errors': [{'word': 'chas', 'correction': 'chat', 'category': 'orthographe', 'description': "Erreur d'orthographe."}],
+        'correction': "Le petit chat dort sur le canapé rouge du salon.",
+        'total_words': 10,
+        'error_count': 1,
+        'pedagogical_advice': {'summary': 'Attention aux noms.', 'tips': [], 'exercises': []},
+    }
+
+    def setUp(self):
+        # Cache de correction vide à chaque test
+        self.use_fake_redis(cache)
+        providers.reset_providers()
+        self.addCleanup(providers.reset_providers)
+        self.fake = FakeProvider('fake', json.dumps(self.CORRECTION))
+        providers.register_provider(self.fake)
+        self.user = get_user_model().objects.create_user('eleve', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.dictation = Dictation.objects.create(
+            title='Le chat', text=self.CORRECTION['correction'], difficulty='facile', is_public=True
+        )
+        self.url = f'/api/dictations/{self.dictation.pk}/evaluate_attempt/'
+
+    def test_llm_correction_writes_one_attempt(self):
+        user_text = "Un gros chas dormait dehors sous la pluie froide."
+        response = self.client.post(self.url, {'user_text': user_text}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.fake.counters['calls'], 1)
+
+        attempt = DictationAttempt.objects.get()
+        self.assertEqual((attempt.user, attempt.user_text, attempt.score), (self.user, user_text, 65))
+        self.assertEqual(attempt.feedback, 'Attention aux noms.')
+        self.assertEqual(response.data, {
+            **self.CORRECTION, 'attempt_id': attempt.id, 'feedback': 'Attention aux noms.'
+        })
+
+    def test_exact_copy_is_graded_without_llm(self):
+        response = self.client.post(self.url, {'user_text': self.dictation.text}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['score'], 100)
+        self.assertEqual(response.data['attempt_id'], DictationAttempt.objects.get().id)
+        self.assertEqual(self.fake.counters['calls'], 0)
+
+    def test_missing_text_is_rejected(self):
+        response = self.client.post(self.url, {}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(DictationAttempt.objects.exists())
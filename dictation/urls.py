@@ -1,25 +1,44 @@
+from django.conf import settings
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from .views import (
     DictationViewSet,
     correct_dictation_view,
+    correct_dictation_batch_view,
     generate_dictation_view,
+    generate_dictation_status_view,
+    dictation_pool_stats_view,
+    llm_governor_stats_view,
+    llm_parse_stats_view,
+    llm_provider_stats_view,
+    user_progress_view,
     process_image,
     process_image_gemini
 )
 
+# Sous ASGI, les points d'entrée qui attendent Gemini sont servis par des vues asynchrones
+if settings.DICTATION_ASYNC_VIEWS:
+    from .async_views import (
+        correct_dictation_async_view as correct_dictation_view,
+        correct_dictation_batch_async_view as correct_dictation_batch_view,
+        generate_dictation_async_view as generate_dictation_view,
+        process_image_gemini_async_view as process_image_gemini,
+    )
+
 router = DefaultRouter()
 router.register(r'dictations', DictationViewSet, basename='dictation')
 
 urlpatterns = [
     path('', include(router.urls)),
     path('dictation/correct/', correct_dictation_view, name='correct-dictation'),
+    path('dictation/correct/batch/', correct_dictation_batch_view, name='correct-dictation-batch'),
     path('dictation/generate/', generate_dictation_view, name='generate-dictation'),
+    path('dictation/generate/<str:job_id>/', generate_dictation_status_view, name='generate-dictation-status'),
+    path('dictation/pool/stats/', dictation_pool_stats_view, name='dictation-pool-stats'),
+    path('dictation/governor/stats/', llm_governor_stats_view, name='llm-governor-stats'),
+    path('dictation/parsing/stats/', llm_parse_stats_view, name='llm-parse-stats'),
+    path('dictation/providers/stats/', llm_provider_stats_view, name='llm-provider-stats'),
+    path('progress/', user_progress_view, name='user-progress'),
     path('dictation/process-image/', process_image, name='process-image'),
     path('dictation/process-image-gemini/', process_image_gemini, name='process-image-gemini'),
 ]
-
-# Pour le débogage
-print("URLs de l'app dictation:")
-for url in urlpatterns:
-    print(f"- {url.pattern}")
\ No newline at end of file
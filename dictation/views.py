@@ -1,126 +1,167 @@
-from django.shortcuts import render
 from rest_framework import viewsets, status
-from rest_framework.decorators import action, api_view
+from rest_framework.decorators import action, api_view, permission_classes, renderer_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.settings import api_settings
 from rest_framework.response import Response
 from django.conf import settings
-import google.generativeai as genai
-from gtts import gTTS
-import os
-from .models import Dictation, DictationAttempt
-from .serializers import DictationSerializer, DictationAttemptSerializer
-from .services import generate_dictation, correct_dictation
+from django.db import transaction
+from django.db.models import Count
+from .models import Dictation, DictationError, UserErrorStat, UserProfile, UserProgress
+from .serializers import (
+    DictationSerializer,
+    DictationListSerializer,
+    DictationAttemptSerializer,
+    DictationStatsSerializer,
+    UserProfileStatsSerializer,
+    UserProgressSerializer,
+)
+from .pagination import DictationCursorPagination
+from .http_cache import ConditionalCacheMixin
+from .stats import record_attempts
+from .services import (
+    correct_dictation,
+    generate_audio_from_text,
+    stream_correct_dictation,
+    stream_generate_dictation,
+    extract_handwriting,
+)
+from .streaming import (
+    EventStreamRenderer,
+    NDJSONRenderer,
+    event_stream_response,
+    ndjson_response,
+    wants_event_stream,
+)
+from .governor import RateLimitExceeded, governor_metrics
+from .structured import parse_metrics
+from .prompts import build_ocr_correction_payload
+from .providers import get_provider, provider_stats
+from .images import ImageUploadError, install_image_upload_handler, load_request_image
+from .tasks import enqueue_generation
+from .pool import claim_pooled_dictation, pool_metrics
 import logging
-import urllib.parse
 from django.http import JsonResponse
-from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_http_methods
+from django.urls import reverse
+from celery.result import AsyncResult
 import json
-from datetime import datetime
-import difflib
-from itertools import zip_longest
-import base64
-import io
-from PIL import Image
-import pytesseract
-import openai
 
 # Configuration du logging
 logger = logging.getLogger(__name__)
 
-# Configuration de l'API Gemini
-logger.info("Configuration de l'API Gemini")
-try:
-    genai.configure(api_key=settings.GEMINI_API_KEY)
-    model = genai.GenerativeModel('gemini-1.0-pro')
-    logger.info("API Gemini configurée avec succès")
-except Exception as e:
-    logger.error(f"Erreur lors de la configuration de l'API Gemini : {str(e)}")
-    logger.exception("Trace complète de l'erreur de configuration Gemini :")
-
-class DictationViewSet(viewsets.ModelViewSet):
+# Les endpoints LLM acceptent aussi Accept: text/event-stream
+STREAMING_RENDERER_CLASSES = api_settings.DEFAULT_RENDERER_CLASSES + [EventStreamRenderer]
+NDJSON_RENDERER_CLASSES = api_settings.DEFAULT_RENDERER_CLASSES + [NDJSONRenderer]
+
+class DictationViewSet(ConditionalCacheMixin, viewsets.ModelViewSet):
     queryset = Dictation.objects.filter(is_public=True)
     serializer_class = DictationSerializer
+    pagination_class = DictationCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # Ne charger que les colonnes utiles : le texte n'est jamais lu pour une liste
+        if self.action == 'list':
+            return queryset.only('updated_at', *DictationListSerializer.Meta.fields)
+        if self.action in ('common_mistakes', 'evaluate_attempt'):
+            return queryset.only('id')
+        if self.action == 'stats':
+            return queryset.only('id', 'attempts_count', 'scored_attempts_count', 'total_score', 'best_score')
+        return queryset
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return DictationListSerializer
+        return super().get_serializer_class()
 
     @action(detail=True, methods=['post'])
     def attempt(self, request, pk=None):
         dictation = self.get_object()
         serializer = DictationAttemptSerializer(data=request.data)
         if serializer.is_valid():
-            attempt = serializer.save(dictation=dictation)
+            with transaction.atomic():
+                attempt = serializer.save(
+                    dictation=dictation,
+                    user=request.user if request.user.is_authenticated else None
+                )
+                record_attempts([attempt])
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """Statistiques de la dictée, lues depuis les agrégats maintenus à chaque tentative."""
+        dictation = self.get_object()
+        return Response(DictationStatsSerializer(dictation).data)
+
+    @action(detail=True, methods=['get'])
+    def common_mistakes(self, request, pk=None):
+        """
+        Fautes les plus fréquentes sur la dictée, agrégées en SQL depuis DictationError :
+        répartition par catégorie et mots les plus souvent mal écrits.
+        Paramètres optionnels : ?category=accord et ?limit=10.
+        """
+        dictation = self.get_object()
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+        except ValueError:
+            return Response({'error': 'Le paramètre limit doit être un entier'}, status=status.HTTP_400_BAD_REQUEST)
+        errors = DictationError.objects.filter(dictation=dictation).order_by()
+        by_category = errors.values('category').annotate(count=Count('id')).order_by('-count')
+        category = request.query_params.get('category')
+        if category:
+            errors = errors.filter(category=category)
+        words = (
+            errors.exclude(correction='')
+            .values('correction', 'category')
+            .annotate(count=Count('id'))
+            .order_by('-count', 'correction')[:limit]
+        )
+        return Response({
+            'dictation_id': dictation.id,
+            'by_category': list(by_category),
+            'words': list(words),
+        })
+
     @action(detail=True, methods=['post'])
     def generate_audio(self, request, pk=None):
         dictation = self.get_object()
         
-        # Générer l'audio avec gTTS
-        tts = gTTS(text=dictation.text, lang='fr')
-        audio_path = os.path.join(settings.MEDIA_ROOT, 'dictations', f'dictation_{dictation.id}.mp3')
-        os.makedirs(os.path.dirname(audio_path), exist_ok=True)
-        tts.save(audio_path)
+        # Générer l'audio avec gTTS et l'envoyer sur Cloudinary
+        generate_audio_from_text(dictation.text, f'dictation_{dictation.id}')
         
         # Mettre à jour le chemin du fichier audio
         dictation.audio_file = f'dictations/dictation_{dictation.id}.mp3'
-        dictation.save()
+        dictation.save(update_fields=['audio_file', 'updated_at'])
         
         return Response({'status': 'audio generated'})
 
     @action(detail=True, methods=['post'])
     def evaluate_attempt(self, request, pk=None):
+        """
+        Évalue une tentative avec la correction commune (correct_dictation) : correction
+        locale, cache, appel au LLM et un seul INSERT de la tentative. La réponse
+        complète de la correction est renvoyée, avec les clés historiques score et feedback.
+        """
         dictation = self.get_object()
         user_text = request.data.get('user_text')
         
         if not user_text:
             return Response({'error': 'user_text is required'}, status=status.HTTP_400_BAD_REQUEST)
         
-        # Créer une tentative
-        attempt = DictationAttempt.objects.create(
-            dictation=dictation,
-            user_text=user_text
-        )
-        
-        # Utiliser Gemini pour évaluer la dictée
-        prompt = f"""
-        Évaluez cette dictée :
-        
-        Texte original : {dictation.text}
-        Texte de l'élève : {user_text}
-        
-        Donnez :
-        1. Un score sur 100
-        2. Une analyse détaillée des erreurs
-        3. Des suggestions d'amélioration
-        
-        Format de réponse :
-        Score : [score]/100
-        Analyse : [analyse]
-        Suggestions : [suggestions]
-        """
-        
-        response = model.generate_content(prompt)
-        evaluation = response.text
-        
-        # Extraire le score et le feedback
         try:
-            score_line = evaluation.split('\n')[0]
-            score = float(score_line.split(':')[1].strip().split('/')[0])
-            feedback = '\n'.join(evaluation.split('\n')[1:])
-        except:
-            score = 0
-            feedback = "Erreur lors de l'évaluation"
-        
-        # Mettre à jour la tentative
-        attempt.score = score
-        attempt.feedback = feedback
-        attempt.save()
-        
+            result = correct_dictation(user_text, dictation.id, request.user.id)
+        except RateLimitExceeded as e:
+            return rate_limited_response(e)
+        except Exception as e:
+            return Response({'error': f'Erreur lors de l\'évaluation: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        advice = result.get('pedagogical_advice')
         return Response({
-            'score': score,
-            'feedback': feedback
+            **result,
+            'feedback': advice.get('summary', '') if isinstance(advice, dict) else ''
         })
 
 @api_view(['POST'])
+@renderer_classes(STREAMING_RENDERER_CLASSES)
 def correct_dictation_view(request):
     """
     Corrige une dictée soumise de façon pédagogique (alignement intelligent, feedback détaillé).
@@ -139,130 +180,256 @@ def correct_dictation_view(request):
         except (ValueError, TypeError) as e:
             return Response({'error': f'ID de dictée invalide: {dictation_id}'}, status=status.HTTP_400_BAD_REQUEST)
         
+        # Mode streaming : la réponse de Gemini est relayée en Server-Sent Events
+        if wants_event_stream(request):
+            return event_stream_response(stream_correct_dictation(user_text, dictation_id, request.user.id))
+
         # Correction pédagogique via le service
         try:
-            result = correct_dictation(user_text, dictation_id)
+            result = correct_dictation(user_text, dictation_id, request.user.id)
             return Response(result, status=status.HTTP_200_OK)
+        except RateLimitExceeded as e:
+            return rate_limited_response(e)
         except Exception as e:
             return Response({'error': f'Erreur lors de la correction: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     except Exception as e:
         return Response({'error': f'Erreur lors de la correction de la dictée: {str(e)}'}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+def validate_batch_correction(data):
+    """
+    Valide une demande de correction groupée.
+
+    Returns:
+        tuple: (dictation_id, user_texts, None) ou (None, None, message d'erreur)
+    """
+    dictation_id = data.get('dictation_id')
+    user_texts = data.get('user_texts')
+    if not dictation_id:
+        return None, None, 'ID de dictée manquant'
+    try:
+        dictation_id = int(dictation_id)
+    except (ValueError, TypeError):
+        return None, None, f'ID de dictée invalide: {dictation_id}'
+    if not isinstance(user_texts, list) or not user_texts:
+        return None, None, 'Aucune copie fournie'
+    if not all(isinstance(text, str) for text in user_texts):
+        return None, None, 'Les copies doivent être des textes'
+    if len(user_texts) > settings.BATCH_CORRECTION_MAX_ITEMS:
+        return None, None, f'Trop de copies (maximum {settings.BATCH_CORRECTION_MAX_ITEMS})'
+    return dictation_id, user_texts, None
+
+@api_view(['POST'])
+@renderer_classes(NDJSON_RENDERER_CLASSES)
+def correct_dictation_batch_view(request):
+    """
+    Corrige en une requête les copies d'une classe pour une même dictée.
+    Les résultats sont renvoyés en NDJSON, une ligne par copie dès qu'elle est
+    corrigée, puis une ligne finale avec les identifiants des tentatives.
+    """
+    dictation_id, user_texts, error = validate_batch_correction(request.data)
+    if error:
+        return Response({'error': error}, status=status.HTTP_400_BAD_REQUEST)
+    if not Dictation.objects.filter(id=dictation_id).exists():
+        return Response({'error': 'Dictée introuvable'}, status=status.HTTP_404_NOT_FOUND)
+    from .batch import correct_dictation_batch
+    return ndjson_response(correct_dictation_batch(dictation_id, user_texts))
+
+def rate_limited_response(error):
+    """Réponse 429 renvoyée quand le régulateur refuse un appel au LLM."""
+    return Response(
+        {'error': str(error)},
+        status=status.HTTP_429_TOO_MANY_REQUESTS,
+        headers={'Retry-After': error.retry_after_header}
+    )
+
+# Correspondance entre les états Celery et les statuts exposés au client
+JOB_STATUSES = {
+    'PENDING': 'pending',
+    'RETRY': 'pending',
+    'STARTED': 'running',
+    'PROGRESS': 'running',
+    'SUCCESS': 'done',
+    'FAILURE': 'failed',
+    'REVOKED': 'failed',
+}
+
 @api_view(['POST'])
+@renderer_classes(STREAMING_RENDERER_CLASSES)
 def generate_dictation_view(request):
+    """
+    Met en file la génération d'une dictée et retourne immédiatement l'identifiant du job.
+    Le résultat est ensuite consulté via generate_dictation_status_view.
+    """
     if request.method == 'POST':
         try:
             data = json.loads(request.body)
-            result = generate_dictation(data)
-            return JsonResponse(result)
+            # Une dictée pré-générée correspondant aux paramètres est servie immédiatement
+            if settings.DICTATION_POOL_ENABLED:
+                pooled = claim_pooled_dictation(data)
+                if pooled is not None:
+                    if wants_event_stream(request):
+                        return event_stream_response([('result', pooled)])
+                    return JsonResponse({'status': 'done', 'progress': 100, 'result': pooled})
+            # Mode streaming : génération en direct, relayée en Server-Sent Events
+            if wants_event_stream(request):
+                return event_stream_response(stream_generate_dictation(data))
+            job_id = enqueue_generation(data)
+            return JsonResponse({
+                'job_id': job_id,
+                'status': 'pending',
+                'status_url': reverse('generate-dictation-status', args=[job_id])
+            }, status=202)
         except Exception as e:
             return JsonResponse({'error': str(e)}, status=500)
     return JsonResponse({'error': 'Méthode non autorisée'}, status=405)
 
+@api_view(['GET'])
+def generate_dictation_status_view(request, job_id):
+    """
+    Retourne l'avancement d'une génération de dictée et, une fois terminée, la dictée générée.
+    """
+    job = AsyncResult(job_id)
+    payload = {
+        'job_id': job_id,
+        'status': JOB_STATUSES.get(job.state, 'pending'),
+    }
+    if job.state == 'PROGRESS' and isinstance(job.info, dict):
+        payload['step'] = job.info.get('step')
+        payload['progress'] = job.info.get('progress')
+    elif job.state == 'SUCCESS':
+        result = job.result or {}
+        if 'error' in result:
+            payload['status'] = 'failed'
+            payload['error'] = result['error']
+        else:
+            payload['progress'] = 100
+            payload['result'] = result
+    elif job.state in ('FAILURE', 'REVOKED'):
+        payload['error'] = str(job.result)
+    return JsonResponse(payload)
+
+@api_view(['GET'])
+def dictation_pool_stats_view(request):
+    """Succès, défauts et stock disponible du pool de dictées, par compartiment."""
+    return Response(pool_metrics())
+
+@api_view(['GET'])
+def llm_governor_stats_view(request):
+    """Appels aux LLM autorisés, refusés et en cours, et temps d'attente, par modèle."""
+    return Response(governor_metrics())
+
+@api_view(['GET'])
+def llm_provider_stats_view(request):
+    """
+    Latences (p50, p95, p99), appels, doubles envoyés et gagnés et état du
+    coupe-circuit de chaque fournisseur de LLM, pour le processus qui répond.
+    """
+    return Response(provider_stats())
+
+@api_view(['GET'])
+def llm_parse_stats_view(request):
+    """Réponses JSON des LLM valides du premier coup, réparées et inexploitables, par type."""
+    return Response(parse_metrics())
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def user_progress_view(request):
+    """
+    Progression de l'utilisateur connecté, lue depuis les agrégats maintenus à
+    chaque tentative : profil, erreurs par catégorie et dictées récemment
+    travaillées (?limit=, 20 par défaut). Trois requêtes, quel que soit le
+    nombre de tentatives.
+    """
+    try:
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+    except ValueError:
+        return Response({'error': 'Le paramètre limit doit être un entier'}, status=status.HTTP_400_BAD_REQUEST)
+    profile = UserProfile.objects.filter(user=request.user).first() or UserProfile(user=request.user)
+    errors_by_category = (
+        UserErrorStat.objects.filter(user=request.user, count__gt=0)
+        .order_by('-count')
+        .values('category', 'count')
+    )
+    recent = (
+        UserProgress.objects.filter(user=request.user)
+        .select_related('dictation')
+        .only('dictation__title', 'best_score', 'attempts_count', 'last_attempt', 'is_mastered')
+        .order_by('-last_attempt')[:limit]
+    )
+    return Response({
+        'profile': UserProfileStatsSerializer(profile).data,
+        'errors_by_category': list(errors_by_category),
+        'dictations': UserProgressSerializer(recent, many=True).data,
+    })
+
 @api_view(['POST'])
 def process_image(request):
+    handler = install_image_upload_handler(request)
     try:
-        # Get base64 image from request
-        image_data = request.data.get('image')
-        if not image_data:
+        # Image envoyée en multipart (champ 'image') ou en base64 dans le JSON
+        image = load_request_image(request, handler, request.data)
+        if image is None:
             return Response({'error': 'No image data provided'}, status=400)
 
-        # Remove data URL prefix if present
-        if 'base64,' in image_data:
-            image_data = image_data.split('base64,')[1]
-
-        # Convert base64 to image
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(io.BytesIO(image_bytes))
+        from .ocr import extract_text_from_image
 
-        # Extract text from image using Tesseract OCR
-        extracted_text = pytesseract.image_to_string(image, lang='fra')
+        # OCR (prétraitement + Tesseract) dans le pool de processus, hors du thread de la requête
+        with image:
+            extracted_text, timings = extract_text_from_image(image.read_bytes())
 
         # Use OpenAI to correct the text
         corrected_text = correct_text_with_ai(extracted_text)
 
         return Response({
             'text': corrected_text,
-            'original_text': extracted_text
+            'original_text': extracted_text,
+            'timings': timings
         })
 
+    except ImageUploadError as e:
+        return Response({'error': str(e)}, status=e.status_code)
     except Exception as e:
         return Response({'error': str(e)}, status=500)
 
 def correct_text_with_ai(text):
+    """Corrige le texte issu de l'OCR avec OpenAI ; le texte brut est retourné en cas d'échec."""
     try:
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "Tu es un assistant spécialisé dans la correction de textes en français. Corrige les erreurs d'orthographe et de grammaire dans le texte suivant tout en conservant son sens original."},
-                {"role": "user", "content": text}
-            ]
-        )
-        return response.choices[0].message['content'].strip()
+        return get_provider('openai').generate_text(build_ocr_correction_payload(text)).strip()
     except Exception as e:
-        print(f"Error correcting text with AI: {str(e)}")
+        logger.error(f"Erreur lors de la correction du texte par OpenAI : {str(e)}")
         return text  # Return original text if AI correction fails
 
 @api_view(['POST'])
 def process_image_gemini(request):
+    handler = install_image_upload_handler(request)
     try:
-        # Get base64 image from request
-        image_data = request.data.get('image')
-        if not image_data:
+        # Image envoyée en multipart (champ 'image') ou en base64 dans le JSON
+        image = load_request_image(request, handler, request.data)
+        if image is None:
             return Response({'error': 'Aucune image fournie'}, status=400)
 
-        # Remove data URL prefix if present
-        if 'base64,' in image_data:
-            image_data = image_data.split('base64,')[1]
-
-        # Préparer le prompt
-        prompt = """Tu es un expert en reconnaissance de texte manuscrit en français.
-        Examine l'image fournie et extrait exactement le texte que tu y vois.
-        Retourne uniquement le texte extrait, sans commentaires ni formatage."""
-
-        # Préparer la requête pour l'API Gemini
-        api_url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent?key={settings.GEMINI_API_KEY}"
-        
-        payload = {
-            "contents": [{
-                "parts": [
-                    {"text": prompt},
-                    {
-                        "inline_data": {
-                            "mime_type": "image/jpeg",
-                            "data": image_data
-                        }
-                    }
-                ]
-            }]
-        }
+        with image:
+            image_bytes = image.read_bytes()
 
         try:
-            import requests
-            response = requests.post(
-                api_url,
-                json=payload,
-                headers={'Content-Type': 'application/json'}
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"Erreur Gemini API: {response.text}")
-                raise Exception(f"Erreur API: {response.status_code}")
-                
-            result = response.json()
-            text = result['candidates'][0]['content']['parts'][0]['text'].strip()
+            # Image redimensionnée et réencodée avant l'appel, extraction mise en cache
+            text = extract_handwriting(image_bytes)
             
             # Retourner le résultat
             return Response({
                 "texte_extrait": text
             })
             
+        except RateLimitExceeded as e:
+            return rate_limited_response(e)
         except Exception as e:
             logger.error(f"Erreur lors de l'analyse de l'image avec Gemini : {str(e)}")
             return Response({
                 'error': "Erreur lors de l'analyse de l'image. Veuillez réessayer."
             }, status=500)
 
+    except ImageUploadError as e:
+        return Response({'error': str(e)}, status=e.status_code)
     except Exception as e:
         logger.error(f"Erreur lors du traitement de l'image : {str(e)}")
         return Response({
@@ -1 +1,6 @@
- 
\ No newline at end of file
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'dictation_backend.settings')
+
+application = get_asgi_application()
\ No newline at end of file
@@ -152,13 +152,19 @@ CORS_ALLOW_HEADERS = [
 CORS_ORIGIN_ALLOW_ALL = True  # Temporairement pour le développement
 CORS_ALLOW_ALL_ORIGINS = True  # Temporairement pour le développement
 
+# Redis (broker Celery et caches applicatifs)
+REDIS_URL = env('REDIS_URL', default='redis://localhost:6379/0')
+REDIS_SOCKET_TIMEOUT = env.float('REDIS_SOCKET_TIMEOUT', default=2.0)
+
 # Celery settings
-CELERY_BROKER_URL = env('REDIS_URL', default='redis://localhost:6379/0')
-CELERY_RESULT_BACKEND = env('REDIS_URL', default='redis://localhost:6379/0')
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
 CELERY_TIMEZONE = TIME_ZONE
+CELERY_TASK_TRACK_STARTED = True
+CELERY_RESULT_EXPIRES = timedelta(hours=1)
 
 # Media files
 MEDIA_URL = '/media/'
@@ -202,6 +208,133 @@ LOGGING = {
 
 # Gemini API settings
 GEMINI_API_KEY = env('GEMINI_API_KEY', default='')
+GEMINI_API_BASE_URL = env('GEMINI_API_BASE_URL', default='https://generativelanguage.googleapis.com/v1beta')
+GEMINI_MODEL = env('GEMINI_MODEL', default='gemini-2.0-flash')
+GEMINI_CONNECT_TIMEOUT = env.float('GEMINI_CONNECT_TIMEOUT', default=5.0)
+GEMINI_READ_TIMEOUT = env.float('GEMINI_READ_TIMEOUT', default=60.0)
+GEMINI_MAX_RETRIES = env.int('GEMINI_MAX_RETRIES', default=3)
+GEMINI_RETRY_BACKOFF = env.float('GEMINI_RETRY_BACKOFF', default=0.5)  # secondes
+GEMINI_RETRY_MAX_BACKOFF = env.float('GEMINI_RETRY_MAX_BACKOFF', default=8.0)
+GEMINI_POOL_MAXSIZE = env.int('GEMINI_POOL_MAXSIZE', default=10)
+# Plafond de maxOutputTokens, quel que soit le prompt (voir dictation/prompts.py)
+GEMINI_MAX_OUTPUT_TOKENS = env.int('GEMINI_MAX_OUTPUT_TOKENS', default=8192)
+# Appels simultanés maximum par processus ASGI (client httpx asynchrone)
+GEMINI_ASYNC_MAX_CONNECTIONS = env.int('GEMINI_ASYNC_MAX_CONNECTIONS', default=500)
+
+# OpenAI (fournisseur de repli et correction du texte issu de l'OCR)
+OPENAI_API_KEY = env('OPENAI_API_KEY', default='')
+OPENAI_MODEL = env('OPENAI_MODEL', default='gpt-3.5-turbo')
+
+# Fournisseurs de LLM de la correction et de la génération, par ordre de préférence
+# (voir dictation/providers.py) ; ceux dont la clé API est absente sont ignorés
+LLM_PROVIDERS = env.list('LLM_PROVIDERS', default=['gemini', 'openai'])
+# Double envoyé quand l'appel dépasse le percentile LLM_HEDGE_PERCENTILE des latences récentes
+LLM_HEDGING_ENABLED = env.bool('LLM_HEDGING_ENABLED', default=True)
+LLM_HEDGE_PERCENTILE = env.float('LLM_HEDGE_PERCENTILE', default=95.0)
+LLM_HEDGE_MIN_SAMPLES = env.int('LLM_HEDGE_MIN_SAMPLES', default=20)
+# Délai utilisé tant que les latences mesurées sont trop peu nombreuses
+LLM_HEDGE_DEFAULT_DELAY = env.float('LLM_HEDGE_DEFAULT_DELAY', default=8.0)  # secondes
+LLM_HEDGE_MIN_DELAY = env.float('LLM_HEDGE_MIN_DELAY', default=0.5)  # secondes
+# Doubles en cours au plus par processus : au-delà, la requête attend le premier appel seul
+LLM_HEDGE_MAX_IN_FLIGHT = env.int('LLM_HEDGE_MAX_IN_FLIGHT', default=8)
+LLM_LATENCY_WINDOW = env.int('LLM_LATENCY_WINDOW', default=200)
+# Coupe-circuit : fournisseur écarté après ce nombre d'échecs consécutifs, essai toutes les LLM_BREAKER_RESET secondes
+LLM_BREAKER_FAILURES = env.int('LLM_BREAKER_FAILURES', default=5)
+LLM_BREAKER_RESET = env.float('LLM_BREAKER_RESET', default=30.0)
+
+# Régulation des appels aux LLM partagée par tous les workers (Redis)
+LLM_GOVERNOR_ENABLED = env.bool('LLM_GOVERNOR_ENABLED', default=True)
+LLM_GOVERNOR_RATE = env.float('LLM_GOVERNOR_RATE', default=5.0)  # appels par seconde
+LLM_GOVERNOR_BURST = env.int('LLM_GOVERNOR_BURST', default=20)
+LLM_GOVERNOR_MAX_IN_FLIGHT = env.int('LLM_GOVERNOR_MAX_IN_FLIGHT', default=16)
+# Limites propres à un fournisseur ou à un modèle, ex. {"gemini:gemini-2.0-flash": {"rate": 30}}
+LLM_GOVERNOR_LIMITS = env.json('LLM_GOVERNOR_LIMITS', default={})
+# 'wait' : attendre son tour jusqu'à LLM_GOVERNOR_MAX_WAIT secondes ; 'fail_fast' : refuser aussitôt
+LLM_GOVERNOR_MODE = env('LLM_GOVERNOR_MODE', default='wait')
+LLM_GOVERNOR_MAX_WAIT = env.float('LLM_GOVERNOR_MAX_WAIT', default=10.0)
+# Durée au-delà de laquelle la place d'un appel non libérée (worker tué) est récupérée
+LLM_GOVERNOR_LEASE = env.float('LLM_GOVERNOR_LEASE', default=GEMINI_READ_TIMEOUT + 30)
+
+# Regroupement des appels identiques en cours (single-flight, voir dictation/singleflight.py)
+SINGLEFLIGHT_ENABLED = env.bool('SINGLEFLIGHT_ENABLED', default=True)
+# Durée maximale d'attente du résultat d'un appel identique avant d'appeler soi-même
+SINGLEFLIGHT_MAX_WAIT = env.float('SINGLEFLIGHT_MAX_WAIT', default=GEMINI_READ_TIMEOUT + LLM_GOVERNOR_MAX_WAIT)
+# Bail du verrou : récupéré si le worker qui appelle est tué
+SINGLEFLIGHT_LOCK_TTL = env.float('SINGLEFLIGHT_LOCK_TTL', default=GEMINI_READ_TIMEOUT + 30)
+SINGLEFLIGHT_RESULT_TTL = env.float('SINGLEFLIGHT_RESULT_TTL', default=30.0)  # secondes
+# Une génération identique demandée pendant qu'un job est en cours reçoit ce job ;
+# l'association est levée à la fin du job, ou au plus tard après ce délai
+SINGLEFLIGHT_JOB_TTL = env.int('SINGLEFLIGHT_JOB_TTL', default=300)  # secondes
+
+# Sert les endpoints LLM par des vues asynchrones (déploiement ASGI / uvicorn)
+DICTATION_ASYNC_VIEWS = env.bool('DICTATION_ASYNC_VIEWS', default=True)
+
+# Cache des corrections (clé : textes nettoyés de la dictée et de l'élève)
+CORRECTION_CACHE_TTL = env.int('CORRECTION_CACHE_TTL', default=7 * 24 * 3600)  # secondes
+CORRECTION_CACHE_MAX_ENTRIES = env.int('CORRECTION_CACHE_MAX_ENTRIES', default=10000)
+
+# Cache des réponses GET des dictées publiques (invalidé à chaque modification)
+RESPONSE_CACHE_TTL = env.int('RESPONSE_CACHE_TTL', default=3600)  # secondes
+
+# Synthèse vocale (gTTS) : phrases synthétisées en parallèle et mises en cache
+TTS_MAX_WORKERS = env.int('TTS_MAX_WORKERS', default=4)
+TTS_SEGMENT_CACHE_TTL = env.int('TTS_SEGMENT_CACHE_TTL', default=30 * 24 * 3600)  # secondes
+# Segments MP3 (quelques dizaines de Ko) gardés au plus dans Redis, évincés LRU
+TTS_SEGMENT_CACHE_MAX_ENTRIES = env.int('TTS_SEGMENT_CACHE_MAX_ENTRIES', default=2000)
+
+# Photos envoyées par le front : taille maximale et seuil de passage sur disque
+IMAGE_UPLOAD_MAX_BYTES = env.int('IMAGE_UPLOAD_MAX_BYTES', default=10 * 1024 * 1024)
+IMAGE_UPLOAD_SPOOL_SIZE = env.int('IMAGE_UPLOAD_SPOOL_SIZE', default=1024 * 1024)
+
+# Images envoyées à Gemini : redimensionnées et réencodées avant l'appel
+VISION_IMAGE_MAX_EDGE = env.int('VISION_IMAGE_MAX_EDGE', default=1600)  # pixels
+VISION_IMAGE_FORMAT = env('VISION_IMAGE_FORMAT', default='JPEG')  # JPEG ou WEBP
+VISION_IMAGE_QUALITY = env.int('VISION_IMAGE_QUALITY', default=80)
+# Texte extrait mis en cache par image normalisée (dHash de VISION_HASH_SIZE² bits et SHA-256 des octets)
+VISION_HASH_SIZE = env.int('VISION_HASH_SIZE', default=16)
+VISION_CACHE_TTL = env.int('VISION_CACHE_TTL', default=7 * 24 * 3600)  # secondes
+
+# OCR Tesseract : pool de processus et prétraitement des photos
+OCR_MAX_WORKERS = env.int('OCR_MAX_WORKERS', default=2)
+OCR_MAX_DIMENSION = env.int('OCR_MAX_DIMENSION', default=2000)  # pixels, plus grand côté
+OCR_TIMEOUT = env.float('OCR_TIMEOUT', default=30.0)  # secondes
+OCR_LANG = env('OCR_LANG', default='fra')
+
+# Conserver en base la réponse enrichie de Gemini (champ Dictation.metadata)
+DICTATION_STORE_METADATA = env.bool('DICTATION_STORE_METADATA', default=True)
+
+# Pool de dictées pré-générées par compartiment (niveau, longueur, type de contenu, sujet)
+DICTATION_POOL_ENABLED = env.bool('DICTATION_POOL_ENABLED', default=True)
+DICTATION_POOL_LOW_WATERMARK = env.int('DICTATION_POOL_LOW_WATERMARK', default=2)
+DICTATION_POOL_TARGET_SIZE = env.int('DICTATION_POOL_TARGET_SIZE', default=5)
+DICTATION_POOL_REFILL_INTERVAL = env.int('DICTATION_POOL_REFILL_INTERVAL', default=300)  # secondes
+DICTATION_POOL_MIN_MISSES = env.int('DICTATION_POOL_MIN_MISSES', default=3)
+DICTATION_POOL_MAX_LEARNED_BUCKETS = env.int('DICTATION_POOL_MAX_LEARNED_BUCKETS', default=10)
+DICTATION_POOL_BUCKETS = env.json('DICTATION_POOL_BUCKETS', default=[
+    {'niveau': 'facile', 'longueurTexte': 'court', 'typeContenu': 'narratif'},
+    {'niveau': 'moyen', 'longueurTexte': 'moyenne', 'typeContenu': 'narratif'},
+    {'niveau': 'difficile', 'longueurTexte': 'long', 'typeContenu': 'narratif'},
+])
+CELERY_BEAT_SCHEDULE = {
+    'refill-dictation-pool': {
+        'task': 'dictation.tasks.refill_dictation_pool',
+        'schedule': DICTATION_POOL_REFILL_INTERVAL,
+    },
+}
+
+# Nombre maximal d'erreurs pour qu'une copie soit corrigée localement, sans LLM
+LOCAL_CORRECTION_MAX_ERRORS = env.int('LOCAL_CORRECTION_MAX_ERRORS', default=3)
+
+# Meilleur score à partir duquel une dictée est considérée comme maîtrisée par un utilisateur
+DICTATION_MASTERY_SCORE = env.float('DICTATION_MASTERY_SCORE', default=90)
+
+# Correction groupée des copies d'une classe
+BATCH_CORRECTION_MAX_ITEMS = env.int('BATCH_CORRECTION_MAX_ITEMS', default=60)
+BATCH_CORRECTION_MAX_WORKERS = env.int('BATCH_CORRECTION_MAX_WORKERS', default=4)
+# Copies regroupées dans un même prompt (1 désactive le regroupement)
+BATCH_CORRECTION_PACK_SIZE = env.int('BATCH_CORRECTION_PACK_SIZE', default=5)
+# Budget estimé de tokens en entrée d'un prompt groupé
+BATCH_CORRECTION_PACK_MAX_TOKENS = env.int('BATCH_CORRECTION_PACK_MAX_TOKENS', default=4000)
 
 # User model
 AUTH_USER_MODEL = 'auth.User'
\ No newline at end of file
@@ -7,8 +7,3 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('dictation.urls'))  # Les URLs de l'app dictation sont sous /api/
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-
-# Pour le débogage
-print("URLs principales:")
-for url in urlpatterns:
-    print(f"- {url.pattern}")
\ No newline at end of file